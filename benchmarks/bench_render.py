@@ -0,0 +1,76 @@
+"""Payload and render time of the plots per render mode and format.
+
+    PYTHONPATH=src python benchmarks/bench_render.py [n_files]
+
+With the "graph" format the figures are rendered by plotly.js in the
+browser. The render time is measured with kaleido, which runs plotly.js
+in a headless browser, as a proxy. With the "svg" format the same
+rendering happens once on the server, repeated figures come from the
+cache. The payload does not include plotly.js itself (about 3.6 MB),
+which the browser only loads for the "graph" format.
+"""
+
+import sys
+import time
+import handprofil.app as app
+from handprofil.datasets import DEFAULT_DATASET
+from plotly.io.json import to_json_plotly
+from synthetic import synthetic_values
+
+
+def return_figures(plot_input, section_config: list, render_mode: str) -> list:
+    if render_mode == "batched":
+        return [app.return_batched_figure(
+            plot_input, [section["title"] for section in section_config])]
+    return [
+        app.return_section_figure(plot_input, section_id)
+        for section_id in sorted(plot_input["section_id"].dropna().unique())
+    ]
+
+
+def wrap_figures(figures: list, plot_format: str) -> tuple:
+    app.plot_format = plot_format
+    start = time.perf_counter()
+    children = [app.wrap_figure_in_graph(None, figure) for figure in figures]
+    return children, time.perf_counter() - start
+
+
+def main(n_files: int):
+    static_store = app.load_static_data(None)
+    section_config = static_store["section_config"]
+    upload_store = [{"data": data.to_dict()} for data in synthetic_values(n_files)]
+    decile_data_store = app.compute_binned_values(
+        upload_store, "m", "gemischt", True, DEFAULT_DATASET)
+    plot_data_store = app.get_plot_input_data(decile_data_store, static_store)
+    plot_input = app.prepare_plot_input(plot_data_store, section_config)
+
+    # Start the headless browser before measuring
+    app.pio.to_image({}, format="svg")
+
+    print(f"Files: {n_files}")
+    for render_mode in ["sections", "batched"]:
+        start = time.perf_counter()
+        figures = return_figures(plot_input, section_config, render_mode)
+        build_time = time.perf_counter() - start
+        n_traces = sum(len(figure.data) for figure in figures)
+        print(f"{render_mode}: {len(figures)} figures, {n_traces} traces,"
+              f" build {1000 * build_time:.1f} ms")
+
+        children, _ = wrap_figures(figures, "graph")
+        start = time.perf_counter()
+        for figure in figures:
+            app.pio.to_image(figure, format="svg")
+        client_time = time.perf_counter() - start
+        print(f"  graph  payload: {len(to_json_plotly(children)) / 1024:7.1f} kB"
+              f"  render (client): {1000 * client_time:6.1f} ms")
+
+        app.svg_cache.clear()
+        children, server_time = wrap_figures(figures, "svg")
+        _, cached_time = wrap_figures(figures, "svg")
+        print(f"  svg    payload: {len(to_json_plotly(children)) / 1024:7.1f} kB"
+              f"  render (server): {1000 * server_time:6.1f} ms"
+              f"  cached: {1000 * cached_time:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
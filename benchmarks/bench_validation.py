@@ -0,0 +1,56 @@
+"""Cost of the schema validation compared to reading the workbooks.
+
+    PYTHONPATH=src python benchmarks/bench_validation.py [n_workbooks]
+"""
+
+import io
+import sys
+import time
+import pandas as pd
+from handprofil.schemas import get_workbook_schemas, validate_workbook, validate_workbooks
+from synthetic import synthetic_workbooks
+
+
+def read_sheets(content: bytes) -> tuple:
+    with pd.ExcelFile(io.BytesIO(content), engine="openpyxl") as workbook:
+        info = workbook.parse(
+            sheet_name=0, header=0, nrows=9,
+            names=["id", "description", "value"], usecols=[0, 1, 3],
+            dtype={"description": str}
+        ).dropna()
+        data = workbook.parse(
+            sheet_name=1, header=0, usecols=[0, 1, 2, 4, 5],
+            names=["id", "device", "description", "left", "right"],
+            dtype={"device": str, "description": str}
+        )
+    return info, data
+
+
+def main(n_workbooks: int):
+    workbooks = synthetic_workbooks(n_workbooks)
+    # Schemas are built once per process
+    get_workbook_schemas()
+
+    start = time.perf_counter()
+    sheets = [read_sheets(content) for _, content in workbooks]
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [validate_workbook(info, data) for info, data in sheets]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = validate_workbooks(sheets)
+    batch_time = time.perf_counter() - start
+
+    assert all(not errors for _, _, errors in single + batch)
+
+    print(f"Workbooks:             {n_workbooks}")
+    print(f"Parsing:               {1000 * parse_time / n_workbooks:8.2f} ms per workbook")
+    print(f"Validation (single):   {1000 * single_time / n_workbooks:8.2f} ms per workbook"
+          f" ({100 * single_time / parse_time:.1f} % of parsing)")
+    print(f"Validation (one pass): {1000 * batch_time / n_workbooks:8.2f} ms per workbook"
+          f" ({100 * batch_time / parse_time:.1f} % of parsing)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
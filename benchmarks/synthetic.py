@@ -0,0 +1,74 @@
+"""Synthetic measurements for benchmarks.
+
+Values are drawn around the median of the background data, so they
+cover the same ranges as real measurements.
+
+Run benchmarks from the repository root, e.g.
+    PYTHONPATH=src python benchmarks/bench_validation.py
+"""
+
+import io
+import numpy as np
+import openpyxl
+import pandas as pd
+from handprofil.static_data import read_static_config
+from handprofil.utils import get_absolute_path
+
+TEMPLATE_PATH = "src/handprofil/download/measurement_template.xlsx"
+
+
+def synthetic_values(n_subjects: int, seed: int = 0) -> list:
+    """Return data frames like the data sheet of a parsed workbook."""
+    rng = np.random.default_rng(seed)
+    static_config = read_static_config()
+    labels = static_config["measure_labels"]
+    background = static_config["background_data"]
+
+    grouped = background.groupby("id")["value"]
+    spread = pd.DataFrame({
+        "median": grouped.median(),
+        # Robust against strata with differently scaled values
+        "std": (grouped.quantile(0.75) - grouped.quantile(0.25)) / 1.35,
+    })\
+        .reindex(labels["id"])\
+        .fillna({"median": 50.0, "std": 5.0})
+    lower = np.where(labels["unit"] == "Grad", -np.inf, 0.0)
+
+    subjects = []
+    for _ in range(n_subjects):
+        data = labels[["id", "device", "description"]].copy()
+        for hand in ["left", "right"]:
+            values = rng.normal(spread["median"], spread["std"].clip(lower=0.1))
+            data[hand] = np.round(np.maximum(values, lower), 1)
+        subjects.append(data)
+    return subjects
+
+
+def synthetic_workbooks(n_subjects: int, seed: int = 0) -> list:
+    """Return (filename, xlsx bytes) of filled measurement templates."""
+    workbook = openpyxl.load_workbook(get_absolute_path(TEMPLATE_PATH))
+    info, sheet = workbook.worksheets[0], workbook.worksheets[1]
+    row_of_id = {
+        row[0].value: row[0].row for row in sheet.iter_rows(min_row=2) if row[0].value is not None
+    }
+
+    workbooks = []
+    for i, data in enumerate(synthetic_values(n_subjects, seed)):
+        info["D2"] = f"S{i:05d}"
+        info["D3"] = pd.Timestamp("2024-02-12").to_pydatetime()
+        info["D4"] = "Muster"
+        info["D5"] = "Max"
+        info["D6"] = pd.Timestamp("2000-01-01").to_pydatetime()
+        info["D7"] = "M"
+        info["D8"] = "R"
+        info["D9"] = "Violine"
+        for row in data.itertuples():
+            info_row = row_of_id.get(row.id)
+            if info_row is not None:
+                sheet.cell(row=info_row, column=5, value=row.left)
+                sheet.cell(row=info_row, column=6, value=row.right)
+
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        workbooks.append((f"synthetic_{i:05d}.xlsx", buffer.getvalue()))
+    return workbooks
@@ -0,0 +1,36 @@
+"""Gunicorn settings of the production server:
+    gunicorn handprofil.app:server
+
+Requests are served by threads sharing the norms, the static config and
+the figure caches of their process (gthread), so a few processes with
+many threads serve more sessions per memory than sync workers. Each
+worker warms up in the background after it has started, /ready answers
+503 until then.
+"""
+
+import os
+import threading
+
+bind = os.getenv("HANDPROFIL_BIND", "0.0.0.0:8000")
+
+worker_class = "gthread"
+workers = int(os.getenv("HANDPROFIL_WEB_WORKERS", 2))
+threads = int(os.getenv("HANDPROFIL_WEB_THREADS", 8))
+
+# Bulk scoring and reports stream for a while
+timeout = int(os.getenv("HANDPROFIL_WEB_TIMEOUT", 300))
+
+
+def post_worker_init(worker):
+    from handprofil.app import warm_up
+
+    def run():
+        try:
+            seconds = warm_up()
+        except Exception:
+            # /ready stays 503, the worker is not taken into service
+            worker.log.exception("Warm-up of worker %s failed", worker.pid)
+            return
+        worker.log.info("Worker %s warmed up in %.1f s", worker.pid, seconds)
+
+    threading.Thread(target=run, daemon=True).start()
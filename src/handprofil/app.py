@@ -3,21 +3,53 @@
 ###################
 
 import base64
-from pathlib import Path
-import plotly.graph_objects as go
 import io
 import json
-from dash import Dash, html, dcc, callback, Output, Input, State, ALL
-import numpy as np
+import logging
+import threading
+import time
+from dash import Dash, html, dcc, callback, clientside_callback, ctx, no_update, Output, Input, State, ALL, ClientsideFunction, Patch
 import pandas as pd
 import dash_mantine_components as dmc
 import os
+import tempfile
+from contextlib import closing
 from dash.exceptions import PreventUpdate
 from dash_iconify import DashIconify
 import dash_auth
-import plotly.express as px
-from datetime import datetime
+import plotly.io as pio
+from urllib.parse import parse_qs, unquote, urlencode
 from dotenv import load_dotenv, find_dotenv
+from flask import Response, abort, request, stream_with_context
+from handprofil.utils import get_absolute_path, json_default
+from handprofil.cache import LRUCache, cache_key
+from handprofil.plots import (
+    format_date,
+    global_colors,
+    prepare_plot_input,
+    return_subject_lines,
+    return_section_figure,
+    return_batched_figure,
+    return_cohort_section_figure,
+    return_instrument_matrix_figure,
+)
+from handprofil.static_data import read_static_config
+from handprofil.scoring import (
+    read_workbooks,
+    score_modes,
+)
+from handprofil.cube import ALL_AGES
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.bulk import score_zip_stream, iter_zip_entries
+from handprofil.devices import read_device_export
+from handprofil.cohort import collect_cohort, store_cohort, load_cohort, cohort_decile_counts
+from handprofil.uploads import spool_stream, store_upload, take_upload
+from handprofil.reports import write_reports_zip
+from handprofil.exports import iter_csv, iter_rows, iter_xlsx, write_csv, write_xlsx
+from handprofil.prefill import WorkbookTemplate, iter_workbooks, read_participants, write_zip
+from handprofil.profiles import find_similar
+from handprofil import archive
+from handprofil.snapshots import store_snapshot, load_snapshot
 
 
 ###################
@@ -25,7 +57,9 @@ from dotenv import load_dotenv, find_dotenv
 ###################
 
 plot_style_data = [
-    {"value": "decile", "label": "Dezile"}
+    {"value": "decile", "label": "Dezile"},
+    {"value": "percentile", "label": "Perzentile (interpoliert)"},
+    {"value": "zscore", "label": "z-Werte (geschätzt)"},
 ]
 
 instrument_data = [
@@ -58,6 +92,11 @@ sex_data = [
     ["w", "Weiblich"],
 ]
 
+render_mode_data = [
+    ["sections", "Eine Grafik pro Abschnitt"],
+    ["batched", "Alle Abschnitte in einer Grafik"],
+]
+
 hand_data = [
     {
         "value": "left",
@@ -73,14 +112,6 @@ hand_data = [
 ### Styles ########
 ###################
 
-global_colors = [
-    "blue",
-    "red",
-    "violet",
-    "orange"
-    "lime",
-]
-
 container_style = {
     "border": f"1px solid black",
     "borderRadius": 8,
@@ -90,233 +121,108 @@ container_style = {
 }
 
 ###################
-##### Utils #######
+# Methods #########
 ###################
 
 
-def get_absolute_path(relative_path):
-    directory_path = os.path.dirname(os.path.abspath(__file__))
-    src_path = Path(directory_path).parents[1]
-    return os.path.join(src_path, relative_path)
+def parse_all_contents(list_of_contents: list, list_of_filenames: list) -> list:
+    """Parse base64 encoded uploads, validating all workbooks in one pass."""
+    results = [None] * len(list_of_contents)
 
-# To avoid typechecking error https://github.com/microsoft/pylance-release/issues/5631
+    sources = []
+    positions = []
+    for i, (contents, filename) in enumerate(zip(list_of_contents, list_of_filenames)):
+        content_type, content_string = contents.split(",")
 
+        if content_type != 'data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64':
+            results[i] = (
+                False, "Ungültiges Dateiformat. Unterstützt werden Dateien im .xslx Format")
+            continue
 
-def my_concat(dfs_list, axis=0): return pd.concat(dfs_list, axis=axis)
+        decoded = base64.b64decode(content_string)
+        sources.append((io.BytesIO(decoded), filename))
+        positions.append(i)
 
-###################
-# Methods #########
-###################
+    for i, result in zip(positions, read_workbooks(sources)):
+        results[i] = result
+
+    return results
+
+
+def parse_contents(contents, filename) -> dict:
+    return parse_all_contents([contents], [filename])[0]
 
 
-def return_wagner_decile(bin_edges: list, value: float) -> int:
-    """Return custom decile bin.
+def snapshot_value(snapshot: dict, key: str, **inputs):
+    """Value of a restored snapshot if it was computed from `inputs`.
 
-    Returns bin position of value with respect to
-    bin_edges. If value is equal to one of the bin
-    edges, this is also a bin. Below the mapping between
-    bins and edges (with monospace font):
-    Edges:   1   2   3   4   5     6     7     8     9
-    Bins:  1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19
+    Returns None if there is no snapshot or any input has changed
+    since, then the value is computed as usual.
     """
-    #   1   2   3   4   5     6     7     8     9
-    # 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19
-
-    # assert len(bin_edges) == 9
-
-    bin = 1
-    for i, edge in enumerate(bin_edges):
-        if value < edge:
-            break
-        if value == edge:
-            bin = bin + 1
-            break
-        else:
-            bin = bin + 2
-    return bin
+    if not snapshot or any(snapshot.get(name) != value for name, value in inputs.items()):
+        return None
+    return snapshot.get(key)
 
 
-def parse_contents(contents, filename) -> dict:
-    content_type, content_string = contents.split(",")
+def assign_keys(items: list, store_state: list = None) -> list:
+    """Give items without a key the next free keys of the upload store.
 
-    if content_type != 'data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64':
-        return False, "Ungültiges Dateiformat. Unterstützt werden Dateien im .xslx Format"
+    The key identifies the card and the color of a file, independent of
+    its position, see `display_upload_store_content`.
+    """
+    used = [item["key"] for item in (store_state or []) + items if "key" in item]
+    next_key = max(used, default=-1) + 1
 
-    decoded = base64.b64decode(content_string)
-    try:
-        info = pd.read_excel(
-            io.BytesIO(decoded),
-            sheet_name=0,
-            header=0,
-            nrows=9,
-            names=["id", "description", "value"],
-            usecols=[0, 1, 3],
-            dtype={
-                "id": np.int64,
-                "description": str,
-            }
-        )\
-            .dropna()
-
-        data = pd.read_excel(
-            io.BytesIO(decoded),
-            sheet_name=1,
-            header=0,
-            usecols=[0, 1, 2, 4, 5],
-            names=["id", "device", "description", "left", "right"],
-            dtype={
-                "id": np.int64,
-                "device": str,
-                "description": str,
-                "left": np.float64,
-                "right": np.float64
-            }
-        )
-    except Exception as e:
-        return False, e
+    keyed = []
+    for item in items:
+        if "key" not in item:
+            item = {**item, "key": next_key}
+            next_key += 1
+        keyed.append(item)
+    return keyed
 
-    if len(data.dropna(subset=["left", "right"], how="all")) == 0:
-        return False, "Keine Messungen gefunden"
 
-    return True, {"info": info.to_dict(), "data": data.to_dict(), "filename": filename}
+def append_to_store(store_state: list, new_items: list) -> list:
+    return (store_state or []) + assign_keys(new_items, store_state)
 
 #######################
 # Plots ########*
 #######################
 
 
-def return_ticktext(plot_df):
-    return plot_df.apply(
-        lambda x: f"{f'{x.id:0.0f},':<5} {x.description} ({x.unit})", axis=1
-    )
-
+def return_figure_svg(figure) -> str:
+    """Render a figure to SVG on the server, identical figures only once."""
+    # Keys are sorted, the order of the layout properties may differ
+    key = cache_key("svg", json.loads(pio.to_json(figure)))
+    return svg_cache.get_or_build(
+        key, lambda: pio.to_image(figure, format="svg").decode())
 
-def return_trace(df: pd.DataFrame, color, linestyle, symbol):
-    return go.Scatter(
-        x=pd.Series(df.value),
-        y=pd.Series(df.section_position),
-        marker=dict(size=16, color=color, symbol=symbol),
-        mode="lines+markers",
-        line=go.scatter.Line(color=color, dash=linestyle, width=2),
-        connectgaps=True,
-    )
-
-
-def return_section_figure(df: pd.DataFrame, section_id: int):
-
-    df_per_section = df[df["section_id"] == section_id]
-
-    labelmargin = 200
-
-    fig = px.scatter()
-    ticktext = return_ticktext(
-        df_per_section[["id", "description", "unit", "section_position"]].drop_duplicates().sort_values(by="section_position").reset_index(drop=True))
-
-    fig.update_layout(
-        width=1000,
-        height=30 * len(ticktext) + 50,
-        xaxis=dict(
-            constrain="domain",
-            gridcolor="black",
-            linecolor="black",
-            linewidth=2,
-            minor=dict(dtick="L1", tick0="-0.5", gridcolor="black"),
-            mirror=False,
-            range=[0.5, 19.5],
-            showgrid=False,
-            showline=False,
-            showticklabels=True,
-            tickfont=dict(family="Arial", color="black", size=14),
-            ticks="outside",
-            tickvals=[2, 4, 6, 8, 10, 12, 14, 16, 18],
-            ticktext=["1", "2", "3", "4", "5", "6", "7", "8", "9"],
-            title="Dezil",
-            zeroline=False,
-        ),
-        yaxis=dict(
-            anchor="free",
-            constrain="domain",
-            gridcolor="black",
-            minor=dict(dtick="L1", tick0="-0.5", gridcolor="black"),
-            mirror=True,
-            range=[len(ticktext) - 0.5, -0.5],
-            scaleanchor="x",
-            scaleratio=1,
-            shift=-200,
-            showgrid=False,
-            showline=True,
-            showticklabels=True,
-            side="right",
-            title=None,
-            zeroline=False,
-        ),
-        autosize=False,
-        margin=dict(autoexpand=False, l=labelmargin, r=0, t=0, b=50),
-        showlegend=False,
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        hovermode=False,
-    )
 
-    fig.add_shape(
-        # Rectangle with reference to the plot
-        type="rect",
-        xref="x domain",
-        yref="y domain",
-        x0=0,
-        y0=0,
-        x1=1.0,
-        y1=1.0,
-        line=dict(
-            color="black",
-            width=1,
-        ),
-    )
-
-    fig.update_layout(
-        yaxis=dict(
-            tickfont=dict(family="Arial", color="black", size=14),
-            tickmode="array",
-            ticktext=ticktext,
-            tickvals=ticktext.index,
+def wrap_figure_in_graph(title: str, figure, graph_id=None):
+    if plot_format == "svg":
+        # The graphs are static anyway, skip plotly.js in the browser
+        svg = return_figure_svg(figure)
+        graph = html.Img(
+            src="data:image/svg+xml;base64," +
+            base64.b64encode(svg.encode()).decode(),
+            className="wait_time_graph",
+            style={"maxWidth": "100%"},
+        )
+    else:
+        graph = dcc.Graph(
+            **({"id": graph_id} if graph_id is not None else {}),
+            style={"height": "100%", "width": "100%"},
+            className="wait_time_graph",
+            config={
+                "staticPlot": True,
+                "editable": False,
+                "displayModeBar": False,
+            },
+            figure=figure,
         )
-    )
-
-    for file_id in df_per_section["file_id"].unique():
-        for hand in df_per_section["hand"].unique():
-            color = global_colors[file_id]
-            linestyle = "solid" if hand == "right" else "dash"
-            symbol = "circle" if hand == "right" else "diamond-open"
-
-            # Need double bracket in .loc[[]] to prevent getting series
-            in_df = df_per_section.query(
-                "hand ==  @hand & file_id == @file_id")
-
-            in_df = in_df\
-                .set_index("section_position", drop=False)\
-                .sort_index()
-
-            fig.add_trace(return_trace(in_df, color, linestyle, symbol))
-
-    return fig
-
 
-def wrap_figure_in_graph(title: str, figure):
     return html.Div(
-        [
-            dmc.Title(title, order=2),
-            dcc.Graph(
-                # id="_wait_time_graph",
-                style={"height": "100%", "width": "100%"},
-                className="wait_time_graph",
-                config={
-                    "staticPlot": True,
-                    "editable": False,
-                    "displayModeBar": False,
-                },
-                figure=figure,
-            )
-        ],
+        ([dmc.Title(title, order=2)] if title else []) + [graph],
         style={
             "page-break-before": "initial",
         }
@@ -373,6 +279,7 @@ external_stylesheets = [dmc.theme.DEFAULT_COLORS]
 app = Dash(__name__, external_stylesheets=external_stylesheets)
 print(f"Environment: {os.getenv('ENVIRONMENT')}")
 
+auth = None
 if os.getenv('ENVIRONMENT') == 'PRODUCTION':
     auth = dash_auth.BasicAuth(
         app,
@@ -382,16 +289,45 @@ if os.getenv('ENVIRONMENT') == 'PRODUCTION':
 # This is used by the production server
 server = app.server
 
+
+@server.before_request
+def require_authorization():
+    """BasicAuth only wraps the views registered before it, the routes
+    below are protected here. /ready stays open for the load balancer.
+    """
+    if auth is not None and request.path.startswith("/api/") and not auth.is_authorized():
+        return auth.login_request()
+
+# Section figures are built once per input and shared by all sessions
+# and threads, see gunicorn.conf.py
+figure_cache = LRUCache(maxsize=256)
+
+# "graph" renders figures in the browser, "svg" on the server
+plot_format = os.getenv("HANDPROFIL_PLOT_FORMAT", "graph")
+svg_cache = LRUCache(maxsize=256)
+
+# Hands are hidden in the browser, SVG figures have to be rebuilt
+hands_dependency = Input if plot_format == "svg" else State
+
+# Norms are loaded on first use, see handprofil.datasets
+norms_datasets = NormsDatasets()
+
+# Split once, only read by the callbacks
+workbook_template = WorkbookTemplate()
+
 # App layout
 app.layout = dmc.Container(
     [
         # Stores
         dcc.Store(id='upload-store', storage_type='memory'),
+        dcc.Store(id='upload-token-store', storage_type='memory'),
         dcc.Store(id='all-measurements', storage_type='memory'),
         dcc.Store(id='decile-data-store', storage_type='memory'),
         dcc.Store(id='plot-data-store', storage_type='memory'),
         dcc.Store(id='static-store', storage_type='session'),
+        dcc.Store(id='snapshot-store', storage_type='memory'),
         html.Div(children=[], id='static-store-initializer'),
+        dcc.Location(id='url', refresh=False),
         # Layout
         dmc.Header(height=60, children=[dmc.Center(
             dmc.Title("Handlabor", order=1))]),
@@ -405,14 +341,101 @@ app.layout = dmc.Container(
                             children=dmc.Button('Datei hochladen'),
                             multiple=True,
                         ),
+                        # Streams raw files to /api/upload, see assets/direct_upload.js
+                        html.Div(
+                            dmc.Button('Datei hochladen (direkt)',
+                                       variant="outline"),
+                            id="direct-upload",
+                            **{
+                                "data-upload-url": app.get_relative_path("/api/upload"),
+                                "data-upload-target": "upload-token-store",
+                                "data-upload-accept": ".xlsx,.csv",
+                            }
+                        ),
                         html.Div(
                             [
                                 dmc.Button("Vorlage herunterladen (.xlsx)",
                                            id="btn_image"),
                                 dcc.Download(id="download-xlsx"),
                             ]
-                        )
+                        ),
+                        # One pre-filled template per row, see handprofil.prefill
+                        html.Div(
+                            [
+                                dcc.Upload(
+                                    id="upload-participants",
+                                    children=dmc.Button("Vorlagen für Teilnehmerliste (.csv)",
+                                                        variant="subtle"),
+                                    accept=".csv",
+                                ),
+                                dcc.Download(id="download-prefilled"),
+                            ]
+                        ),
+                        html.Div(
+                            [
+                                dmc.Button("Berichte herunterladen (.pdf)",
+                                           id="btn-reports",
+                                           variant="outline"),
+                                dcc.Download(id="download-reports"),
+                            ]
+                        ),
+                        html.Div(
+                            [
+                                dmc.Button("Ergebnisse exportieren (.xlsx)",
+                                           id="btn-export-xlsx",
+                                           variant="outline"),
+                                dmc.Button("(.csv)",
+                                           id="btn-export-csv",
+                                           variant="subtle"),
+                                dcc.Download(id="download-export"),
+                            ]
+                        ),
+                        dmc.Button("Snapshot teilen", id="btn-snapshot",
+                                   variant="outline"),
                     ]),
+                dmc.Container(id="snapshot-link"),
+                dmc.Group(
+                    [
+                        dmc.TextInput(
+                            id="archive-subject",
+                            placeholder="ID",
+                            label="Archiv",
+                        ),
+                        dmc.Button("Verlauf laden", id="btn-archive-load",
+                                   variant="outline"),
+                        dmc.Button("Im Archiv speichern", id="btn-archive-store",
+                                   variant="outline"),
+                        # Streamed by /api/export, the archive may not fit in the page
+                        dmc.Anchor(
+                            dmc.Button("Archiv exportieren (.xlsx)", variant="subtle"),
+                            id="archive-export-link",
+                            href=app.get_relative_path("/api/export"),
+                        ),
+                    ],
+                    align="end",
+                    mt=10,
+                ),
+                dmc.Container(id="archive-messages"),
+                dcc.Store(id='similar-store', storage_type='memory'),
+                dmc.Group(
+                    [
+                        dmc.Select(
+                            label="Ähnliche Profile im Archiv zu",
+                            id="select-similar-file",
+                            data=[],
+                        ),
+                        dmc.NumberInput(
+                            label="Anzahl",
+                            id="similar-count",
+                            value=0,
+                            min=0,
+                            max=20,
+                        ),
+                    ],
+                    align="end",
+                    mt=10,
+                ),
+                dmc.Container(id="similar-messages"),
                 dmc.Container(id="upload-debug-container"),
                 dmc.Container(id="upload-error-messages"),
             ]),
@@ -443,7 +466,29 @@ app.layout = dmc.Container(
                             id="select-instrument",
                             value="gemischt",
                             data=instrument_data,
-                        )
+                        ),
+                        dmc.RadioGroup(
+                            [
+                                dmc.Radio(l, value=k)
+                                for k, l in render_mode_data
+                            ],
+                            id="radiogroup-render-mode",
+                            value="sections",
+                            label="Darstellung",
+                            size="sm",
+                        ),
+                        dmc.Select(
+                            label="Normdaten",
+                            id="select-norms",
+                            value=DEFAULT_DATASET,
+                            data=norms_datasets.names(),
+                        ),
+                        dmc.Select(
+                            label="Skala",
+                            id="select-score-mode",
+                            value="decile",
+                            data=plot_style_data,
+                        ),
                     ]),
                 dmc.Checkbox(
                     id="checkbox-background-hand", label="Fehlenden Hintergrund bei einer Hand durch andere Hand ersetzen.",
@@ -452,7 +497,63 @@ app.layout = dmc.Container(
                 ),
             ]
         ),
-        dmc.Container(id="all-plots", style=container_style)
+        dmc.Container(id="all-plots", style=container_style),
+        dmc.Container(
+            style=container_style,
+            children=[
+                # Only computed while it is open
+                dmc.Accordion(
+                    dmc.AccordionItem(
+                        [
+                            dmc.AccordionControl(
+                                dmc.Title("Vergleich aller Instrumente", order=2)),
+                            dmc.AccordionPanel([
+                                dmc.Text(
+                                    "Eine Messung mit den Normdaten jedes Instruments bewerten. "
+                                    "Ø ist der mittlere Abstand zum Median, je kleiner, "
+                                    "desto besser passt die Hand zum Instrument.",
+                                ),
+                                dmc.Select(
+                                    label="Messung",
+                                    id="select-comparison-file",
+                                    data=[],
+                                ),
+                                dmc.Container(id="comparison-plot"),
+                            ]),
+                        ],
+                        value="comparison",
+                    ),
+                    id="comparison-accordion",
+                    chevronPosition="left",
+                ),
+            ]
+        ),
+        dmc.Container(
+            style=container_style,
+            children=[
+                dmc.Title("Kohorte", order=2),
+                dmc.Text(
+                    "Viele Messungen (.xlsx oder .zip) gemeinsam auswerten. "
+                    "Angezeigt wird der Anteil der Messungen pro Dezil, "
+                    "eine neue Kohorte ersetzt die bisherige.",
+                ),
+                dcc.Store(id='cohort-store', storage_type='memory'),
+                # Streams files to /api/cohort, see assets/direct_upload.js
+                html.Div(
+                    dmc.Button('Kohorte hochladen', variant="outline"),
+                    id="cohort-upload",
+                    style={"marginTop": 10},
+                    **{
+                        "data-upload-url": app.get_relative_path("/api/cohort"),
+                        "data-upload-target": "cohort-store",
+                        "data-upload-accept": ".xlsx,.zip",
+                        "data-upload-mode": "multipart",
+                    }
+                ),
+                dmc.Container(id="cohort-error-messages"),
+                dmc.Container(id="cohort-plots"),
+            ]
+        ),
     ],
     fluid=True,
 )
@@ -467,57 +568,13 @@ app.layout = dmc.Container(
     Input('static-store-initializer', 'children')
 )
 def load_static_data(trigger):
-    measure_labels = pd.read_csv(
-        get_absolute_path(
-            "src/handprofil/config/attributes.csv"),
-        header=0,
-        dtype={
-            "id": np.int64,
-            "device": str,
-            "description": str,
-            "unit": str
-        }
-    ).to_dict()
-
-    info_labels = pd.read_csv(
-        get_absolute_path(
-            "src/handprofil/config/meta_attributes.csv"),
-        header=0,
-        dtype={
-            "id": np.int64,
-            "description": str,
-        }
-    ).to_dict()
-
-    background = pd.read_csv(
-        get_absolute_path(
-            "src/handprofil/config/background.csv"),
-        header=0,
-        dtype={
-            "instrument": str,
-            "sex": str,
-            "hand": str,
-            "id": np.int64,
-            "bin_edge": np.int64,
-            "value": np.float64
-        }
-    ).to_dict()
-
-    with open(
-        get_absolute_path(
-            "src/handprofil/config/plot_sections.json"), "r"
-    ) as file:
-        section_config = json.load(file)
-
-    # Check if all measure labels are present in section config
-    assert set(measure_labels['id'].values()) == set(
-        [index for item in section_config for index in item["index_order"]])
+    static_config = read_static_config()
 
+    # Norms stay on the server, see norms_datasets
     return {
-        "measure_labels": measure_labels,
-        "info_labels": info_labels,
-        "background_data": background,
-        "section_config": section_config
+        key: item.to_dict() if isinstance(item, pd.DataFrame) else item
+        for key, item in static_config.items()
+        if key != "background_data"
     }
 
 
@@ -527,7 +584,9 @@ def load_static_data(trigger):
     Input('radiogroup-sex', 'value'),
     Input('select-instrument', 'value'),
     Input('checkbox-background-hand', 'checked'),
-    State('static-store', 'data'),
+    Input('select-norms', 'value'),
+    State('snapshot-store', 'data'),
+    Input('select-score-mode', 'value'),
     prevent_initial_call=True,
 )
 def compute_binned_values(
@@ -535,248 +594,546 @@ def compute_binned_values(
     sex: str,
     instrument: str,
     checkbox_background_hand: bool,
-    static_store: dict
+    norms: str,
+    snapshot: dict = None,
+    score_mode: str = "decile",
 ):
     if upload_store is None:
         raise PreventUpdate
 
-    # Background is the same for all
-    background_data = pd.DataFrame.from_dict(static_store["background_data"])\
-        .astype({
-            "instrument": str,
-            "sex": str,
-            "hand": str,
-            "id": np.int64,
-            "bin_edge": np.int64,
-            "value": np.float64
-        })\
-        .pivot(index=["instrument", "sex", "id", "bin_edge"], columns="hand", values="value")
-
-    if checkbox_background_hand:
-        # Fill left or right hand background value if not available
-        background_data[["left", "right"]] = background_data[["left", "right"]]\
-            .bfill(axis=1).ffill(axis=1)
-
-    background_data = background_data.reset_index().melt(
-        id_vars=['id', 'instrument', 'sex', 'bin_edge'])
-
-    # Filter background
-    background_data = background_data.query(
-        'sex == @sex & instrument == @instrument')
-
-    background_data = background_data\
-        .set_index(["id", "hand", "bin_edge"])\
-        .sort_index()\
-        .dropna()
-
-    # Parse uploaded data
-    uploaded_data = [
-        pd.DataFrame.from_dict(item["data"]).astype({
-            "id": np.int64,
-            "left": np.float64,
-            "right": np.float64
-        }) for item in upload_store]
+    stored = snapshot_value(
+        snapshot,
+        "deciles",
+        upload=upload_store,
+        sex=sex,
+        instrument=instrument,
+        background_hand=checkbox_background_hand,
+        norms=norms,
+        score_mode=score_mode,
+    )
+    if stored is not None:
+        return stored
+
+    # Background is the same for all, only the age band differs
+    norms_cube = norms_datasets.get(norms)
+
+    # Archived measurements are only scored once per background and
+    # norms version, stored scores are the deciles of the default norms
+    uses_stored_scores = norms == DEFAULT_DATASET and score_mode == "decile"
+    archive_ids = [
+        item["archive_id"] for item in upload_store
+        if "archive_id" in item and uses_stored_scores
+    ]
+    stored_scores = {}
+    if archive_ids:
+        with closing(archive.connect()) as connection:
+            stored_scores = archive.load_scores(
+                connection, archive_ids, sex, instrument, checkbox_background_hand,
+                norms_cube.version)
 
     binned_data = []
-    for data in uploaded_data:
-        # Drop NaN values
-        # Keep as dataframe to allow index access in "apply"
-        data = data\
-            .melt(id_vars=["id"], value_vars=["left", "right"], var_name="hand")\
-            .set_index(["id", "hand"])\
-            .dropna()
-
-        # Only process IDs with available background
-        data = data.loc[background_data.unstack(
-            "bin_edge").index.intersection(data.index)]\
-            .sort_index()\
-
-        # Apply binning and assign to value
-        if not data.empty:
-            data["value"] = data.apply(
-                lambda row: return_wagner_decile(
-                    background_data.loc[row.name, "value"], row["value"]
-                ), axis=1
-            )
-
-        data = data.reset_index()
+    new_scores = {}
+    for item in upload_store:
+        archive_id = item.get("archive_id")
+        if archive_id in stored_scores:
+            data = pd.DataFrame.from_records(stored_scores[archive_id])
+        else:
+            data = norms_cube.score_measurement(
+                item, instrument, sex, checkbox_background_hand, score_mode)
+            if archive_id is not None and uses_stored_scores:
+                new_scores[archive_id] = data.to_dict(orient="records")
 
         # Reset index for json serialization
         binned_data.append(data.to_dict())
 
+    if new_scores:
+        with closing(archive.connect()) as connection:
+            archive.store_scores(
+                connection, new_scores, sex, instrument, checkbox_background_hand, norms_cube)
+
     return binned_data
 
 
 @callback(
     Output("plot-data-store", 'data'),
     Input('decile-data-store', 'data'),
-    Input({"type": 'chips-hand', "index": ALL}, 'value'),
     State('static-store', 'data'),
+    State('snapshot-store', 'data'),
+    State('upload-store', 'data'),
+    Input('similar-store', 'data'),
     prevent_initial_call=True
 )
 def get_plot_input_data(
     decile_data_store: str,
-    hands_shown_values: list,
-    static_store: dict
+    static_store: dict,
+    snapshot: dict = None,
+    upload_store: list = None,
+    similar_store: list = None,
 ):
+    """Deciles of all hands with attribute labels.
+
+    Deselected hands are hidden in the browser, see `show_hands`. Files
+    are colored by the key of their upload, see `assign_keys`. Similar
+    profiles follow the files as gray overlays.
+    """
     if decile_data_store is None:
         raise PreventUpdate
 
-    decile_data_store = [
-        pd.DataFrame.from_dict(item).set_index(["id", "hand"]) for item in decile_data_store
-    ]
-
-    static_store = {
-        key: pd.DataFrame.from_dict(item) for key, item in static_store.items()
-    }
+    stored = snapshot_value(
+        snapshot, "plots", deciles=decile_data_store, similar=similar_store)
+    if stored is not None:
+        return stored
 
-    plot_files = []
-    for i, file in enumerate(decile_data_store):
-        plot = static_store['measure_labels'].set_index('id')
+    measure_labels = pd.DataFrame.from_dict(static_store['measure_labels'])
 
-        # Only get specified hands
-        file = file.reset_index()\
-
-        file = file\
-            .loc[file["hand"].isin(hands_shown_values[i])]\
-            .set_index(["id"])
+    color_ids = [item.get("key", i) for i, item in enumerate(upload_store or [])]
+    if len(color_ids) != len(decile_data_store):
+        color_ids = range(len(decile_data_store))
 
+    plot_files = []
+    for file, color_id in zip(decile_data_store, color_ids):
         # Add labels and flatten
-        file = file\
-            .merge(plot, how="left", left_index=True, right_index=True)\
-            .reset_index()\
+        file = pd.DataFrame.from_dict(file)\
+            .reset_index(drop=True)\
+            .merge(measure_labels, how="left", on="id")\
+            .assign(color_id=color_id)
 
         # Easier to debug
-        file = file.to_dict()
+        plot_files.append(file.to_dict())
 
-        plot_files.append(file)
+    for match in similar_store or []:
+        file = pd.DataFrame.from_records(match["deciles"], columns=["id", "hand", "value"])\
+            .merge(measure_labels, how="left", on="id")\
+            .assign(color_id=-1)
+        plot_files.append(file.to_dict())
 
     return plot_files
 
 
+def get_section_graph(
+    plot_input: pd.DataFrame,
+    section_id: int,
+    title: str,
+    hands_shown: list = None,
+    score_mode: str = "decile",
+):
+    """Graph of one section, the figure is built once per input."""
+    df_per_section = plot_input[plot_input["section_id"] == section_id]
+    key = cache_key(
+        "section", title, df_per_section.to_dict(orient="split"), hands_shown, score_mode)
+    # Cached as plain dict, which all threads only read
+    figure = figure_cache.get_or_build(
+        key, lambda: return_section_figure(
+            df_per_section, section_id, hands_shown, score_mode).to_dict())
+    return wrap_figure_in_graph(
+        None, figure, {"type": "section-graph", "index": section_id})
+
+
+def return_section_panel(section_id: int, title: str, graph=None):
+    """Collapsible section, the graph is rendered when it is opened."""
+    return dmc.Accordion(
+        dmc.AccordionItem(
+            [
+                dmc.AccordionControl(dmc.Title(title, order=2)),
+                dmc.AccordionPanel([
+                    html.Div(
+                        graph,
+                        id={"type": "section-panel", "index": section_id},
+                    ),
+                    dcc.Store(
+                        id={"type": "section-rendered", "index": section_id},
+                        data=graph is not None,
+                    ),
+                ]),
+            ],
+            value=str(section_id),
+        ),
+        id={"type": "section-accordion", "index": section_id},
+        value=str(section_id) if graph is not None else None,
+        chevronPosition="left",
+        style={
+            "page-break-before": "initial",
+        }
+    )
+
+
 @callback(
     Output("all-plots", 'children'),
     Input('plot-data-store', 'data'),
     State('static-store', 'data'),
+    Input('radiogroup-render-mode', 'value'),
+    State({"type": "section-accordion", "index": ALL}, 'value'),
+    State('snapshot-store', 'data'),
+    hands_dependency({"type": 'chips-hand', "index": ALL}, 'value'),
+    State('select-score-mode', 'value'),
     prevent_initial_call=True
 )
 def create_plots(
     plot_data_store: dict,
     static_store: dict,
+    render_mode: str = "sections",
+    open_sections: list = None,
+    snapshot: dict = None,
+    hands_shown_values: list = None,
+    score_mode: str = "decile",
 ):
-    plot_data_store = [
-        pd.DataFrame.from_dict(item) for item in plot_data_store
-    ]
+    if plot_data_store is None:
+        raise PreventUpdate
 
-    section_config = static_store['section_config']
+    stored = snapshot_value(
+        snapshot, "figures", plots=plot_data_store, render_mode=render_mode)
+    if stored is not None:
+        return stored
 
-    all_files = []
-    for file_id, file in enumerate(plot_data_store):
-        # Check here if dataframe is not empty
-        if len(file) != 0:
-            file = file.set_index('id')
-            file.loc[:, "file_id"] = file_id
-            all_files.append(file)
+    section_config = static_store['section_config']
 
-    # Check here if all files are empty
-    if len(all_files) == 0:
+    plot_input = prepare_plot_input(plot_data_store, section_config)
+    if plot_input is None:
         return []
 
-    plot_input = my_concat(all_files, axis=0)\
-        .reset_index()\
-        .set_index("id", drop=False)
-    # .melt(id_vars=["id", "device", "description", "unit", "file_id"], var_name="hand")\
+    if render_mode == "batched":
+        figure = return_batched_figure(
+            plot_input,
+            [section["title"] for section in section_config],
+            hands_shown_values,
+            score_mode,
+        )
+        return [wrap_figure_in_graph(
+            None, figure, {"type": "section-graph", "index": "batched"})]
 
-    for section_id, section in enumerate(section_config):
-        section_position = 0
-        for index in section['index_order']:
-            if index in plot_input.index:
-                plot_input.loc[index, "section_id"] = section_id
-                plot_input.loc[index, "section_position"] = section_position
-                section_position = section_position + 1
+    shown_sections = [
+        section_id for section_id in range(len(section_config))
+        if (plot_input["section_id"] == section_id).any()
+    ]
+
+    # Keep sections open, open the first one initially
+    open_sections = {int(value) for value in open_sections or [] if value}
+    if not open_sections.intersection(shown_sections):
+        open_sections = set(shown_sections[:1])
 
     all_plots_children = []
-    for section_id, section in enumerate(section_config):
-        if len(plot_input[plot_input["section_id"] == section_id]):
-            figure = return_section_figure(plot_input, section_id)
-            child = wrap_figure_in_graph(section["title"], figure)
-            all_plots_children.append(child)
+    for section_id in shown_sections:
+        title = section_config[section_id]["title"]
+        graph = get_section_graph(
+            plot_input, section_id, title, hands_shown_values, score_mode) \
+            if section_id in open_sections else None
+        all_plots_children.append(
+            return_section_panel(section_id, title, graph))
 
     return all_plots_children
 
 
+@callback(
+    Output({"type": "section-panel", "index": ALL}, 'children'),
+    Output({"type": "section-rendered", "index": ALL}, 'data'),
+    Input({"type": "section-accordion", "index": ALL}, 'value'),
+    State({"type": "section-rendered", "index": ALL}, 'data'),
+    State({"type": "section-rendered", "index": ALL}, 'id'),
+    State('plot-data-store', 'data'),
+    State('static-store', 'data'),
+    State({"type": 'chips-hand', "index": ALL}, 'value'),
+    State('select-score-mode', 'value'),
+    prevent_initial_call=True
+)
+def render_opened_sections(
+    open_sections: list,
+    rendered: list,
+    ids: list,
+    plot_data_store: dict,
+    static_store: dict,
+    hands_shown_values: list = None,
+    score_mode: str = "decile",
+):
+    # Only build sections when they are opened for the first time
+    opened = [
+        int(value) for value, is_rendered in zip(open_sections, rendered)
+        if value and not is_rendered
+    ]
+    if plot_data_store is None or not opened:
+        raise PreventUpdate
+
+    section_config = static_store['section_config']
+    plot_input = prepare_plot_input(plot_data_store, section_config)
+
+    panels = [
+        get_section_graph(
+            plot_input,
+            id["index"],
+            section_config[id["index"]]["title"],
+            hands_shown_values,
+            score_mode,
+        )
+        if id["index"] in opened else no_update
+        for id in ids
+    ]
+
+    return panels, [
+        is_rendered or id["index"] in opened
+        for id, is_rendered in zip(ids, rendered)
+    ]
+
+
+# Toggling a hand only changes the visibility of its traces, in the
+# browser without a server request
+clientside_callback(
+    ClientsideFunction(namespace="handprofil", function_name="showHands"),
+    Output({"type": "section-graph", "index": ALL}, 'figure'),
+    Input({"type": 'chips-hand', "index": ALL}, 'value'),
+    State({"type": "section-graph", "index": ALL}, 'figure'),
+    prevent_initial_call=True
+)
+
+
+@callback(
+    Output("cohort-plots", 'children'),
+    Output("cohort-error-messages", 'children'),
+    Input('cohort-store', 'data'),
+    Input('radiogroup-sex', 'value'),
+    Input('select-instrument', 'value'),
+    Input('checkbox-background-hand', 'checked'),
+    Input('select-norms', 'value'),
+    State('static-store', 'data'),
+    prevent_initial_call=True
+)
+def create_cohort_plots(
+    cohort_store: dict,
+    sex: str,
+    instrument: str,
+    checkbox_background_hand: bool,
+    norms: str,
+    static_store: dict,
+):
+    if not cohort_store:
+        raise PreventUpdate
+
+    errors = cohort_store.get("errors", [])
+    alerts = [
+        dmc.Alert(
+            "\n".join(errors[:10] + ([f"... und {len(errors) - 10} weitere"] if len(errors) > 10 else [])),
+            title=f"{len(errors)} Dateien konnten nicht gelesen werden",
+            color="red",
+            style={"whiteSpace": "pre-line"}
+        )
+    ] if errors else []
+
+    tokens = cohort_store.get("tokens", [])
+    values = load_cohort(tokens[0]) if tokens else None
+    if values is None:
+        return [], alerts
+
+    # Cohorts have no age per subject, use the norms of all ages
+    bin_edges = norms_datasets.get(norms).bin_edges(
+        instrument, sex, ALL_AGES, checkbox_background_hand)
+    counts = cohort_decile_counts(values, bin_edges)
+    measure_labels = pd.DataFrame.from_dict(static_store["measure_labels"])
+
+    children = [
+        dmc.Text(f"Anzahl Messungen: {values['subject'].nunique()}", mt=10)
+    ]
+    for section in static_store["section_config"]:
+        if counts.index.get_level_values("id").isin(section["index_order"]).any():
+            figure = return_cohort_section_figure(
+                counts, measure_labels, section["index_order"])
+            children.append(wrap_figure_in_graph(section["title"], figure))
+
+    return children, alerts
+
+
+@callback(
+    Output('similar-store', 'data'),
+    Output('similar-messages', 'children'),
+    Output('select-similar-file', 'data'),
+    Input('decile-data-store', 'data'),
+    Input('select-similar-file', 'value'),
+    Input('similar-count', 'value'),
+    State('upload-store', 'data'),
+    State('radiogroup-sex', 'value'),
+    State('select-instrument', 'value'),
+    State('checkbox-background-hand', 'checked'),
+    State('select-norms', 'value'),
+    State('select-score-mode', 'value'),
+    prevent_initial_call=True,
+)
+def find_similar_profiles(
+    decile_data_store: list,
+    file_index: str,
+    count: int,
+    upload_store: list,
+    sex: str,
+    instrument: str,
+    checkbox_background_hand: bool,
+    norms: str,
+    score_mode: str,
+):
+    """Nearest archived profiles of an uploaded file, see handprofil.profiles."""
+    files = [
+        {"value": str(i), "label": item["filename"]}
+        for i, item in enumerate(upload_store or [])
+    ]
+    if not count or file_index is None or int(file_index) >= len(decile_data_store or []):
+        return None, [], files
+
+    # Profiles are the stored deciles of the default norms
+    if norms != DEFAULT_DATASET or score_mode != "decile":
+        return None, [dmc.Alert(
+            "Ähnliche Profile werden nur mit den Standard-Normdaten und Dezilen gesucht",
+            title="Ähnliche Profile", color="yellow")], files
+
+    deciles = pd.DataFrame.from_dict(decile_data_store[int(file_index)]).to_dict(orient="records")
+    # Files which are already shown are no matches
+    exclude = [item["archive_id"] for item in upload_store if "archive_id" in item]
+    with closing(archive.connect()) as connection:
+        matches = find_similar(
+            connection, deciles, sex, instrument, checkbox_background_hand, int(count), exclude)
+
+    if not matches:
+        return None, [dmc.Alert(
+            "Keine ähnlichen Profile im Archiv", title="Ähnliche Profile", color="yellow")], files
+
+    messages = [
+        dmc.Text(
+            f"{match['subject']}, {format_date(match['measured_on'])}: "
+            f"Ø Abstand {match['distance']:.1f} Dezile bei {match['n_common']} Werten"
+        )
+        for match in matches
+    ]
+    return matches, messages, files
+
+
+@callback(
+    Output("comparison-plot", 'children'),
+    Output("select-comparison-file", 'data'),
+    Input("comparison-accordion", 'value'),
+    Input('upload-store', 'data'),
+    Input("select-comparison-file", 'value'),
+    Input('radiogroup-sex', 'value'),
+    Input('checkbox-background-hand', 'checked'),
+    Input('select-norms', 'value'),
+    Input('select-score-mode', 'value'),
+    State('static-store', 'data'),
+    prevent_initial_call=True,
+)
+def create_instrument_comparison(
+    opened: str,
+    upload_store: list,
+    file_index: str,
+    sex: str,
+    checkbox_background_hand: bool,
+    norms: str,
+    score_mode: str,
+    static_store: dict,
+):
+    files = [
+        {"value": str(i), "label": item["filename"]}
+        for i, item in enumerate(upload_store or [])
+    ]
+    if opened != "comparison" or not upload_store:
+        return [], files
+
+    index = int(file_index) if file_index and int(file_index) < len(upload_store) else 0
+
+    # All instruments in one lookup, instead of one recompute per instrument
+    scores = norms_datasets.get(norms).score_instruments(
+        upload_store[index],
+        [x["value"] for x in instrument_data],
+        sex,
+        checkbox_background_hand,
+        score_mode,
+    )
+    if scores.empty:
+        return [dmc.Alert("Keine Hintergrunddaten", color="yellow")], files
+
+    figure = return_instrument_matrix_figure(
+        scores,
+        pd.DataFrame.from_dict(static_store["measure_labels"]),
+        [index for section in static_store["section_config"] for index in section["index_order"]],
+        {x["value"]: x["label"] for x in instrument_data},
+        score_mode,
+    )
+    return [wrap_figure_in_graph(upload_store[index]["filename"], figure)], files
+
+
+def return_file_card(item: dict, hands: list):
+    key = item["key"]
+    color = global_colors[key % len(global_colors)]
+    info = pd.DataFrame.from_dict(item["info"]).set_index('id')["value"]
+
+    return dmc.SimpleGrid(
+        id={"type": "file-card", "index": key},
+        style={
+            "borderColor": color,
+            "border": f"4px solid {color}",
+            "borderRadius": 16,
+            "padding": 20,
+            "marginTop": 20,
+            "marginBottom": 20,
+        },
+        cols=3,
+        children=[
+            dmc.Container(
+                children=[dmc.Text(line) for line in lines]
+            )
+            for lines in return_subject_lines(item["filename"], info)
+        ] + [
+            dmc.Group([
+                dmc.ChipGroup(
+                    [
+                        dmc.Chip(
+                            x["label"],
+                            value=x["value"],
+                            variant="filled",
+                            color=color
+                        )
+                        for x in hand_data
+                    ],
+                    id={"type": "chips-hand", "index": key},
+                    value=hands,
+                    multiple=True,
+                ), dmc.ActionIcon(
+                    DashIconify(icon="mdi:trash", width=20),
+                    variant="outline",
+                    id={"type": "delete-file-button", "index": key},
+                    n_clicks=0,
+                    radius="xl",
+                    color="red",
+                )])])
+
+
 @callback(
     Output('upload-debug-container', 'children'),
     Input('upload-store', 'data'),
+    State('snapshot-store', 'data'),
+    State({"type": "file-card", "index": ALL}, "id"),
     prevent_initial_call=True,
 )
-def display_upload_store_content(data: list):
-    children = []
-    for id, value in enumerate(data):
-        filename = value["filename"]
-        info = pd.DataFrame.from_dict(value["info"]).set_index('id')["value"]
-
-        try:
-            measure_date = datetime.strptime(
-                info.get(2), '%Y-%m-%dT%H:%M:%S').strftime('%d.%m.%Y')
-            birth_date = datetime.strptime(
-                info.get(5), '%Y-%m-%dT%H:%M:%S').strftime('%d.%m.%Y')
-        except:
-            measure_date = ""
-            birth_date = ""
-
-        child = dmc.SimpleGrid(
-            style={
-                "borderColor": global_colors[id],
-                "border": f"4px solid {global_colors[id]}",
-                "borderRadius": 16,
-                "padding": 20,
-                "marginTop": 20,
-                "marginBottom": 20,
-            },
-            cols=3,
-            children=[
-                dmc.Container(
-                    children=[
-                        dmc.Text(f'Datei: {filename}'),
-                        dmc.Text(f'ID: {info.get(1, " ")}'),
-                        dmc.Text(f'Datum: {measure_date}')
-                    ]
-                ),
-                dmc.Container(
-                    children=[
-                        dmc.Text(
-                            f'{info.get(3, "")}, {info.get(4, "")} ({info.get(6,"")})'),
-                        dmc.Text(f'{birth_date}'),
-                        dmc.Text(f'Händigkeit: {info.get(7, "")}'),
-                        dmc.Text(f'Instrument: {info.get(8, "")}'),
-                    ]
-                ),
-                dmc.Group([
-                    dmc.ChipGroup(
-                        [
-                            dmc.Chip(
-                                x["label"],
-                                value=x["value"],
-                                variant="filled",
-                                color=global_colors[id]
-                            )
-                            for x in hand_data
-                        ],
-                        id={"type": "chips-hand", "index": id},
-                        value=["left", "right"],
-                        multiple=True,
-                    ), dmc.ActionIcon(
-                        DashIconify(icon="mdi:trash", width=20),
-                        variant="outline",
-                        id={"type": "delete-file-button", "index": id},
-                        n_clicks=0,
-                        radius="xl",
-                        color="red",
-                    )])])
-        children.append(child)
-
-    return children
+def display_upload_store_content(data: list, snapshot: dict = None, card_ids: list = None):
+    """Cards of the uploaded files.
+
+    Only cards of deleted and appended files are changed, other cards
+    and their chips stay as they are. Cards are rebuilt if the files
+    were replaced, e.g. by a snapshot.
+    """
+    data = data or []
+    shown = [card_id["index"] for card_id in card_ids or []]
+    keys = [item.get("key") for item in data]
+    kept = [key for key in shown if key in keys]
+
+    hands = snapshot_value(snapshot, "hands", upload=data)
+    if hands is not None or not shown or None in keys or kept != keys[:len(kept)]:
+        hands = hands or [["left", "right"]] * len(data)
+        return [return_file_card(item, item_hands) for item, item_hands in zip(data, hands)]
+
+    if kept == shown and len(keys) == len(shown):
+        raise PreventUpdate
+
+    patch = Patch()
+    # Delete from the end, so positions of the other cards do not shift
+    for position in reversed(range(len(shown))):
+        if shown[position] not in keys:
+            del patch[position]
+    for item in data[len(kept):]:
+        patch.append(return_file_card(item, ["left", "right"]))
+    return patch
 
 
 @callback(
@@ -786,12 +1143,17 @@ def display_upload_store_content(data: list):
     State('upload-store', 'data'),
     prevent_initial_call=True,
 )
-def delete_file_from_store(n_clicks, id: dict, data: dict):
-    for i, clicks in enumerate(n_clicks):
-        if clicks > 0:
-            data.pop(id[i]['index'])
-            return data
-    return data
+def delete_file_from_store(n_clicks: list, ids: list, data: list):
+    # Clicked cards are deleted, so only the card just clicked has clicks
+    keys = {id["index"] for id, clicks in zip(ids, n_clicks) if clicks}
+    positions = [i for i, item in enumerate(data or []) if item.get("key") in keys]
+    if not positions:
+        raise PreventUpdate
+
+    patch = Patch()
+    for position in reversed(positions):
+        del patch[position]
+    return patch
 
 
 @callback(
@@ -808,22 +1170,45 @@ def upload_files_to_store(list_of_contents, list_of_filenames, store_state):
     if list_of_contents is None:
         raise PreventUpdate
 
-    results = [
-        parse_contents(c, f) for c, f in zip(list_of_contents, list_of_filenames)
-    ]
+    results = parse_all_contents(list_of_contents, list_of_filenames)
 
     new_items = [
         data for result, data in results if result
     ]
 
     errors = [
-        dmc.Alert(e, title="Fehler beim Upload", color="red") for result, e in results if not result
+        dmc.Alert(str(e), title=f"Fehler beim Upload: {f}", color="red", style={"whiteSpace": "pre-line"})
+        for (result, e), f in zip(results, list_of_filenames) if not result
     ]
 
-    export = store_state + new_items if store_state else new_items
+    export = append_to_store(store_state, new_items)
     return export, None, errors
 
 
+@callback(
+    Output('upload-store', 'data', allow_duplicate=True),
+    Output('upload-error-messages', 'children', allow_duplicate=True),
+    Input('upload-token-store', 'data'),
+    State('upload-store', 'data'),
+    prevent_initial_call=True,
+)
+def upload_tokens_to_store(token_store: dict, store_state: list):
+    if not token_store:
+        raise PreventUpdate
+
+    new_items = [
+        item for item in map(take_upload, token_store.get("tokens", [])) if item is not None
+    ]
+
+    errors = [
+        dmc.Alert(e, title="Fehler beim Upload", color="red", style={"whiteSpace": "pre-line"})
+        for e in token_store.get("errors", [])
+    ]
+
+    export = append_to_store(store_state, new_items)
+    return export, errors
+
+
 @callback(
     Output("download-xlsx", "data"),
     Input("btn_image", "n_clicks"),
@@ -833,9 +1218,508 @@ def func(n_clicks):
     return dcc.send_file(get_absolute_path("src/handprofil/download/measurement_template.xlsx"))
 
 
+@callback(
+    Output("download-prefilled", "data"),
+    Output("upload-participants", "contents"),
+    Output('upload-error-messages', 'children', allow_duplicate=True),
+    Input("upload-participants", "contents"),
+    prevent_initial_call=True,
+)
+def download_prefilled_workbooks(contents: str):
+    if contents is None:
+        raise PreventUpdate
+
+    _, content_string = contents.split(",")
+    try:
+        participants, errors = read_participants(io.BytesIO(base64.b64decode(content_string)))
+    except (ValueError, pd.errors.ParserError) as e:
+        participants, errors = [], [str(e)]
+
+    alerts = [
+        dmc.Alert("\n".join(errors), title="Fehler in der Teilnehmerliste",
+                  color="red", style={"whiteSpace": "pre-line"})
+    ] if errors else []
+    if not participants:
+        return no_update, None, alerts
+
+    return dcc.send_bytes(
+        lambda stream: write_zip(iter_workbooks(participants, workbook_template), stream),
+        "Vorlagen.zip",
+    ), None, alerts
+
+
+@callback(
+    Output('upload-store', 'data', allow_duplicate=True),
+    Output('archive-messages', 'children', allow_duplicate=True),
+    Input("btn-archive-load", "n_clicks"),
+    State("archive-subject", "value"),
+    State('upload-store', 'data'),
+    prevent_initial_call=True,
+)
+def load_archive_history(n_clicks, subject: str, store_state: list):
+    if not subject:
+        raise PreventUpdate
+
+    with closing(archive.connect()) as connection:
+        history = archive.load_history(connection, subject.strip())
+
+    if not history:
+        return no_update, [dmc.Alert(
+            f"Keine Messungen für {subject} im Archiv", title="Archiv", color="yellow")]
+
+    # Skip measurements which are already shown
+    shown = {item.get("archive_id") for item in store_state or []}
+    new_items = [item for item in history if item["archive_id"] not in shown]
+
+    export = append_to_store(store_state, new_items)
+    return export, []
+
+
+@callback(
+    Output('archive-messages', 'children', allow_duplicate=True),
+    Input("btn-archive-store", "n_clicks"),
+    State('upload-store', 'data'),
+    prevent_initial_call=True,
+)
+def store_uploads_in_archive(n_clicks, upload_store: list):
+    if not upload_store:
+        raise PreventUpdate
+
+    with closing(archive.connect()) as connection:
+        n_added = archive.add_measurements(connection, upload_store)
+
+    return [dmc.Alert(
+        f"{n_added} neue Messungen gespeichert, "
+        f"{len(upload_store) - n_added} waren bereits im Archiv",
+        title="Archiv",
+        color="green"
+    )]
+
+
+@callback(
+    Output('snapshot-store', 'data'),
+    Output('radiogroup-sex', 'value'),
+    Output('select-instrument', 'value'),
+    Output('checkbox-background-hand', 'checked'),
+    Output('radiogroup-render-mode', 'value'),
+    Output('select-norms', 'value'),
+    Output('select-score-mode', 'value'),
+    Input('url', 'search'),
+)
+def restore_snapshot(search: str):
+    snapshot_id = parse_qs((search or "").lstrip("?")).get("snapshot", [None])[0]
+    snapshot = load_snapshot(snapshot_id)
+    if snapshot is None:
+        raise PreventUpdate
+
+    return (
+        snapshot,
+        snapshot["sex"],
+        snapshot["instrument"],
+        snapshot["background_hand"],
+        snapshot["render_mode"],
+        snapshot.get("norms", DEFAULT_DATASET),
+        snapshot.get("score_mode", "decile"),
+    )
+
+
+@callback(
+    Output('upload-store', 'data', allow_duplicate=True),
+    Input('snapshot-store', 'data'),
+    prevent_initial_call=True,
+)
+def restore_snapshot_uploads(snapshot: dict):
+    # The following callbacks take their results from the snapshot
+    if not snapshot:
+        raise PreventUpdate
+    return assign_keys(snapshot["upload"])
+
+
+@callback(
+    Output('snapshot-link', 'children'),
+    Input("btn-snapshot", "n_clicks"),
+    State('upload-store', 'data'),
+    State('radiogroup-sex', 'value'),
+    State('select-instrument', 'value'),
+    State('checkbox-background-hand', 'checked'),
+    State('radiogroup-render-mode', 'value'),
+    State({"type": 'chips-hand', "index": ALL}, 'value'),
+    State('decile-data-store', 'data'),
+    State('plot-data-store', 'data'),
+    State('all-plots', 'children'),
+    State('select-norms', 'value'),
+    State('select-score-mode', 'value'),
+    prevent_initial_call=True,
+)
+def create_snapshot(
+    n_clicks,
+    upload_store: list,
+    sex: str,
+    instrument: str,
+    checkbox_background_hand: bool,
+    render_mode: str,
+    hands_shown_values: list,
+    decile_data_store: list,
+    plot_data_store: list,
+    all_plots: list,
+    norms: str = DEFAULT_DATASET,
+    score_mode: str = "decile",
+):
+    if not upload_store or plot_data_store is None:
+        raise PreventUpdate
+
+    snapshot_id = store_snapshot({
+        "upload": upload_store,
+        "sex": sex,
+        "instrument": instrument,
+        "background_hand": checkbox_background_hand,
+        "norms": norms,
+        "score_mode": score_mode,
+        "render_mode": render_mode,
+        "hands": hands_shown_values,
+        "deciles": decile_data_store,
+        "plots": plot_data_store,
+        "figures": all_plots,
+    })
+
+    url = request.host_url.rstrip("/") + \
+        app.get_relative_path("/") + f"?snapshot={snapshot_id}"
+    return dmc.Alert(
+        dmc.Anchor(url, href=url, target="_blank"),
+        title="Snapshot gespeichert",
+        color="green",
+    )
+
+
+@callback(
+    Output("download-reports", "data"),
+    Output('upload-error-messages', 'children', allow_duplicate=True),
+    Input("btn-reports", "n_clicks"),
+    State('upload-store', 'data'),
+    State('decile-data-store', 'data'),
+    State('static-store', 'data'),
+    State('select-score-mode', 'value'),
+    prevent_initial_call=True,
+)
+def download_reports(
+    n_clicks,
+    upload_store: list,
+    decile_data_store: list,
+    static_store: dict,
+    score_mode: str = "decile",
+):
+    if not upload_store or not decile_data_store:
+        raise PreventUpdate
+
+    static_config = {
+        key: pd.DataFrame.from_dict(item) if isinstance(item, dict) else item
+        for key, item in static_store.items()
+    }
+
+    # Reports show the deciles of the page, several are rendered in a
+    # worker pool
+    content, errors = write_reports_zip(
+        upload_store,
+        [pd.DataFrame.from_dict(item) for item in decile_data_store],
+        static_config,
+        score_mode,
+    )
+
+    alerts = [
+        dmc.Alert(error, title="Fehler beim Bericht", color="red")
+        for error in errors
+    ]
+    return dcc.send_bytes(content, "Berichte.zip"), alerts
+
+
+@callback(
+    Output("download-export", "data"),
+    Input("btn-export-xlsx", "n_clicks"),
+    Input("btn-export-csv", "n_clicks"),
+    State('upload-store', 'data'),
+    State('decile-data-store', 'data'),
+    State('static-store', 'data'),
+    State('select-score-mode', 'value'),
+    prevent_initial_call=True,
+)
+def download_export(
+    n_clicks_xlsx,
+    n_clicks_csv,
+    upload_store: list,
+    decile_data_store: list,
+    static_store: dict,
+    score_mode: str = "decile",
+    export_format: str = None,
+):
+    if not upload_store or not decile_data_store:
+        raise PreventUpdate
+
+    export_format = export_format or \
+        ("csv" if ctx.triggered_id == "btn-export-csv" else "xlsx")
+    rows = iter_rows(
+        zip(upload_store, [pd.DataFrame.from_dict(item) for item in decile_data_store]),
+        pd.DataFrame.from_dict(static_store["measure_labels"]),
+    )
+    write = write_csv if export_format == "csv" else write_xlsx
+
+    # Written to a file first, the rows are never joined in memory
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"Ergebnisse.{export_format}")
+        write(rows, path, score_mode)
+        return dcc.send_file(path)
+
+
+@callback(
+    Output("archive-export-link", "href"),
+    Input("archive-subject", "value"),
+    Input('radiogroup-sex', 'value'),
+    Input('select-instrument', 'value'),
+    Input('checkbox-background-hand', 'checked'),
+    Input('select-norms', 'value'),
+    Input('select-score-mode', 'value'),
+)
+def update_archive_export_link(
+    subject: str,
+    sex: str,
+    instrument: str,
+    bh: bool,
+    norms: str,
+    score_mode: str = "decile",
+):
+    arguments = {
+        "format": "xlsx",
+        "sex": sex,
+        "instrument": instrument,
+        "background_hand": str(bool(bh)).lower(),
+        "norms": norms or DEFAULT_DATASET,
+        "mode": score_mode or "decile",
+    }
+    if subject and subject.strip():
+        arguments["subject"] = subject.strip()
+    return app.get_relative_path("/api/export") + "?" + urlencode(arguments)
+
+
+#######################
+####### Routes ########
+#######################
+
+
+def get_background_arguments(args) -> tuple:
+    sex = args.get("sex", "m")
+    instrument = args.get("instrument", "gemischt")
+    background_hand = args.get("background_hand", "true").lower() != "false"
+    norms = args.get("norms", DEFAULT_DATASET)
+
+    if sex not in [k for k, _ in sex_data]:
+        abort(400, f"Unbekanntes Geschlecht: {sex}")
+    if instrument not in [x["value"] for x in instrument_data]:
+        abort(400, f"Unbekanntes Instrument: {instrument}")
+    if norms_datasets.path(norms) is None:
+        abort(400, f"Unbekannte Normdaten: {norms}")
+
+    return sex, instrument, background_hand, norms
+
+
+def get_score_mode(args) -> str:
+    score_mode = args.get("mode", "decile")
+    if score_mode not in score_modes:
+        abort(400, f"Unbekannte Skala: {score_mode}")
+    return score_mode
+
+
+@server.route("/api/bulk-score", methods=["POST"])
+def bulk_score():
+    """Score a zip archive of workbooks sent as (chunked) request body.
+
+    Returns one JSON line per workbook as soon as it is scored, the
+    scores are named by the argument `mode`, e.g. "deciles".
+    """
+    sex, instrument, background_hand, norms = get_background_arguments(request.args)
+    score_mode = get_score_mode(request.args)
+
+    results = score_zip_stream(
+        request.stream, sex, instrument, background_hand, norms=norms, score_mode=score_mode)
+
+    return Response(
+        stream_with_context(
+            json.dumps(result, default=json_default) + "\n" for result in results
+        ),
+        mimetype="application/x-ndjson"
+    )
+
+
+export_mimetypes = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+@server.route("/api/export", methods=["GET"])
+def export_archive():
+    """Raw values and deciles of archived measurements as CSV or xlsx.
+
+    Measurements are read and scored one at a time while the file is
+    sent, the optional argument `subject` restricts to one subject.
+    """
+    sex, instrument, background_hand, norms = get_background_arguments(request.args)
+    score_mode = get_score_mode(request.args)
+    export_format = request.args.get("format", "xlsx")
+    subject = request.args.get("subject") or None
+    if export_format not in export_mimetypes:
+        abort(400, f"Unbekanntes Format: {export_format}")
+
+    norms_cube = norms_datasets.get(norms)
+    measure_labels = read_static_config()["measure_labels"]
+
+    def iter_scored():
+        with closing(archive.connect()) as connection:
+            for measurement in archive.iter_measurements(connection, subject):
+                yield measurement, norms_cube.score_measurement(
+                    measurement, instrument, sex, background_hand, score_mode)
+
+    rows = iter_rows(iter_scored(), measure_labels)
+    chunks = iter_csv(rows, score_mode) if export_format == "csv" \
+        else iter_xlsx(rows, score_mode)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=export_mimetypes[export_format],
+        headers={"Content-Disposition": f"attachment; filename=Ergebnisse.{export_format}"},
+    )
+
+
+@server.route("/api/norms", methods=["GET"])
+def list_norms():
+    """Names of the norms datasets and load metrics of this process."""
+    return {
+        "datasets": norms_datasets.names(),
+        "default": DEFAULT_DATASET,
+        "metrics": norms_datasets.metrics(),
+    }
+
+
+@server.route("/api/upload", methods=["POST"])
+def upload_files():
+    """Parse workbooks sent as raw (chunked) body or multipart form.
+
+    Device exports (.csv) are read like workbooks, see handprofil.devices.
+    The raw body variant expects the filename in the X-Filename header.
+    Parsed workbooks are kept on the server, only their tokens are
+    returned and resolved by the `upload_tokens_to_store` callback.
+    """
+    if request.files:
+        uploads = [
+            (file.filename, file.stream) for file in request.files.getlist("file")
+        ]
+    else:
+        filename = unquote(request.headers.get("X-Filename", ""))
+        uploads = [(filename, spool_stream(request.stream))]
+
+    results = read_workbooks([
+        (stream, filename) for filename, stream in uploads if filename.lower().endswith(".xlsx")
+    ])
+
+    tokens = []
+    errors = []
+    for filename, stream in uploads:
+        if filename.lower().endswith(".xlsx"):
+            is_success, result = results.pop(0)
+        elif filename.lower().endswith(".csv"):
+            is_success, result = read_device_export(stream, filename)
+        else:
+            is_success, result = False, "Ungültiges Dateiformat. Unterstützt werden Dateien im .xslx und .csv Format"
+        stream.close()
+
+        if is_success:
+            tokens.append(store_upload(result))
+        else:
+            errors.append(f"{filename}: {result}")
+
+    return {"tokens": tokens, "errors": errors}
+
+
+@server.route("/api/cohort", methods=["POST"])
+def upload_cohort():
+    """Read a cohort sent as multipart form or raw body.
+
+    Accepts workbooks and zip archives of workbooks. The measurements are
+    stored on the server, only a token is returned.
+    """
+    if request.files:
+        uploads = [
+            (file.filename, file.stream) for file in request.files.getlist("file")
+        ]
+    else:
+        filename = unquote(request.headers.get("X-Filename", ""))
+        uploads = [(filename, request.stream)]
+
+    def iter_entries():
+        for filename, stream in uploads:
+            if filename.lower().endswith(".zip"):
+                yield from iter_zip_entries(stream)
+            else:
+                yield filename, stream.read()
+
+    values, errors = collect_cohort(iter_entries())
+    if values.empty:
+        return {"tokens": [], "errors": errors or ["Keine Messungen gefunden"]}
+
+    return {"tokens": [store_cohort(values)], "errors": errors}
+
+
+#######################
+###### Warm-up ########
+#######################
+
+logger = logging.getLogger(__name__)
+
+# Set by `warm_up`, see /ready and gunicorn.conf.py
+warm_up_done = threading.Event()
+warm_up_seconds = None
+
+
+def return_warm_up_measurement(instrument: str, sex: str) -> dict:
+    """Measurement of all attributes at the median of the default norms."""
+    edges = norms_datasets.get(DEFAULT_DATASET).bin_edges(instrument, sex, ALL_AGES, True)
+    data = edges[5].unstack("hand").reindex(columns=["left", "right"]).reset_index()
+    return {"info": {}, "data": data.to_dict(), "filename": "warm-up.xlsx"}
+
+
+def warm_up(instrument: str = "gemischt", sex: str = "m") -> float:
+    """Run the cold paths once before the first request.
+
+    Reads the config, loads the default norms and scores a synthetic
+    measurement through the callbacks up to the figures of all
+    sections, in both render modes. Returns the seconds it took.
+    """
+    global warm_up_seconds
+    start = time.perf_counter()
+
+    static_store = load_static_data(None)
+    upload_store = assign_keys([return_warm_up_measurement(instrument, sex)])
+    deciles = compute_binned_values(upload_store, sex, instrument, True, DEFAULT_DATASET)
+    plot_data = get_plot_input_data(deciles, static_store, None, upload_store)
+    all_sections = [str(i) for i in range(len(static_store["section_config"]))]
+    for render_mode, _ in render_mode_data:
+        create_plots(plot_data, static_store, render_mode, all_sections)
+
+    warm_up_seconds = time.perf_counter() - start
+    warm_up_done.set()
+    logger.info("Warm-up in %.1f s", warm_up_seconds)
+    return warm_up_seconds
+
+
+@server.route("/ready", methods=["GET"])
+def ready():
+    """Readiness of this worker, 503 until the warm-up is done."""
+    if not warm_up_done.is_set():
+        return {"ready": False}, 503
+    return {"ready": True, "warm_up_seconds": warm_up_seconds}
+
+
 #######################
 ####### Main ##########
 #######################
 # Run the App
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, daemon=True).start()
     app.run(debug=True)
@@ -0,0 +1,642 @@
+"""Local archive of parsed measurements and their scores.
+
+Measurements are stored like the items of the upload store, so loading
+them again needs neither parsing nor validation. Bulk ingest:
+    python -m handprofil.archive ingest measurements/
+Profiles for the similar-profile search of one background:
+    python -m handprofil.archive profiles --sex m --instrument violine
+Scores are tagged with the version of the norms they were computed
+with, the norms of each version are kept. After the norms changed,
+only scores affected by changed edges are computed again:
+    python -m handprofil.archive rescore --report moved.csv
+"""
+
+###################
+### Imports ######
+###################
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from contextlib import closing
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from handprofil.bulk import iter_source_entries, map_workbook_entries
+from handprofil.cache import cache_key
+from handprofil.cube import ALL_AGES, NormsCube, measurement_age_band
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.scoring import read_workbook
+from handprofil.static_data import read_background, read_static_config
+from handprofil.utils import get_absolute_path, json_default
+
+
+###################
+# Constants #
+###################
+
+ARCHIVE_PATH = os.getenv(
+    "HANDPROFIL_ARCHIVE_PATH", get_absolute_path("archive.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    subject TEXT,
+    measured_on TEXT,
+    instrument TEXT,
+    filename TEXT,
+    info TEXT NOT NULL,
+    data TEXT NOT NULL,
+    ingested_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS measurements_subject
+    ON measurements (subject, measured_on);
+CREATE INDEX IF NOT EXISTS measurements_instrument
+    ON measurements (instrument, measured_on);
+
+CREATE TABLE IF NOT EXISTS scores (
+    measurement_id INTEGER NOT NULL REFERENCES measurements (id) ON DELETE CASCADE,
+    sex TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    background_hand INTEGER NOT NULL,
+    deciles TEXT NOT NULL,
+    norms_version TEXT,
+    PRIMARY KEY (measurement_id, sex, instrument, background_hand)
+);
+
+-- Edges of each norms version scores were computed with, see store_norms
+CREATE TABLE IF NOT EXISTS norms (
+    version TEXT PRIMARY KEY,
+    edges BLOB NOT NULL,
+    stored_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Deciles as float32 vector over the attributes, see profile_vector
+CREATE TABLE IF NOT EXISTS profiles (
+    measurement_id INTEGER NOT NULL REFERENCES measurements (id) ON DELETE CASCADE,
+    sex TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    background_hand INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (sex, instrument, background_hand, measurement_id)
+);
+"""
+
+hand_columns = {
+    "left": 0,
+    "right": 1,
+}
+
+###################
+# Methods #########
+###################
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(path or ARCHIVE_PATH)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+
+    # Archives of older versions have untagged scores, which are
+    # computed again by `rescore`
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(scores)")}
+    if "norms_version" not in columns:
+        with connection:
+            connection.execute("ALTER TABLE scores ADD COLUMN norms_version TEXT")
+    return connection
+
+
+def _info_values(measurement: dict) -> pd.Series:
+    return pd.DataFrame.from_dict(measurement["info"]).set_index("id")["value"]
+
+
+def _measured_on(value):
+    timestamp = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(timestamp) else timestamp.date().isoformat()
+
+
+def measurement_record(measurement: dict) -> tuple:
+    """Row of the measurements table for a parsed measurement.
+
+    The content hash only depends on info and data, so the same
+    measurement is stored once, no matter where it came from.
+    """
+    # Same representation as after a round trip through a dcc.Store
+    info = json.loads(json.dumps(measurement["info"], default=json_default))
+    data = json.loads(json.dumps(measurement["data"], default=json_default))
+    values = _info_values({"info": info})
+
+    subject = values.get(1)
+    instrument = values.get(8)
+    return (
+        cache_key(info, data),
+        None if subject is None else str(subject),
+        _measured_on(values.get(2)),
+        None if instrument is None else str(instrument).lower(),
+        measurement.get("filename"),
+        json.dumps(info),
+        json.dumps(data),
+    )
+
+
+def add_measurements(connection: sqlite3.Connection, measurements) -> int:
+    """Store parsed measurements, returns the number of new ones."""
+    before = connection.total_changes
+    with connection:
+        connection.executemany(
+            """
+            INSERT OR IGNORE INTO measurements
+                (content_hash, subject, measured_on, instrument, filename, info, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (measurement_record(measurement) for measurement in measurements)
+        )
+    return connection.total_changes - before
+
+
+def list_subjects(connection: sqlite3.Connection) -> list:
+    return [
+        row["subject"] for row in connection.execute(
+            "SELECT DISTINCT subject FROM measurements WHERE subject IS NOT NULL ORDER BY subject")
+    ]
+
+
+def iter_measurements(connection: sqlite3.Connection, subject: str = None):
+    """Measurements like upload store items, of one or all subjects.
+
+    Rows are fetched while iterating, ordered by subject and date.
+    """
+    rows = connection.execute(
+        """
+        SELECT id, filename, info, data FROM measurements
+        WHERE ? IS NULL OR subject = ?
+        ORDER BY subject, measured_on, id
+        """,
+        (subject, subject)
+    )
+    for row in rows:
+        yield {
+            "info": json.loads(row["info"]),
+            "data": json.loads(row["data"]),
+            "filename": row["filename"],
+            "archive_id": row["id"],
+        }
+
+
+def load_history(connection: sqlite3.Connection, subject: str) -> list:
+    """All measurements of a subject by date, like upload store items."""
+    return list(iter_measurements(connection, subject))
+
+
+def load_scores(
+    connection: sqlite3.Connection,
+    measurement_ids: list,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    norms_version: str = None,
+) -> dict:
+    """Stored deciles as records per measurement id.
+
+    With `norms_version`, scores of other versions are left out.
+    """
+    placeholders = ", ".join("?" * len(measurement_ids))
+    rows = connection.execute(
+        f"""
+        SELECT measurement_id, deciles FROM scores
+        WHERE sex = ? AND instrument = ? AND background_hand = ?
+            AND measurement_id IN ({placeholders})
+            AND (? IS NULL OR norms_version = ?)
+        """,
+        (sex, instrument, int(background_hand), *measurement_ids, norms_version, norms_version)
+    )
+    return {row["measurement_id"]: json.loads(row["deciles"]) for row in rows}
+
+
+def store_scores(
+    connection: sqlite3.Connection,
+    scores: dict,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    norms_cube: NormsCube,
+):
+    """Store deciles given as records per measurement id.
+
+    The deciles are tagged with the version of `norms_cube` and stored
+    as profile vector as well.
+    """
+    store_norms(connection, norms_cube)
+    with connection:
+        connection.executemany(
+            """
+            INSERT OR REPLACE INTO scores
+                (measurement_id, sex, instrument, background_hand, deciles, norms_version)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (measurement_id, sex, instrument, int(background_hand), json.dumps(deciles),
+                 norms_cube.version)
+                for measurement_id, deciles in scores.items()
+            ]
+        )
+        connection.executemany(
+            """
+            INSERT OR REPLACE INTO profiles
+                (measurement_id, sex, instrument, background_hand, vector)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (measurement_id, sex, instrument, int(background_hand),
+                 profile_vector(deciles).tobytes())
+                for measurement_id, deciles in scores.items()
+            ]
+        )
+
+
+def store_norms(connection: sqlite3.Connection, norms_cube: NormsCube):
+    """Keep the edges of a norms version, once per version."""
+    is_stored = connection.execute(
+        "SELECT 1 FROM norms WHERE version = ?", (norms_cube.version,)).fetchone()
+    if is_stored:
+        return
+    edges = zlib.compress(norms_cube.to_frame().to_csv(index=False).encode())
+    with connection:
+        connection.execute(
+            "INSERT OR IGNORE INTO norms (version, edges) VALUES (?, ?)",
+            (norms_cube.version, edges)
+        )
+
+
+def load_norms(connection: sqlite3.Connection, version: str) -> NormsCube:
+    """Cube of a stored norms version, None if it is unknown."""
+    row = connection.execute(
+        "SELECT edges FROM norms WHERE version = ?", (version,)).fetchone()
+    if row is None:
+        return None
+    return NormsCube.from_frame(read_background(io.BytesIO(zlib.decompress(row["edges"]))))
+
+###################
+# Profiles ########
+###################
+
+
+@lru_cache(maxsize=1)
+def profile_ids() -> np.ndarray:
+    """Attribute ids of the profile vectors, in the order of attributes.csv."""
+    ids = read_static_config()["measure_labels"]["id"].to_numpy()
+    ids.setflags(write=False)
+    return ids
+
+
+def profile_vector(deciles: list) -> np.ndarray:
+    """Deciles given as records as vector of fixed length.
+
+    Left and right hand of each attribute of `profile_ids` follow each
+    other, missing values are NaN.
+    """
+    rows = {id: row for row, id in enumerate(profile_ids())}
+    vector = np.full((len(rows), len(hand_columns)), np.nan, dtype=np.float32)
+    for record in deciles:
+        row = rows.get(int(record["id"]))
+        if row is not None:
+            vector[row, hand_columns[record["hand"]]] = record["value"]
+    return vector.ravel()
+
+
+def profile_records(vector: np.ndarray) -> list:
+    """Deciles of a profile vector as records, without missing values."""
+    vector = vector.reshape(-1, len(hand_columns))
+    return [
+        {"id": int(id), "hand": hand, "value": int(vector[row, column])}
+        for row, id in enumerate(profile_ids())
+        for hand, column in hand_columns.items()
+        if not np.isnan(vector[row, column])
+    ]
+
+
+def profiles_version(
+    connection: sqlite3.Connection,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+) -> tuple:
+    """Changes whenever profiles of the background are stored."""
+    row = connection.execute(
+        """
+        SELECT COUNT(*), MAX(rowid) FROM profiles
+        WHERE sex = ? AND instrument = ? AND background_hand = ?
+        """,
+        (sex, instrument, int(background_hand))
+    ).fetchone()
+    return tuple(row)
+
+
+def load_profiles(
+    connection: sqlite3.Connection,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+) -> tuple:
+    """Measurement ids and profile vectors of a background as matrix."""
+    rows = connection.execute(
+        """
+        SELECT measurement_id, vector FROM profiles
+        WHERE sex = ? AND instrument = ? AND background_hand = ?
+        ORDER BY measurement_id
+        """,
+        (sex, instrument, int(background_hand))
+    ).fetchall()
+    ids = np.array([row["measurement_id"] for row in rows], dtype=np.int64)
+    vectors = np.frombuffer(b"".join(row["vector"] for row in rows), dtype=np.float32)
+    return ids, vectors.reshape(len(rows), len(profile_ids()) * len(hand_columns))
+
+
+def load_summaries(connection: sqlite3.Connection, measurement_ids: list) -> dict:
+    """Subject, date and filename per measurement id."""
+    placeholders = ", ".join("?" * len(measurement_ids))
+    rows = connection.execute(
+        f"""
+        SELECT id, subject, measured_on, filename FROM measurements
+        WHERE id IN ({placeholders})
+        """,
+        list(measurement_ids)
+    )
+    return {row["id"]: dict(row) for row in rows}
+
+
+def store_missing_profiles(
+    connection: sqlite3.Connection,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    norms_cube=None,
+) -> int:
+    """Score archived measurements without profile in a background.
+
+    Uses the default norms like the stored scores. Returns the number
+    of new profiles.
+    """
+    batch_size = 500
+    norms_cube = norms_cube or NormsDatasets(maxsize=1).get(DEFAULT_DATASET)
+
+    rows = connection.execute(
+        """
+        SELECT id, info, data FROM measurements
+        WHERE id NOT IN (
+            SELECT measurement_id FROM profiles
+            WHERE sex = ? AND instrument = ? AND background_hand = ?
+        )
+        """,
+        (sex, instrument, int(background_hand))
+    ).fetchall()
+
+    scores = {}
+    for row in rows:
+        measurement = {"info": json.loads(row["info"]), "data": json.loads(row["data"])}
+        scores[row["id"]] = norms_cube.score_measurement(
+            measurement, instrument, sex, background_hand).to_dict(orient="records")
+        if len(scores) >= batch_size:
+            store_scores(connection, scores, sex, instrument, background_hand, norms_cube)
+            scores = {}
+    store_scores(connection, scores, sex, instrument, background_hand, norms_cube)
+    return len(rows)
+
+###################
+# Re-scoring ######
+###################
+
+
+def _age_band(info: dict) -> str:
+    if not info:
+        return ALL_AGES
+    return measurement_age_band(pd.Series(dict(zip(info["id"].values(), info["value"].values()))))
+
+
+def _measured_keys(data: dict, background_hand: bool) -> set:
+    """(id, hand) whose edges are used to score `data`."""
+    keys = set()
+    for key, id in data["id"].items():
+        hands = [hand for hand in hand_columns if data[hand].get(key) is not None]
+        if background_hand and hands:
+            # The other hand is used where edges are missing
+            hands = list(hand_columns)
+        keys.update((int(id), hand) for hand in hands)
+    return keys
+
+
+def _moved_deciles(old: list, new: list) -> list:
+    """(id, hand, old, new) of deciles which differ, None if missing."""
+    old = {(record["id"], record["hand"]): record["value"] for record in old}
+    new = {(record["id"], record["hand"]): record["value"] for record in new}
+    return [
+        (id, hand, old.get((id, hand)), new.get((id, hand)))
+        for id, hand in sorted(old.keys() | new.keys())
+        if old.get((id, hand)) != new.get((id, hand))
+    ]
+
+
+def rescore(connection: sqlite3.Connection, norms_cube: NormsCube = None) -> pd.DataFrame:
+    """Bring stored scores of other norms versions to `norms_cube`.
+
+    The edges of each old version are compared with the new ones, only
+    scores of measurements with a changed (instrument, sex, hand, age
+    band, id) are computed again, one pass per stratum. The others are
+    only tagged with the new version. Scores without stored norms are
+    all computed again. Returns the moved deciles with the columns
+    subject, measured_on, instrument, sex, background_hand, id, hand,
+    old and new.
+    """
+    norms_cube = norms_cube or NormsDatasets(maxsize=1).get(DEFAULT_DATASET)
+    store_norms(connection, norms_cube)
+
+    changes = {}
+    unchanged = []
+    # Rows to score by (sex, instrument, background hand, age band)
+    strata = {}
+    old_scores = {}
+    # Measurements have one row per stratum they were scored in
+    measurements = {}
+    rows = connection.execute(
+        """
+        SELECT s.measurement_id, s.sex, s.instrument, s.background_hand,
+            s.deciles, s.norms_version, m.subject, m.measured_on, m.info, m.data
+        FROM scores AS s JOIN measurements AS m ON m.id = s.measurement_id
+        WHERE s.norms_version IS NULL OR s.norms_version != ?
+        ORDER BY s.measurement_id
+        """,
+        (norms_cube.version,)
+    )
+    for row in rows:
+        version = row["norms_version"]
+        if version not in changes:
+            old_cube = load_norms(connection, version) if version else None
+            changes[version] = None if old_cube is None else {}
+            if old_cube is not None:
+                for change in old_cube.diff(norms_cube).itertuples(index=False):
+                    changes[version].setdefault((change.instrument, change.sex), set()).add(
+                        (change.hand, change.age_band, change.id))
+
+        measurement_id = row["measurement_id"]
+        sex, instrument = row["sex"], row["instrument"]
+        background_hand = bool(row["background_hand"])
+        stratum_changes = None if changes[version] is None \
+            else changes[version].get((instrument, sex), set())
+
+        is_affected = stratum_changes is None or bool(stratum_changes)
+        if is_affected:
+            if measurement_id not in measurements:
+                data = json.loads(row["data"])
+                measurements = {measurement_id: (data, _age_band(json.loads(row["info"])))}
+            data, band = measurements[measurement_id]
+            is_affected = stratum_changes is None or any(
+                (hand, band, id) in stratum_changes
+                for id, hand in _measured_keys(data, background_hand)
+            )
+        if not is_affected:
+            unchanged.append(
+                (norms_cube.version, measurement_id, sex, instrument, int(background_hand)))
+            continue
+
+        columns = strata.setdefault(
+            (sex, instrument, background_hand, band),
+            {"measurement_id": [], "id": [], "left": [], "right": []})
+        keys = list(data["id"])
+        columns["measurement_id"].extend([measurement_id] * len(keys))
+        for column in ["id", "left", "right"]:
+            columns[column].extend(data[column].get(key) for key in keys)
+        old_scores[(measurement_id, sex, instrument, background_hand)] = (
+            row["subject"], row["measured_on"], json.loads(row["deciles"]))
+
+    with connection:
+        connection.executemany(
+            """
+            UPDATE scores SET norms_version = ?
+            WHERE measurement_id = ? AND sex = ? AND instrument = ? AND background_hand = ?
+            """,
+            unchanged
+        )
+
+    moved = []
+    for (sex, instrument, background_hand, band), columns in strata.items():
+        # All measurements of a stratum and age band in one pass
+        scored = norms_cube.score(
+            pd.DataFrame(columns), instrument, sex, band, background_hand,
+            keys=["measurement_id"])
+        scores = {measurement_id: [] for measurement_id in columns["measurement_id"]}
+        for record in scored.to_dict(orient="records"):
+            scores[record.pop("measurement_id")].append(record)
+        store_scores(connection, scores, sex, instrument, background_hand, norms_cube)
+
+        for measurement_id, deciles in scores.items():
+            subject, measured_on, old = old_scores[
+                (measurement_id, sex, instrument, background_hand)]
+            moved.extend(
+                (subject, measured_on, instrument, sex, background_hand, *change)
+                for change in _moved_deciles(old, deciles)
+            )
+
+    return pd.DataFrame(moved, columns=[
+        "subject", "measured_on", "instrument", "sex", "background_hand",
+        "id", "hand", "old", "new",
+    ])
+
+###################
+# Bulk ingest #####
+###################
+
+
+def read_measurement_entry(filename: str, content: bytes) -> dict:
+    is_success, result = read_workbook(io.BytesIO(content), filename)
+    if not is_success:
+        return {"filename": filename, "ok": False, "error": str(result)}
+    return {"filename": filename, "ok": True, "measurement": result}
+
+
+def ingest(source: str, path: str = None, max_workers: int = None) -> tuple:
+    """Parse all workbooks of a directory or zip archive into the archive.
+
+    Workbooks are parsed in a worker pool and inserted in batches.
+    Returns (number of new measurements, errors).
+    """
+    batch_size = 500
+
+    n_added = 0
+    errors = []
+    batch = []
+    with closing(connect(path)) as connection:
+        for result in map_workbook_entries(
+            iter_source_entries(source),
+            read_measurement_entry,
+            max_workers=max_workers,
+        ):
+            if not result["ok"]:
+                errors.append(f"{result['filename']}: {result['error']}")
+                continue
+            batch.append(result["measurement"])
+            if len(batch) >= batch_size:
+                n_added += add_measurements(connection, batch)
+                batch = []
+        n_added += add_measurements(connection, batch)
+    return n_added, errors
+
+###################
+# Main ############
+###################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archiv der Messungen")
+    parser.add_argument("--archive", default=None,
+                        help="Pfad des Archivs, sonst HANDPROFIL_ARCHIVE_PATH")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser(
+        "ingest", help="Alle .xlsx Messungen eines Ordners oder einer Zip-Datei speichern")
+    ingest_parser.add_argument("source")
+    ingest_parser.add_argument("--workers", type=int, default=None)
+    profiles_parser = commands.add_parser(
+        "profiles", help="Profile aller Messungen für die Suche ähnlicher Profile berechnen")
+    profiles_parser.add_argument("--sex", choices=["m", "w"], required=True)
+    profiles_parser.add_argument("--instrument", required=True)
+    profiles_parser.add_argument("--no-background-hand", action="store_true",
+                                 help="Fehlenden Hintergrund nicht durch andere Hand ersetzen")
+    rescore_parser = commands.add_parser(
+        "rescore", help="Gespeicherte Dezile nach Änderung der Normdaten neu berechnen")
+    rescore_parser.add_argument("--report", default=None,
+                                help="Verschobene Dezile als .csv speichern")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "rescore":
+        with closing(connect(args.archive)) as connection:
+            moved = rescore(connection)
+        if args.report:
+            moved.to_csv(args.report, index=False)
+        print(
+            f"{len(moved)} verschobene Dezile bei {moved['subject'].nunique()} Personen "
+            f"in {time.perf_counter() - start:.1f} s")
+        return 0
+
+    if args.command == "profiles":
+        with closing(connect(args.archive)) as connection:
+            n_added = store_missing_profiles(
+                connection, args.sex, args.instrument, not args.no_background_hand)
+        print(f"{n_added} neue Profile in {time.perf_counter() - start:.1f} s")
+        return 0
+
+    n_added, errors = ingest(args.source, args.archive, args.workers)
+    for error in errors:
+        print(error, file=sys.stderr)
+    print(f"{n_added} neue Messungen in {time.perf_counter() - start:.1f} s, {len(errors)} Fehler")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+// Direct upload of workbooks
+//
+// Clicking an element with data-upload-url opens a file dialog. The
+// selected files are posted as raw request body, one request per file,
+// instead of being base64 encoded into the callback payload like with
+// dcc.Upload. The server answers with tokens, which are written to the
+// store named in data-upload-target. With data-upload-mode="multipart"
+// all files are sent together in one multipart request.
+
+async function uploadFile(url, file) {
+    try {
+        const response = await fetch(url, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {
+                "Content-Type": "application/octet-stream",
+                "X-Filename": encodeURIComponent(file.name),
+            },
+            body: file,
+        });
+        if (!response.ok) {
+            return { tokens: [], errors: [`${file.name}: ${response.statusText}`] };
+        }
+        return await response.json();
+    } catch (error) {
+        return { tokens: [], errors: [`${file.name}: ${error}`] };
+    }
+}
+
+async function uploadMultipart(url, files) {
+    const form = new FormData();
+    files.forEach((file) => form.append("file", file, file.name));
+    try {
+        const response = await fetch(url, {
+            method: "POST",
+            credentials: "same-origin",
+            body: form,
+        });
+        if (!response.ok) {
+            return { tokens: [], errors: [response.statusText] };
+        }
+        return await response.json();
+    } catch (error) {
+        return { tokens: [], errors: [`${error}`] };
+    }
+}
+
+async function uploadFiles(trigger, files) {
+    files = Array.from(files);
+    const results = trigger.dataset.uploadMode === "multipart"
+        ? [await uploadMultipart(trigger.dataset.uploadUrl, files)]
+        : await Promise.all(
+            files.map((file) => uploadFile(trigger.dataset.uploadUrl, file))
+        );
+
+    window.dash_clientside.set_props(trigger.dataset.uploadTarget, {
+        data: {
+            tokens: results.flatMap((result) => result.tokens),
+            errors: results.flatMap((result) => result.errors),
+        },
+    });
+}
+
+document.addEventListener("click", (event) => {
+    const trigger = event.target.closest("[data-upload-url]");
+    if (!trigger) {
+        return;
+    }
+
+    const input = document.createElement("input");
+    input.type = "file";
+    input.multiple = true;
+    input.accept = trigger.dataset.uploadAccept || "";
+    input.addEventListener("change", () => uploadFiles(trigger, input.files));
+    input.click();
+});
@@ -0,0 +1,35 @@
+// Show or hide hands without a server request
+//
+// Figures contain the traces of all hands, each trace has its file and
+// hand in meta (see handprofil.plots.return_file_trace). Toggling a
+// hand chip only sets the visibility of the matching traces.
+
+function isHandShown(hands, meta) {
+    const shown = hands[meta.file_id];
+    return shown === undefined || shown === null || shown.includes(meta.hand);
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    handprofil: {
+        showHands: function (hands, figures) {
+            return figures.map((figure) => {
+                if (!figure || !figure.data) {
+                    return window.dash_clientside.no_update;
+                }
+                let changed = false;
+                const data = figure.data.map((trace) => {
+                    if (!trace.meta) {
+                        return trace;
+                    }
+                    const visible = isHandShown(hands, trace.meta);
+                    if ((trace.visible !== false) === visible) {
+                        return trace;
+                    }
+                    changed = true;
+                    return { ...trace, visible: visible };
+                });
+                return changed ? { ...figure, data: data } : window.dash_clientside.no_update;
+            });
+        },
+    },
+});
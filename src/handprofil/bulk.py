@@ -0,0 +1,311 @@
+###################
+### Imports ######
+###################
+
+import io
+import multiprocessing
+import os
+import struct
+import zipfile
+import zlib
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.scoring import read_workbook, score_keys
+
+
+###################
+# Constants #
+###################
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Guard against zip bombs, a filled workbook is well below 1 MB
+MAX_ENTRY_SIZE = 50 * 1024 * 1024
+
+###################
+# Zip stream ######
+###################
+
+
+class _PushbackReader:
+    """Minimal reader over a non-seekable stream which allows unreading."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b""
+
+    def read_some(self, size: int) -> bytes:
+        if self.buffer:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_upto(self, size: int) -> bytes:
+        parts = []
+        missing = size
+        while missing > 0:
+            data = self.read_some(missing)
+            if not data:
+                break
+            parts.append(data)
+            missing -= len(data)
+        return b"".join(parts)
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.read_upto(size)
+        if len(data) != size:
+            raise ValueError("Unerwartetes Ende des Zip-Archivs")
+        return data
+
+    def unread(self, data: bytes):
+        self.buffer = data + self.buffer
+
+
+def _zip64_sizes(extra: bytes, compressed_size: int, uncompressed_size: int):
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, position)
+        if header_id == 0x0001:
+            values = extra[position + 4:position + 4 + length]
+            sizes = [uncompressed_size, compressed_size]
+            offset = 0
+            for i, size in enumerate(sizes):
+                if size == 0xFFFFFFFF and offset + 8 <= len(values):
+                    sizes[i] = struct.unpack_from("<Q", values, offset)[0]
+                    offset += 8
+            return True, sizes[1], sizes[0]
+        position += 4 + length
+    return False, compressed_size, uncompressed_size
+
+
+def _inflate(reader: _PushbackReader, max_size: int) -> bytes:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    parts = []
+    size = 0
+    while not decompressor.eof:
+        chunk = reader.read_some(READ_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("Unerwartetes Ende des Zip-Archivs")
+        data = decompressor.decompress(chunk, max_size - size + 1)
+        size += len(data)
+        if size > max_size or decompressor.unconsumed_tail:
+            raise ValueError("Datei im Zip-Archiv ist zu gross")
+        parts.append(data)
+    reader.unread(decompressor.unused_data)
+    return b"".join(parts)
+
+
+def iter_zip_entries(stream, max_entry_size: int = MAX_ENTRY_SIZE):
+    """Yield (filename, content) of a zip archive read from a stream.
+
+    Entries are read sequentially from their local file headers, so the
+    stream does not need to be seekable and the central directory at the
+    end of the archive is never required. Only one entry is held in memory
+    at a time. Archives written by streaming zip tools, which defer sizes
+    to a data descriptor, are supported for deflated entries.
+    """
+    reader = _PushbackReader(stream)
+    while True:
+        signature = reader.read_upto(4)
+        if signature != LOCAL_FILE_HEADER:
+            # Central directory (or end of stream) reached
+            return
+
+        (
+            _version, flags, method, _time, _date,
+            crc, compressed_size, uncompressed_size,
+            name_length, extra_length
+        ) = struct.unpack("<HHHHHIIIHH", reader.read_exact(26))
+        encoding = "utf-8" if flags & 0x800 else "cp437"
+        filename = reader.read_exact(name_length).decode(encoding)
+        is_zip64, compressed_size, uncompressed_size = _zip64_sizes(
+            reader.read_exact(extra_length), compressed_size, uncompressed_size)
+
+        if flags & 0x1:
+            raise ValueError(f"Verschlüsselte Datei im Zip-Archiv: {filename}")
+
+        has_descriptor = bool(flags & 0x8)
+        if method == zipfile.ZIP_DEFLATED:
+            content = _inflate(reader, max_entry_size)
+        elif method == zipfile.ZIP_STORED and not has_descriptor:
+            if compressed_size > max_entry_size:
+                raise ValueError("Datei im Zip-Archiv ist zu gross")
+            content = reader.read_exact(compressed_size)
+        else:
+            raise ValueError(
+                f"Nicht unterstützte Komprimierung im Zip-Archiv: {filename}")
+
+        if has_descriptor:
+            signature = reader.read_exact(4)
+            if signature != DATA_DESCRIPTOR:
+                reader.unread(signature)
+            crc = struct.unpack("<I", reader.read_exact(4))[0]
+            reader.read_exact(16 if is_zip64 else 8)
+
+        if zlib.crc32(content) != crc:
+            raise ValueError(f"Prüfsumme stimmt nicht: {filename}")
+
+        yield filename, content
+
+
+def is_workbook_entry(filename: str) -> bool:
+    basename = os.path.basename(filename)
+    return filename.lower().endswith(".xlsx")\
+        and not filename.startswith("__MACOSX/")\
+        and not basename.startswith("~$")\
+        and not basename.startswith(".")
+
+
+def iter_directory_entries(directory: str):
+    """Yield (filename, content) of all workbooks below `directory`."""
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            if not is_workbook_entry(os.path.relpath(path, directory)):
+                continue
+            with open(path, "rb") as file:
+                yield os.path.relpath(path, directory), file.read()
+
+
+def iter_source_entries(source: str):
+    """Yield (filename, content) of a zip archive or a directory."""
+    if os.path.isdir(source):
+        yield from iter_directory_entries(source)
+    else:
+        with open(source, "rb") as stream:
+            yield from iter_zip_entries(stream)
+
+###################
+# Worker pool #####
+###################
+
+
+_worker_cube = None
+_worker_background = None
+
+
+def _init_worker(
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    norms: str = DEFAULT_DATASET,
+    score_mode: str = "decile",
+):
+    global _worker_cube, _worker_background
+    # Only the norms in use are loaded into each worker
+    _worker_cube = NormsDatasets(maxsize=1).get(norms)
+    _worker_background = (instrument, sex, background_hand, score_mode)
+
+
+def _read_entry(filename: str, content: bytes) -> tuple:
+    is_success, result = read_workbook(io.BytesIO(content), filename)
+    if not is_success:
+        return None, {"filename": filename, "ok": False, "error": str(result)}
+
+    # Dates are serialized by the route, see utils.json_default
+    info = {
+        int(key): value
+        for key, value in zip(result["info"]["id"].values(), result["info"]["value"].values())
+    }
+    return result, {"filename": filename, "ok": True, "subject": info.get(1), "info": info}
+
+
+def read_workbook_entry(filename: str, content: bytes) -> dict:
+    result, summary = _read_entry(filename, content)
+    if result is None:
+        return summary
+
+    data = pd.DataFrame.from_dict(result["data"])
+    return {**summary, "data": data[["id", "left", "right"]].to_dict(orient="list")}
+
+
+def score_workbook_entry(filename: str, content: bytes) -> dict:
+    result, summary = _read_entry(filename, content)
+    if result is None:
+        return summary
+
+    scores = _worker_cube.score_measurement(result, *_worker_background)
+
+    # Scores are named by mode, e.g. "deciles"
+    key = score_keys[_worker_background[-1]]
+    return {**summary, key: scores.astype({"id": int}).to_dict(orient="records")}
+
+
+def map_workbook_entries(
+    entries,
+    function,
+    initializer=None,
+    initargs: tuple = (),
+    max_workers: int = None,
+    max_pending: int = None,
+):
+    """Apply `function(filename, content)` to workbooks in a worker pool.
+
+    `entries` yields (filename, content), e.g. `iter_zip_entries`. Entries
+    are submitted while they are still being received and results are
+    yielded as soon as a workbook is done, in completion order. At most
+    `max_pending` entries are in flight, which bounds the memory
+    independent of the number of entries.
+    """
+    max_workers = max_workers or int(
+        os.getenv("HANDPROFIL_BULK_WORKERS", os.cpu_count() or 1))
+    max_pending = max_pending or 2 * max_workers
+
+    # Spawn instead of fork, the web server process may run threads
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+    pending = set()
+    try:
+        try:
+            for filename, content in entries:
+                if not is_workbook_entry(filename):
+                    continue
+
+                pending.add(pool.submit(function, filename, content))
+                del content
+
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                else:
+                    done = {future for future in pending if future.done()}
+                    pending = pending - done
+                for future in done:
+                    yield future.result()
+        except (ValueError, zlib.error) as e:
+            yield {"filename": None, "ok": False, "error": str(e)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def score_zip_stream(
+    stream,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    max_workers: int = None,
+    max_pending: int = None,
+    norms: str = DEFAULT_DATASET,
+    score_mode: str = "decile",
+):
+    """Score all workbooks of a streamed zip archive in a worker pool."""
+    return map_workbook_entries(
+        iter_zip_entries(stream),
+        score_workbook_entry,
+        initializer=_init_worker,
+        initargs=(sex, instrument, background_hand, norms, score_mode),
+        max_workers=max_workers,
+        max_pending=max_pending,
+    )
@@ -0,0 +1,75 @@
+###################
+### Imports ######
+###################
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from handprofil.utils import json_default
+
+
+###################
+# Methods #########
+###################
+
+
+def cache_key(*parts) -> str:
+    """Stable key of JSON serializable parts, e.g. the inputs of a figure."""
+    serialized = json.dumps(parts, sort_keys=True, default=json_default)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class LRUCache:
+    """Least recently used cache with a fixed number of entries.
+
+    The cache can be shared by the threads of a server process. Entries
+    are handed out as they are, so they must not be modified.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_build(self, key: str, build):
+        """Return the entry of `key`, calling `build()` if it is missing.
+
+        `build` runs without holding the lock, threads missing the same
+        key at once may both build it, the first entry stored wins.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = build()
+
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def put(self, key: str, value):
+        """Store `value` under `key`, replacing an older entry."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
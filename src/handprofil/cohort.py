@@ -0,0 +1,111 @@
+###################
+### Imports ######
+###################
+
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from handprofil.bulk import map_workbook_entries, read_workbook_entry
+from handprofil.scoring import bin_values
+from handprofil.uploads import (
+    UPLOAD_DIRECTORY,
+    TOKEN_PATTERN,
+    remove_expired_uploads,
+)
+
+
+###################
+# Constants #
+###################
+
+n_bins = 19
+
+###################
+# Methods #########
+###################
+
+
+def collect_cohort(entries, **kwargs) -> tuple:
+    """Read workbooks given as (filename, content) into one long frame.
+
+    Returns (values, errors) with columns subject, id, hand and value
+    and a list of error messages for rejected workbooks.
+    """
+    ids = []
+    lefts = []
+    rights = []
+    subjects = []
+    errors = []
+    for result in map_workbook_entries(entries, read_workbook_entry, **kwargs):
+        if not result["ok"]:
+            errors.append(f"{result['filename']}: {result['error']}")
+            continue
+        data = result["data"]
+        ids.append(np.asarray(data["id"], dtype=np.int64))
+        lefts.append(np.asarray(data["left"], dtype=np.float64))
+        rights.append(np.asarray(data["right"], dtype=np.float64))
+        subjects.append(np.full(len(data["id"]), len(subjects)))
+
+    if not subjects:
+        return pd.DataFrame(columns=["subject", "id", "hand", "value"]), errors
+
+    wide = pd.DataFrame({
+        "subject": np.concatenate(subjects),
+        "id": np.concatenate(ids),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+    })
+    values = wide\
+        .melt(id_vars=["subject", "id"], value_vars=["left", "right"], var_name="hand")\
+        .dropna(subset=["value"])\
+        .reset_index(drop=True)
+    return values, errors
+
+
+def _cohort_path(token: str) -> str:
+    return os.path.join(UPLOAD_DIRECTORY, f"{token}.parquet")
+
+
+def store_cohort(values: pd.DataFrame) -> str:
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    remove_expired_uploads()
+
+    token = uuid.uuid4().hex
+    temporary_path = _cohort_path(token) + ".tmp"
+    values.to_parquet(temporary_path, index=False)
+    os.replace(temporary_path, _cohort_path(token))
+    return token
+
+
+def load_cohort(token: str):
+    """Return the values of a stored cohort, None if the token is unknown."""
+    if not isinstance(token, str) or not TOKEN_PATTERN.match(token):
+        return None
+    try:
+        values = pd.read_parquet(_cohort_path(token))
+        # Keep cohorts in use from expiring
+        os.utime(_cohort_path(token))
+    except FileNotFoundError:
+        return None
+    return values
+
+
+def cohort_decile_counts(values: pd.DataFrame, bin_edges: pd.DataFrame) -> pd.DataFrame:
+    """Count subjects per attribute, hand and decile bin.
+
+    All values are binned in one batched pass. Returns a frame indexed
+    by (id, hand) with one column per bin 1..19.
+    """
+    binned = bin_values(values, bin_edges)
+
+    index = pd.MultiIndex.from_frame(binned[["id", "hand"]])
+    codes, uniques = pd.factorize(index)
+    counts = np.zeros((len(uniques), n_bins), dtype=np.int64)
+    np.add.at(counts, (codes, binned["value"].to_numpy() - 1), 1)
+
+    return pd.DataFrame(
+        counts,
+        index=pd.MultiIndex.from_tuples(uniques, names=["id", "hand"]),
+        columns=range(1, n_bins + 1)
+    ).sort_index()
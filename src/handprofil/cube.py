@@ -0,0 +1,351 @@
+"""Norms as a dense array over all strata.
+
+Edges of background.csv are stored in one array with the axes
+instrument x sex x hand x age band x attribute x bin edge, each axis
+coded by integers. Empty cells are filled from a coarser stratum when
+the cube is built, so scoring a measurement only indexes the array,
+no matter how many strata there are.
+"""
+
+###################
+### Imports ######
+###################
+
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from handprofil.scoring import return_scores
+
+
+###################
+# Constants #
+###################
+
+AXES = ["instrument", "sex", "hand", "age_band", "id"]
+
+# Band of all ages, used by norms without age stratification
+ALL_AGES = "alle"
+
+# Lower bounds in years of the age bands
+age_bands = {
+    "unter 12": 0,
+    "12-17": 12,
+    "18-29": 18,
+    "30-49": 30,
+    "ab 50": 50,
+}
+
+# Coarser stratum of an axis, used for cells without edges
+fallbacks = {
+    "age_band": ALL_AGES,
+}
+
+n_bin_edges = 9
+
+###################
+# Age #############
+###################
+
+
+def age_in_years(birth_date, measurement_date):
+    """Completed years at the measurement, None if a date is missing."""
+    birth = pd.to_datetime(birth_date, errors="coerce")
+    measured = pd.to_datetime(measurement_date, errors="coerce")
+    if pd.isna(birth) or pd.isna(measured):
+        return None
+    had_birthday = (measured.month, measured.day) >= (birth.month, birth.day)
+    return measured.year - birth.year - (not had_birthday)
+
+
+def age_band(age) -> str:
+    if age is None or pd.isna(age) or age < 0:
+        return ALL_AGES
+    lower_bounds = list(age_bands.values())
+    return list(age_bands)[np.searchsorted(lower_bounds, age, side="right") - 1]
+
+
+def measurement_age_band(info: pd.Series) -> str:
+    """Age band of a measurement from its info values by id."""
+    return age_band(age_in_years(info.get(5), info.get(2)))
+
+###################
+# Cube ############
+###################
+
+
+class NormsCube:
+    """Decile edges of all strata as one array with coded axes.
+
+    `version` is a hash of labels and edges, scores computed with equal
+    versions are equal.
+    """
+
+    def __init__(self, edges: np.ndarray, labels: dict):
+        # Cubes are shared by all threads of a server process
+        edges.setflags(write=False)
+        self.edges = edges
+        self.labels = labels
+        self.version = hashlib.sha256(
+            json.dumps(labels, sort_keys=True, default=str).encode() + edges.tobytes()
+        ).hexdigest()[:16]
+        self.codes = {
+            axis: {label: code for code, label in enumerate(axis_labels)}
+            for axis, axis_labels in labels.items()
+        }
+        # Attribute ids are small integers, look them up in an array
+        ids = np.asarray(labels["id"], dtype=np.int64)
+        self._id_codes = np.full(ids.max() + 1 if len(ids) else 1, -1, dtype=np.int64)
+        self._id_codes[ids] = np.arange(len(ids))
+        self._id_codes.setflags(write=False)
+
+    @classmethod
+    def from_frame(cls, background_data: pd.DataFrame):
+        """Cube of background data in the schema of background.csv.
+
+        Background data without the column age_band is for all ages.
+        """
+        background_data = background_data\
+            .reindex(columns=AXES + ["bin_edge", "value"])\
+            .fillna({"age_band": ALL_AGES})\
+            .astype({
+                "instrument": str,
+                "sex": str,
+                "hand": str,
+                "age_band": str,
+                "id": np.int64,
+                "bin_edge": np.int64,
+                "value": np.float64,
+            })
+
+        labels = {axis: sorted(background_data[axis].unique()) for axis in AXES}
+        labels["hand"] = ["left", "right"]
+        labels["age_band"] = [ALL_AGES] + list(age_bands)
+
+        codes = [
+            pd.Categorical(background_data[axis], categories=labels[axis]).codes
+            for axis in AXES
+        ]
+        is_known = np.all([code >= 0 for code in codes], axis=0)
+
+        edges = np.full(
+            [len(labels[axis]) for axis in AXES] + [n_bin_edges], np.nan)
+        index = tuple(code[is_known] for code in codes) \
+            + (background_data["bin_edge"].to_numpy()[is_known] - 1,)
+        edges[index] = background_data["value"].to_numpy()[is_known]
+
+        for axis, label in fallbacks.items():
+            position = AXES.index(axis)
+            coarser = np.take(
+                edges, [labels[axis].index(label)], axis=position)
+            is_empty = np.isnan(edges).all(axis=-1, keepdims=True)
+            edges = np.where(is_empty, coarser, edges)
+
+        return cls(edges, labels)
+
+    def _edge_table(self) -> pd.DataFrame:
+        """Edges of non-empty cells, indexed by the labels of AXES."""
+        index = pd.MultiIndex.from_product(
+            [self.labels[axis] for axis in AXES], names=AXES)
+        edges = pd.DataFrame(
+            self.edges.reshape(-1, n_bin_edges),
+            index=index,
+            columns=pd.Index(np.arange(1, n_bin_edges + 1), name="bin_edge"),
+        )
+        return edges.dropna(how="all")
+
+    def to_frame(self) -> pd.DataFrame:
+        """Edges in the schema of background.csv, builds an equal cube.
+
+        Cells filled from a coarser stratum are included.
+        """
+        return self._edge_table()\
+            .reset_index()\
+            .melt(id_vars=AXES, var_name="bin_edge", value_name="value")\
+            .dropna(subset=["value"])\
+            .sort_values(AXES + ["bin_edge"], ignore_index=True)
+
+    def diff(self, other) -> pd.DataFrame:
+        """Cells whose edges differ in `other`, with the columns of AXES.
+
+        Cells only present in one of both cubes have changed as well.
+        """
+        old, new = self._edge_table().align(other._edge_table(), join="outer")
+        is_equal = ((old == new) | (old.isna() & new.isna())).all(axis=1)
+        return is_equal.index[~is_equal].to_frame(index=False)
+
+    def _gather(
+        self,
+        instruments: list,
+        sex: str,
+        age_band: str,
+        ids: np.ndarray,
+        hands: np.ndarray,
+        background_hand: bool,
+    ) -> np.ndarray:
+        """Edges per instrument and (id, hand), shape instruments x rows x edges."""
+        ids = np.asarray(ids, dtype=np.int64)
+        result = np.full((len(instruments), len(ids), n_bin_edges), np.nan)
+
+        instrument_codes = np.array(
+            [self.codes["instrument"].get(instrument, -1) for instrument in instruments],
+            dtype=np.int64)
+        sex = self.codes["sex"].get(sex)
+        age_band = self.codes["age_band"].get(age_band, 0)
+        has_instrument = instrument_codes >= 0
+        if sex is None or not has_instrument.any():
+            return result
+
+        is_known = (ids >= 0) & (ids < len(self._id_codes))
+        id_codes = np.where(is_known, self._id_codes[np.where(is_known, ids, 0)], -1)
+        is_known = id_codes >= 0
+        hand_codes = (np.asarray(hands) == "right").astype(np.int64)
+
+        # All instruments are indexed at once, broadcast over the rows
+        strata = self.edges[instrument_codes[has_instrument], sex, :, age_band]
+        edges = strata[:, hand_codes[is_known], id_codes[is_known]]
+        if background_hand:
+            # Fill left or right hand background value if not available
+            other = strata[:, 1 - hand_codes[is_known], id_codes[is_known]]
+            edges = np.where(np.isnan(edges), other, edges)
+        result[np.ix_(has_instrument, is_known)] = edges
+        return result
+
+    def lookup(
+        self,
+        instrument: str,
+        sex: str,
+        age_band: str,
+        ids: np.ndarray,
+        hands: np.ndarray,
+        background_hand: bool,
+    ) -> np.ndarray:
+        """Edges of one row per (id, hand), NaN without background."""
+        return self._gather([instrument], sex, age_band, ids, hands, background_hand)[0]
+
+    def bin_edges(
+        self,
+        instrument: str,
+        sex: str,
+        age_band: str,
+        background_hand: bool,
+    ) -> pd.DataFrame:
+        """Edges of one stratum as one row per (id, hand), columns are the bin edges."""
+        index = pd.MultiIndex.from_product(
+            [self.labels["id"], self.labels["hand"]], names=["id", "hand"])
+        edges = self.lookup(
+            instrument, sex, age_band,
+            index.get_level_values("id"), index.get_level_values("hand"), background_hand)
+        has_background = ~np.isnan(edges).all(axis=1)
+        return pd.DataFrame(
+            edges[has_background],
+            index=index[has_background],
+            columns=pd.Index(np.arange(1, n_bin_edges + 1), name="bin_edge"),
+        )
+
+    @staticmethod
+    def _melt(data: pd.DataFrame, keys: list = ()) -> pd.DataFrame:
+        return data\
+            .astype({
+                "id": np.int64,
+                "left": np.float64,
+                "right": np.float64
+            })\
+            .melt(id_vars=[*keys, "id"], value_vars=["left", "right"], var_name="hand")\
+            .dropna(subset=["value"])\
+            .sort_values([*keys, "id", "hand"], ignore_index=True)
+
+    def score(
+        self,
+        data: pd.DataFrame,
+        instrument: str,
+        sex: str,
+        age_band: str,
+        background_hand: bool,
+        mode: str = "decile",
+        keys: list = (),
+    ) -> pd.DataFrame:
+        """Score left and right values as a flat frame with columns id, hand and value.
+
+        `mode` is one of `score_modes`, values which cannot be scored
+        in a continuous mode are dropped like those without background.
+        Columns `keys` of `data` are kept, e.g. to score the rows of
+        many measurements in one pass.
+        """
+        data = self._melt(data, keys)
+
+        edges = self.lookup(
+            instrument, sex, age_band,
+            data["id"].to_numpy(), data["hand"].to_numpy(), background_hand)
+
+        # Only process IDs with available background
+        has_background = ~np.isnan(edges).all(axis=1)
+        data = data[has_background].reset_index(drop=True)
+        if not data.empty:
+            data["value"] = return_scores(
+                edges[has_background], data["value"].to_numpy(), mode)
+        return data.dropna(subset=["value"]).reset_index(drop=True)
+
+    def score_measurement(
+        self,
+        measurement: dict,
+        instrument: str,
+        sex: str,
+        background_hand: bool,
+        mode: str = "decile",
+    ) -> pd.DataFrame:
+        """Score a parsed workbook in the age band of the subject.
+
+        Measurements without info are scored with the norms of all ages.
+        """
+        return self.score(
+            pd.DataFrame.from_dict(measurement["data"]),
+            instrument,
+            sex,
+            self._age_band(measurement),
+            background_hand,
+            mode,
+        )
+
+    def score_instruments(
+        self,
+        measurement: dict,
+        instruments: list,
+        sex: str,
+        background_hand: bool,
+        mode: str = "decile",
+    ) -> pd.DataFrame:
+        """Score a parsed workbook against several instruments at once.
+
+        The edges of all instruments are looked up together and scored
+        in one pass. Returns the columns instrument, id, hand and value,
+        without rows lacking background.
+        """
+        data = self._melt(pd.DataFrame.from_dict(measurement["data"]))
+        edges = self._gather(
+            instruments, sex, self._age_band(measurement),
+            data["id"].to_numpy(), data["hand"].to_numpy(), background_hand)
+
+        scores = pd.DataFrame({
+            "instrument": np.repeat(instruments, len(data)),
+            "id": np.tile(data["id"].to_numpy(), len(instruments)),
+            "hand": np.tile(data["hand"].to_numpy(), len(instruments)),
+            "value": np.nan,
+        })
+        edges = edges.reshape(-1, n_bin_edges)
+        has_background = ~np.isnan(edges).all(axis=1)
+        if has_background.any():
+            scores.loc[has_background, "value"] = return_scores(
+                edges[has_background],
+                np.tile(data["value"].to_numpy(), len(instruments))[has_background],
+                mode,
+            )
+        scores = scores.dropna(subset=["value"]).reset_index(drop=True)
+        return scores.astype({"value": np.int64}) if mode == "decile" else scores
+
+    @staticmethod
+    def _age_band(measurement: dict) -> str:
+        if not measurement.get("info"):
+            return ALL_AGES
+        info = pd.DataFrame.from_dict(measurement["info"]).set_index("id")["value"]
+        return measurement_age_band(info)
@@ -0,0 +1,92 @@
+"""Named norms datasets, e.g. one per conservatory.
+
+The default dataset is config/background.csv, further datasets are the
+files <name>.csv in HANDPROFIL_NORMS_DIRECTORY. Datasets are loaded on
+first use and at most HANDPROFIL_NORMS_RESIDENT of them are kept in
+memory, the least recently used one is dropped first.
+"""
+
+###################
+### Imports ######
+###################
+
+import os
+import re
+import threading
+import time
+from handprofil.cache import LRUCache
+from handprofil.cube import NormsCube
+from handprofil.static_data import read_background
+from handprofil.utils import get_absolute_path
+
+
+###################
+# Constants #
+###################
+
+DEFAULT_DATASET = "standard"
+
+NORMS_DIRECTORY = os.getenv(
+    "HANDPROFIL_NORMS_DIRECTORY", get_absolute_path("src/handprofil/config/norms"))
+
+MAX_RESIDENT = int(os.getenv("HANDPROFIL_NORMS_RESIDENT", 4))
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+###################
+# Methods #########
+###################
+
+
+class NormsDatasets:
+    """Lazily loaded norms cubes by dataset name."""
+
+    def __init__(self, directory: str = None, maxsize: int = MAX_RESIDENT):
+        self.directory = directory or NORMS_DIRECTORY
+        self._cubes = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def names(self) -> list:
+        names = []
+        if os.path.isdir(self.directory):
+            names = sorted(
+                filename[:-len(".csv")] for filename in os.listdir(self.directory)
+                if filename.endswith(".csv") and NAME_PATTERN.match(filename[:-len(".csv")])
+            )
+        return [DEFAULT_DATASET] + [name for name in names if name != DEFAULT_DATASET]
+
+    def path(self, name: str) -> str:
+        """Path of a dataset, None if there is no dataset with this name."""
+        if name == DEFAULT_DATASET:
+            return get_absolute_path("src/handprofil/config/background.csv")
+        if not isinstance(name, str) or not NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, f"{name}.csv")
+        return path if os.path.isfile(path) else None
+
+    def _load(self, path: str) -> NormsCube:
+        start = time.perf_counter()
+        cube = NormsCube.from_frame(read_background(path))
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - start
+        return cube
+
+    def get(self, name: str) -> NormsCube:
+        """Cube of a dataset, raises KeyError for unknown names."""
+        path = self.path(name)
+        if path is None:
+            raise KeyError(name)
+        return self._cubes.get_or_build(name, lambda: self._load(path))
+
+    def metrics(self) -> dict:
+        return {
+            "resident": len(self._cubes),
+            "maxsize": self._cubes.maxsize,
+            "hits": self._cubes.hits,
+            "misses": self._cubes.misses,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 4),
+        }
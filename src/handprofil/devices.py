@@ -0,0 +1,244 @@
+"""Read raw exports of the measuring devices instead of workbooks.
+
+An export is a CSV file with one row per sample, optionally preceded
+by metadata lines with the descriptions of meta_attributes.csv:
+    # ID: TM24
+    # Datum: 2024-02-12
+    # Geburtsdatum: 1996-01-10
+    id,hand,value,time
+    201,L,35.2,0.01
+Columns other than id, hand and value are ignored. The samples of an
+attribute are reduced to one value per hand, depending on the device
+of the attribute (see device_reductions). Exports are parsed block by
+block, memory only depends on the block size. Scoring of exports:
+    python -m handprofil.devices exports/ --sex m --instrument violine
+"""
+
+###################
+### Imports ######
+###################
+
+import argparse
+import json
+import os
+import sys
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as csv
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.schemas import validate_workbooks
+from handprofil.scoring import score_keys, score_modes
+from handprofil.static_data import read_static_config
+from handprofil.utils import json_default
+
+
+###################
+# Constants #
+###################
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Reduction of the samples of an attribute to one value, by device.
+# Manual readings are repeated and averaged, the wrist machine logs
+# time series whose peak is the measurement.
+device_reductions = {
+    "Handlabor": "mean",
+    "Handgelenk": "max",
+}
+
+hand_labels = {
+    "l": "left",
+    "left": "left",
+    "links": "left",
+    "r": "right",
+    "right": "right",
+    "rechts": "right",
+}
+
+###################
+# Parsing #########
+###################
+
+
+def read_export_header(stream) -> tuple:
+    """Read the metadata lines and the column names of an export.
+
+    Returns (metadata by description, column names), the stream is
+    positioned at the first sample.
+    """
+    metadata = {}
+    for line in stream:
+        line = line.decode("utf-8-sig").strip()
+        if not line.startswith("#"):
+            return metadata, [name.strip() for name in line.split(",")]
+        key, _, value = line.lstrip("#").partition(":")
+        metadata[key.strip()] = value.strip()
+    return metadata, []
+
+
+def iter_blocks(stream, block_size: int = BLOCK_SIZE):
+    """Blocks of whole lines of about `block_size` bytes."""
+    rest = b""
+    while True:
+        chunk = stream.read(block_size)
+        if not chunk:
+            break
+        block = rest + chunk
+        end = block.rfind(b"\n") + 1
+        if end == 0:
+            rest = block
+            continue
+        rest = block[end:]
+        yield block[:end]
+    if rest.strip():
+        yield rest
+
+
+def reduce_export(stream, column_names: list, block_size: int = BLOCK_SIZE) -> pd.DataFrame:
+    """Sum, count, min and max of the samples per (id, hand label).
+
+    Every block is parsed and aggregated on its own, only the partial
+    results are kept until all blocks are read. Exports are numeric, a
+    quoted value with a line break would be split between blocks.
+    """
+    read_options = csv.ReadOptions(column_names=column_names)
+    convert_options = csv.ConvertOptions(
+        include_columns=["id", "hand", "value"],
+        column_types={"id": pa.int64(), "hand": pa.string(), "value": pa.float64()},
+    )
+    aggregations = [("value", "sum"), ("value", "count"), ("value", "min"), ("value", "max")]
+    partials = [
+        csv.read_csv(pa.py_buffer(block), read_options=read_options, convert_options=convert_options)
+        .group_by(["id", "hand"]).aggregate(aggregations)
+        for block in iter_blocks(stream, block_size)
+    ]
+    if not partials:
+        return pd.DataFrame(columns=["id", "hand", "sum", "count", "min", "max"])
+
+    return pa.concat_tables(partials)\
+        .group_by(["id", "hand"])\
+        .aggregate([
+            ("value_sum", "sum"),
+            ("value_count", "sum"),
+            ("value_min", "min"),
+            ("value_max", "max"),
+        ])\
+        .to_pandas()\
+        .rename(columns={
+            "value_sum_sum": "sum",
+            "value_count_sum": "count",
+            "value_min_min": "min",
+            "value_max_max": "max",
+        })
+
+
+def summarize_export(reduced: pd.DataFrame, measure_labels: pd.DataFrame) -> pd.DataFrame:
+    """Data sheet of a workbook from the reduced samples of an export."""
+    reduced = reduced.assign(
+        hand=reduced["hand"].str.strip().str.lower().map(hand_labels))
+    reduced = reduced[reduced["hand"].notna() & (reduced["count"] > 0)]\
+        .groupby(["id", "hand"], as_index=False)\
+        .agg({"sum": "sum", "count": "sum", "min": "min", "max": "max"})\
+        .merge(measure_labels[["id", "device", "description"]], how="left", on="id")
+
+    reduction = reduced["device"].map(device_reductions).fillna("mean")
+    reduced["value"] = (reduced["sum"] / reduced["count"])\
+        .where(reduction == "mean")\
+        .fillna(reduced["max"].where(reduction == "max"))\
+        .fillna(reduced["min"].where(reduction == "min"))
+
+    data = reduced\
+        .pivot(index=["id", "device", "description"], columns="hand", values="value")\
+        .reindex(columns=["left", "right"])\
+        .reset_index()
+    data.columns.name = None
+    return data
+
+
+def read_device_export(stream, filename: str) -> tuple:
+    """Read an export like `read_workbook`, from a binary stream.
+
+    Returns (is_success, result), the result has info, data and
+    filename like a parsed workbook.
+    """
+    static_config = read_static_config()
+    try:
+        metadata, column_names = read_export_header(stream)
+        reduced = reduce_export(stream, column_names)
+    except (pa.ArrowInvalid, UnicodeDecodeError, KeyError) as e:
+        return False, f"Ungültiger Geräteexport: {e}"
+
+    info_labels = static_config["info_labels"]
+    info = info_labels[info_labels["description"].isin(list(metadata))]\
+        .assign(value=lambda df: df["description"].map(metadata))\
+        .reset_index(drop=True)
+    data = summarize_export(reduced, static_config["measure_labels"])
+
+    (info, data, errors), = validate_workbooks([(info, data)])
+    if errors:
+        return False, "\n".join(errors)
+    if len(data.dropna(subset=["left", "right"], how="all")) == 0:
+        return False, "Keine Messungen gefunden"
+    return True, {
+        "info": info.to_dict(),
+        "data": data.to_dict(),
+        "filename": filename,
+    }
+
+###################
+# Main ############
+###################
+
+
+def iter_export_paths(source: str):
+    if not os.path.isdir(source):
+        yield source
+        return
+    for filename in sorted(os.listdir(source)):
+        if filename.lower().endswith(".csv"):
+            yield os.path.join(source, filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Geräteexporte (.csv) einlesen und bewerten, eine JSON Zeile pro Datei")
+    parser.add_argument("source", help="Ordner oder .csv Datei")
+    parser.add_argument("--sex", choices=["m", "w"], required=True)
+    parser.add_argument("--instrument", required=True)
+    parser.add_argument("--no-background-hand", action="store_true",
+                        help="Fehlenden Hintergrund nicht durch andere Hand ersetzen")
+    parser.add_argument("--norms", default=DEFAULT_DATASET,
+                        help="Name der Normdaten, siehe HANDPROFIL_NORMS_DIRECTORY")
+    parser.add_argument("--mode", choices=score_modes, default="decile",
+                        help="Dezile, interpolierte Perzentile oder z-Werte")
+    args = parser.parse_args(argv)
+
+    norms_cube = NormsDatasets(maxsize=1).get(args.norms)
+
+    start = time.perf_counter()
+    n_errors = 0
+    for path in iter_export_paths(args.source):
+        filename = os.path.basename(path)
+        with open(path, "rb") as stream:
+            is_success, result = read_device_export(stream, filename)
+        if not is_success:
+            n_errors += 1
+            print(json.dumps({"filename": filename, "ok": False, "error": result}))
+            continue
+        scores = norms_cube.score_measurement(
+            result, args.instrument, args.sex, not args.no_background_hand, args.mode)
+        info = dict(zip(result["info"]["id"].values(), result["info"]["value"].values()))
+        print(json.dumps({
+            "filename": filename,
+            "ok": True,
+            "subject": info.get(1),
+            score_keys[args.mode]: scores.astype({"id": int}).to_dict(orient="records"),
+        }, default=json_default))
+
+    print(f"{time.perf_counter() - start:.1f} s, {n_errors} Fehler", file=sys.stderr)
+    return 1 if n_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Export raw values and deciles of many measurements to CSV or xlsx.
+
+Rows are generated one measurement at a time. CSV is written while it
+is sent, xlsx is written by a write-only workbook into a temporary
+file, which is sent in chunks, so neither is built in memory. Downloads
+of the page are written to a file by `write_csv` or `write_xlsx`.
+"""
+
+###################
+### Imports ######
+###################
+
+import csv
+import io
+import os
+import tempfile
+import openpyxl
+import pandas as pd
+from handprofil.plots import format_date
+
+
+###################
+# Constants #
+###################
+
+export_columns = {
+    "subject": "ID",
+    "measured_on": "Datum",
+    "filename": "Datei",
+    "id": "Attribut",
+    "device": "Gerät",
+    "description": "Beschreibung",
+    "unit": "Einheit",
+    "hand": "Hand",
+    "raw": "Wert",
+    "score": "Dezil",
+}
+
+# Header of the score column, by mode
+score_labels = {
+    "decile": "Dezil",
+    "percentile": "Perzentil",
+    "zscore": "z-Wert",
+}
+
+hand_labels = {
+    "left": "links",
+    "right": "rechts",
+}
+
+READ_CHUNK_SIZE = 64 * 1024
+
+###################
+# Rows ############
+###################
+
+
+def label_lookup(measure_labels: pd.DataFrame) -> dict:
+    """Device, description and unit by attribute id."""
+    return {
+        int(row.id): (row.device, row.description, row.unit)
+        for row in measure_labels.itertuples(index=False)
+    }
+
+
+def measurement_rows(measurement: dict, deciles: pd.DataFrame, labels: dict) -> list:
+    """Rows of one measurement, one per attribute and hand with a value.
+
+    `deciles` has the columns id, hand and value, in any score mode.
+    Attributes without background have no score. `labels` is from
+    `label_lookup`.
+    """
+    info = {}
+    if measurement.get("info"):
+        info = dict(zip(
+            measurement["info"]["id"].values(), measurement["info"]["value"].values()))
+    measured_on = format_date(info[2]) if info.get(2) else ""
+    head = [str(info.get(1, "")), measured_on, measurement.get("filename", "")]
+
+    score_by_hand = dict(zip(
+        zip(deciles["id"].astype(int).tolist(), deciles["hand"]),
+        deciles["value"].tolist(),
+    )) if len(deciles) else {}
+
+    data = measurement["data"]
+    rows = []
+    for key, id in sorted(data["id"].items(), key=lambda item: int(item[1])):
+        id = int(id)
+        for hand in ["left", "right"]:
+            raw = data[hand].get(key)
+            if raw is None or pd.isna(raw):
+                continue
+            rows.append(head + [
+                id,
+                *labels.get(id, (None, None, None)),
+                hand_labels[hand],
+                float(raw),
+                score_by_hand.get((id, hand)),
+            ])
+    return rows
+
+
+def iter_rows(scored, measure_labels: pd.DataFrame):
+    """Rows of (measurement, deciles) pairs, e.g. scored lazily."""
+    labels = label_lookup(measure_labels)
+    for measurement, deciles in scored:
+        yield from measurement_rows(measurement, deciles, labels)
+
+###################
+# Writers #########
+###################
+
+
+def return_header(score_mode: str = "decile") -> list:
+    return list(export_columns.values())[:-1] + [score_labels[score_mode]]
+
+
+def iter_csv(rows, score_mode: str = "decile"):
+    """Encoded CSV chunks, with a BOM so Excel detects UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow(return_header(score_mode))
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= READ_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def write_csv(rows, path: str, score_mode: str = "decile"):
+    """Write the chunks of `iter_csv` to a file."""
+    with open(path, "wb") as file:
+        file.writelines(iter_csv(rows, score_mode))
+
+
+def write_xlsx(rows, path: str, score_mode: str = "decile"):
+    """Write rows with a write-only workbook, memory stays constant."""
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Ergebnisse")
+    worksheet.append(return_header(score_mode))
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def iter_xlsx(rows, score_mode: str = "decile"):
+    """Chunks of an xlsx file written to a temporary file first."""
+    file = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    file.close()
+    try:
+        write_xlsx(rows, file.name, score_mode)
+        with open(file.name, "rb") as stream:
+            while chunk := stream.read(READ_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.remove(file.name)
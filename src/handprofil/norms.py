@@ -0,0 +1,476 @@
+"""Build the decile edges of background.csv from raw measurements.
+
+The corpus is either a directory or zip archive of workbooks, or a
+Parquet dataset with the columns instrument, sex, hand, id and value,
+ideally partitioned by instrument and sex and sorted by id:
+    python -m handprofil.norms corpus/ background.csv --coverage coverage.csv
+
+With --sketches, new measurements are merged into stored quantile
+sketches and the norms are computed from them, without the corpus of
+earlier measurements (see handprofil.sketches for the accuracy):
+    python -m handprofil.norms new/ background.csv --sketches sketches/
+"""
+
+###################
+### Imports ######
+###################
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from handprofil.bulk import iter_source_entries, map_workbook_entries
+from handprofil.cube import ALL_AGES, measurement_age_band
+from handprofil.scoring import read_workbook
+from handprofil.sketches import (
+    RELATIVE_ACCURACY,
+    merge_sketches,
+    sketch_quantiles,
+    sketch_values,
+)
+from handprofil.static_data import read_static_config
+
+
+###################
+# Constants #
+###################
+
+QUANTILES = np.arange(1, 10) / 10
+
+STRATUM_COLUMNS = ["instrument", "sex", "hand", "age_band", "id"]
+
+# Stratum of all instruments together
+POOLED_INSTRUMENT = "gemischt"
+
+# Fewer measurements do not give meaningful deciles
+MIN_COUNT = 20
+
+# Rows of parsed workbooks written per Parquet file
+WRITE_BATCH_ROWS = 500_000
+
+# Files are sorted by id, a task skips the row groups of other ids
+ROW_GROUP_ROWS = 50_000
+
+# Consecutive attribute ids read by one task
+IDS_PER_TASK = 32
+
+sex_labels = {
+    "m": "m",
+    "w": "w",
+    "f": "w",
+}
+
+###################
+# Corpus ##########
+###################
+
+
+def normalize_instrument(label) -> str:
+    """Instrument key of background.csv from the label of a workbook."""
+    if not isinstance(label, str):
+        return None
+    return label.strip().lower().replace("-", "").replace(" ", "") or None
+
+
+def normalize_sex(label) -> str:
+    if not isinstance(label, str):
+        return None
+    return sex_labels.get(label.strip().lower())
+
+
+def read_workbook_values(filename: str, content: bytes) -> dict:
+    """Measurements of a workbook as long columns with its stratum."""
+    is_success, result = read_workbook(io.BytesIO(content), filename)
+    if not is_success:
+        return {"filename": filename, "ok": False, "error": str(result)}
+
+    info = pd.DataFrame.from_dict(result["info"]).set_index("id")["value"]
+    instrument = normalize_instrument(info.get(8))
+    sex = normalize_sex(info.get(6))
+    if instrument is None or sex is None:
+        return {"filename": filename, "ok": False, "error": "Instrument oder Geschlecht fehlt"}
+
+    values = pd.DataFrame.from_dict(result["data"])\
+        .melt(id_vars=["id"], value_vars=["left", "right"], var_name="hand")\
+        .dropna(subset=["value"])
+    return {
+        "filename": filename,
+        "ok": True,
+        "instrument": instrument,
+        "sex": sex,
+        "age_band": measurement_age_band(info),
+        "hand": values["hand"].tolist(),
+        "id": values["id"].astype(np.int64).tolist(),
+        "value": values["value"].astype(np.float64).tolist(),
+    }
+
+
+def _write_batch(rows: list, directory: str):
+    batch = pd.DataFrame({
+        "instrument": np.concatenate([np.full(len(row["id"]), row["instrument"]) for row in rows]),
+        "sex": np.concatenate([np.full(len(row["id"]), row["sex"]) for row in rows]),
+        "age_band": np.concatenate([np.full(len(row["id"]), row["age_band"]) for row in rows]),
+        "hand": np.concatenate([row["hand"] for row in rows]),
+        "id": np.concatenate([row["id"] for row in rows]).astype(np.int64),
+        "value": np.concatenate([row["value"] for row in rows]).astype(np.float64),
+    })
+    for (instrument, sex), part in batch.groupby(["instrument", "sex"]):
+        partition = os.path.join(directory, f"instrument={instrument}", f"sex={sex}")
+        os.makedirs(partition, exist_ok=True)
+        part.drop(columns=["instrument", "sex"]).sort_values("id", kind="stable").to_parquet(
+            os.path.join(partition, f"{uuid.uuid4().hex}.parquet"),
+            index=False, row_group_size=ROW_GROUP_ROWS)
+
+
+def write_workbook_dataset(entries, directory: str, max_workers: int = None) -> list:
+    """Parse workbooks into a Parquet dataset partitioned by instrument
+    and sex.
+
+    Workbooks are parsed in the bulk worker pool and written in batches,
+    so memory does not depend on the size of the corpus. Returns the
+    error messages of rejected workbooks.
+    """
+    errors = []
+    rows = []
+    n_rows = 0
+    for result in map_workbook_entries(entries, read_workbook_values, max_workers=max_workers):
+        if not result["ok"]:
+            errors.append(f"{result['filename']}: {result['error']}")
+            continue
+        rows.append(result)
+        n_rows += len(result["id"])
+        if n_rows >= WRITE_BATCH_ROWS:
+            _write_batch(rows, directory)
+            rows = []
+            n_rows = 0
+    if rows:
+        _write_batch(rows, directory)
+    return errors
+
+###################
+# Quantiles #######
+###################
+
+
+def grouped_decile_edges(values: pd.DataFrame, min_count: int = MIN_COUNT) -> tuple:
+    """Decile edges per stratum, grouped by age band and over all ages.
+
+    Every value is also part of the stratum of all ages, the values are
+    grouped twice instead of being copied for it. Returns (edges,
+    coverage). Edges are in the schema of background.csv and only cover
+    strata with at least `min_count` values, coverage has the number of
+    values of every stratum.
+    """
+    all_ages_columns = [column for column in STRATUM_COLUMNS if column != "age_band"]
+    edges = []
+    counts = []
+    for columns in [STRATUM_COLUMNS, all_ages_columns]:
+        grouped = values.groupby(columns, observed=True)["value"]
+        group_counts = grouped.size().rename("n").reset_index()
+        group_edges = grouped.quantile(QUANTILES)
+        group_edges.index = group_edges.index.set_names("quantile", level=-1)
+        group_edges = group_edges.reset_index()
+        if columns is all_ages_columns:
+            group_counts["age_band"] = ALL_AGES
+            group_edges["age_band"] = ALL_AGES
+        else:
+            # Values of unknown age are only in the stratum of all ages
+            group_counts = group_counts[group_counts["age_band"] != ALL_AGES]
+            group_edges = group_edges[group_edges["age_band"] != ALL_AGES]
+        counts.append(group_counts)
+        edges.append(group_edges)
+
+    counts = pd.concat(counts, ignore_index=True)\
+        .astype({"age_band": str})\
+        .sort_values(STRATUM_COLUMNS, ignore_index=True)
+    edges = pd.concat(edges, ignore_index=True).astype({"age_band": str})
+    edges["bin_edge"] = np.rint(edges.pop("quantile") * 10).astype(np.int64)
+
+    is_covered = pd.MultiIndex.from_frame(edges[STRATUM_COLUMNS])\
+        .isin(pd.MultiIndex.from_frame(counts.loc[counts["n"] >= min_count, STRATUM_COLUMNS]))
+    edges = edges.loc[is_covered, STRATUM_COLUMNS + ["bin_edge", "value"]]\
+        .sort_values(STRATUM_COLUMNS + ["bin_edge"], ignore_index=True)
+
+    return edges, counts[STRATUM_COLUMNS + ["n"]]
+
+
+def _read_partition(path: str, instrument: str, sex: str, ids: tuple) -> pd.DataFrame:
+    # Only the values of one sex and a range of ids, the pooled stratum
+    # reads these of all instruments
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    columns = ["hand", "id", "value"]
+    if "age_band" in dataset.schema.names:
+        columns.append("age_band")
+    first_id, last_id = ids
+    expression = (ds.field("sex") == sex) \
+        & (ds.field("id") >= first_id) & (ds.field("id") <= last_id)
+    if instrument is None:
+        expression &= ds.field("instrument") != POOLED_INSTRUMENT
+    else:
+        expression &= ds.field("instrument") == instrument
+    values = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    if "age_band" not in values:
+        values["age_band"] = ALL_AGES
+    values["instrument"] = instrument or POOLED_INSTRUMENT
+    values["sex"] = sex
+    return values.astype({"id": np.int64, "value": np.float64}, copy=False)
+
+
+def compute_partition_edges(
+    path: str, instrument: str, sex: str, ids: tuple, min_count: int,
+) -> tuple:
+    """Edges of one instrument, or of the pooled stratum, for one sex
+    and a range of ids.
+    """
+    return grouped_decile_edges(_read_partition(path, instrument, sex, ids), min_count)
+
+
+def _partition_tasks(path: str) -> list:
+    # One task per instrument, sex and range of ids, and the same for
+    # the pooled stratum. The keys are collected batch by batch.
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    strata = set()
+    ids = set()
+    for batch in dataset.to_batches(columns=["instrument", "sex", "id"]):
+        keys = pa.table({
+            "instrument": pc.cast(batch["instrument"], pa.string()),
+            "sex": pc.cast(batch["sex"], pa.string()),
+        }).group_by(["instrument", "sex"]).aggregate([])
+        strata.update(zip(*keys.to_pydict().values()))
+        ids.update(pc.unique(batch["id"]).to_pylist())
+
+    ids = sorted(ids)
+    id_ranges = [
+        (ids[i], ids[min(i + IDS_PER_TASK, len(ids)) - 1])
+        for i in range(0, len(ids), IDS_PER_TASK)
+    ]
+    sexes = sorted({sex for _, sex in strata})
+    instruments = sorted(strata) + [(None, sex) for sex in sexes]
+    return [
+        (instrument, sex, id_range)
+        for instrument, sex in instruments if instrument != POOLED_INSTRUMENT
+        for id_range in id_ranges
+    ]
+
+
+def _map_partitions(function, path: str, tasks: list, max_workers: int = None, *args) -> list:
+    max_workers = max_workers or int(
+        os.getenv("HANDPROFIL_BULK_WORKERS", os.cpu_count() or 1))
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(tasks)) or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        return list(pool.map(
+            function,
+            [path] * len(tasks),
+            *zip(*tasks),
+            *[[arg] * len(tasks) for arg in args],
+        ))
+
+
+def build_norms(path: str, max_workers: int = None, min_count: int = MIN_COUNT) -> tuple:
+    """Decile edges of all strata of a Parquet dataset.
+
+    Each worker task reads one sex and a range of ids of an instrument,
+    or of the pooled stratum, so no task holds the whole corpus.
+    Returns (norms, coverage).
+    """
+    results = _map_partitions(
+        compute_partition_edges, path, _partition_tasks(path), max_workers, min_count)
+
+    norms = pd.concat([edges for edges, _ in results], ignore_index=True)\
+        .sort_values(STRATUM_COLUMNS + ["bin_edge"], ignore_index=True)
+    coverage = pd.concat([counts for _, counts in results], ignore_index=True)\
+        .sort_values(STRATUM_COLUMNS, ignore_index=True)
+    return norms, coverage
+
+
+def coverage_report(coverage: pd.DataFrame, attribute_ids: list, min_count: int = MIN_COUNT) -> pd.DataFrame:
+    """Number of values per stratum and whether norms could be built.
+
+    Attributes without any values in a stratum of the corpus are listed
+    as well, with a count of 0.
+    """
+    strata = coverage[STRATUM_COLUMNS[:-1]].drop_duplicates()
+    expected = strata.merge(pd.DataFrame({"id": attribute_ids}), how="cross")
+    report = expected\
+        .merge(coverage, how="outer", on=STRATUM_COLUMNS)\
+        .fillna({"n": 0})\
+        .astype({"n": np.int64})\
+        .sort_values(STRATUM_COLUMNS, ignore_index=True)
+    report["status"] = np.where(
+        report["n"] >= min_count, "ok",
+        np.where(report["n"] == 0, "keine Messungen", "zu wenige Messungen"))
+    return report
+
+###################
+# Sketches ########
+###################
+
+
+def compute_partition_sketch(
+    path: str, instrument: str, sex: str, ids: tuple, relative_accuracy: float,
+) -> pd.DataFrame:
+    """Quantile sketch of one instrument, or of the pooled stratum, for
+    one sex and a range of ids.
+    """
+    values = _read_partition(path, instrument, sex, ids)
+    sketch = sketch_values(values, STRATUM_COLUMNS, relative_accuracy)
+    # The sketch of all ages is the sum of the age bands
+    return pd.concat([
+        sketch[sketch["age_band"] != ALL_AGES],
+        merge_sketches([sketch.assign(age_band=ALL_AGES)], STRATUM_COLUMNS),
+    ], ignore_index=True)
+
+
+def _sketch_partition_path(directory: str, instrument: str) -> str:
+    return os.path.join(directory, f"instrument={instrument}", "part.parquet")
+
+
+def read_sketches(directory: str, instrument: str = None) -> tuple:
+    """Stored sketches, of all instruments or of one.
+
+    Returns (sketch, relative accuracy), an empty sketch if none is stored.
+    """
+    paths = [_sketch_partition_path(directory, instrument)] if instrument else [
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(directory) for filename in filenames
+        if filename.endswith(".parquet")
+    ]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return pd.DataFrame(columns=STRATUM_COLUMNS + ["bucket", "count"]), None
+
+    tables = [pq.read_table(path) for path in paths]
+    accuracies = {float(table.schema.metadata[b"relative_accuracy"]) for table in tables}
+    if len(accuracies) > 1:
+        raise ValueError(f"Sketches mit verschiedener Genauigkeit: {sorted(accuracies)}")
+    sketch = pd.concat([table.to_pandas() for table in tables], ignore_index=True)
+    return sketch, accuracies.pop()
+
+
+def _write_sketch_partition(sketch: pd.DataFrame, directory: str, instrument: str, relative_accuracy: float):
+    path = _sketch_partition_path(directory, instrument)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(sketch, preserve_index=False)\
+        .replace_schema_metadata({"relative_accuracy": str(relative_accuracy)})
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    pq.write_table(table, temporary_path)
+    os.replace(temporary_path, path)
+
+
+def update_sketches(
+    path: str,
+    directory: str,
+    max_workers: int = None,
+    relative_accuracy: float = RELATIVE_ACCURACY,
+) -> list:
+    """Merge the values of a Parquet dataset into the stored sketches.
+
+    Only the sketches of instruments in the dataset, and of the pooled
+    stratum, are read and written again. Their size is bounded by the
+    range of the values, so an update takes time proportional to the
+    new data. Returns the updated instruments.
+    """
+    tasks = _partition_tasks(path)
+    results = _map_partitions(
+        compute_partition_sketch, path, tasks, max_workers, relative_accuracy)
+    new = pd.concat(results, ignore_index=True)
+
+    updated = []
+    for instrument, sketch in new.groupby("instrument", sort=True):
+        stored, stored_accuracy = read_sketches(directory, instrument)
+        if stored_accuracy not in (None, relative_accuracy):
+            raise ValueError(
+                f"Gespeicherte Sketches haben die Genauigkeit {stored_accuracy}, nicht {relative_accuracy}")
+        merged = merge_sketches(
+            [part for part in [stored, sketch] if len(part)], STRATUM_COLUMNS)
+        _write_sketch_partition(merged, directory, instrument, relative_accuracy)
+        updated.append(instrument)
+    return updated
+
+
+def sketch_norms(directory: str, min_count: int = MIN_COUNT) -> tuple:
+    """Decile edges of all stored sketches, like `build_norms`."""
+    sketch, relative_accuracy = read_sketches(directory)
+    quantiles, coverage = sketch_quantiles(
+        sketch, STRATUM_COLUMNS, QUANTILES, relative_accuracy or RELATIVE_ACCURACY)
+    quantiles["bin_edge"] = np.rint(quantiles.pop("quantile") * 10).astype(np.int64)
+
+    is_covered = pd.MultiIndex.from_frame(quantiles[STRATUM_COLUMNS])\
+        .isin(coverage.set_index(STRATUM_COLUMNS).query("n >= @min_count").index)
+    norms = quantiles.loc[is_covered, STRATUM_COLUMNS + ["bin_edge", "value"]]\
+        .sort_values(STRATUM_COLUMNS + ["bin_edge"], ignore_index=True)
+    return norms, coverage.sort_values(STRATUM_COLUMNS, ignore_index=True)
+
+###################
+# Main ############
+###################
+
+
+def is_parquet_dataset(source: str) -> bool:
+    if not os.path.isdir(source):
+        return source.endswith(".parquet")
+    return any(
+        filename.endswith(".parquet")
+        for _, _, filenames in os.walk(source) for filename in filenames
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Normdaten (background.csv) aus Messungen berechnen")
+    parser.add_argument(
+        "source", help="Parquet Datensatz, Ordner oder Zip-Datei mit .xlsx Messungen")
+    parser.add_argument("output", help="Neue background.csv")
+    parser.add_argument("--coverage", default=None, help="Abdeckungsbericht (.csv)")
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sketches", default=None,
+                        help="Ordner der Quantil-Sketches, die mit den neuen Messungen ergänzt werden")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    errors = []
+    with tempfile.TemporaryDirectory() as directory:
+        if is_parquet_dataset(args.source):
+            path = args.source
+        else:
+            path = directory
+            errors = write_workbook_dataset(
+                iter_source_entries(args.source), directory, args.workers)
+            for error in errors:
+                print(error, file=sys.stderr)
+        if args.sketches:
+            update_sketches(path, args.sketches, args.workers)
+            norms, coverage = sketch_norms(args.sketches, args.min_count)
+        else:
+            norms, coverage = build_norms(path, args.workers, args.min_count)
+
+    norms.to_csv(args.output, index=False)
+
+    attribute_ids = read_static_config()["measure_labels"]["id"].tolist()
+    report = coverage_report(coverage, attribute_ids, args.min_count)
+    if args.coverage:
+        report.to_csv(args.coverage, index=False)
+
+    n_strata = len(norms) // len(QUANTILES)
+    print(f"{n_strata} Strata mit Normdaten, "
+          f"{(report['status'] != 'ok').sum()} ohne, "
+          f"{len(errors)} Fehler, {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,590 @@
+###################
+### Imports ######
+###################
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from handprofil.utils import my_concat
+
+
+###################
+# Constants #
+###################
+
+# Empty rows above each section of the batched figure, holding its title
+section_title_rows = 2
+
+# Scores of all modes are drawn on the axis of the 19 decile bins,
+# where the bin edges 1 to 9 are at 2, 4, ..., 18
+score_axes = {
+    "decile": dict(
+        tickvals=[2, 4, 6, 8, 10, 12, 14, 16, 18],
+        ticktext=["1", "2", "3", "4", "5", "6", "7", "8", "9"],
+        title="Dezil",
+    ),
+    "percentile": dict(
+        tickvals=[2, 4, 6, 8, 10, 12, 14, 16, 18],
+        ticktext=["10", "20", "30", "40", "50", "60", "70", "80", "90"],
+        title="Perzentil",
+    ),
+    "zscore": dict(
+        tickvals=[1, 4, 7, 10, 13, 16, 19],
+        ticktext=["-3", "-2", "-1", "0", "1", "2", "3"],
+        title="z-Wert",
+    ),
+}
+
+# Range of the scores by mode, the middle is the median of the norms
+score_ranges = {
+    "decile": (1, 19),
+    "percentile": (0, 100),
+    "zscore": (-3, 3),
+}
+
+###################
+### Styles ########
+###################
+
+global_colors = [
+    "blue",
+    "red",
+    "violet",
+    "orange",
+    "lime",
+]
+
+# Files with a negative color_id are overlays, e.g. similar profiles
+overlay_color = "rgba(128, 128, 128, 0.6)"
+
+###################
+# Methods #########
+###################
+
+
+def prepare_plot_input(plot_data_store: list, section_config: list):
+    """Concat all files and assign the rows to the sections.
+
+    Returns None if there is nothing to plot.
+    """
+    plot_data_store = [
+        pd.DataFrame.from_dict(item) for item in plot_data_store
+    ]
+
+    all_files = []
+    for file_id, file in enumerate(plot_data_store):
+        # Check here if dataframe is not empty
+        if len(file) != 0:
+            file = file.set_index('id')
+            file.loc[:, "file_id"] = file_id
+            if "color_id" not in file:
+                file.loc[:, "color_id"] = file_id
+            all_files.append(file)
+
+    # Check here if all files are empty
+    if len(all_files) == 0:
+        return None
+
+    plot_input = my_concat(all_files, axis=0)\
+        .reset_index()\
+        .set_index("id", drop=False)
+    # .melt(id_vars=["id", "device", "description", "unit", "file_id"], var_name="hand")\
+
+    for section_id, section in enumerate(section_config):
+        section_position = 0
+        for index in section['index_order']:
+            if index in plot_input.index:
+                plot_input.loc[index, "section_id"] = section_id
+                plot_input.loc[index, "section_position"] = section_position
+                section_position = section_position + 1
+
+    return plot_input
+
+
+def format_date(value) -> str:
+    try:
+        return pd.to_datetime(value).strftime('%d.%m.%Y')
+    except (ValueError, TypeError):
+        return ""
+
+
+def return_subject_lines(filename: str, info: pd.Series) -> list:
+    """Header lines of a measurement in two columns.
+
+    `info` holds the values of the info sheet indexed by id.
+    """
+    return [
+        [
+            f'Datei: {filename}',
+            f'ID: {info.get(1, " ")}',
+            f'Datum: {format_date(info.get(2))}',
+        ],
+        [
+            f'{info.get(3, "")}, {info.get(4, "")} ({info.get(6,"")})',
+            f'{format_date(info.get(5))}',
+            f'Händigkeit: {info.get(7, "")}',
+            f'Instrument: {info.get(8, "")}',
+        ],
+    ]
+
+#######################
+# Plots ########*
+#######################
+
+
+def return_ticktext(plot_df):
+    return plot_df.apply(
+        lambda x: f"{f'{x.id:0.0f},':<5} {x.description} ({x.unit})", axis=1
+    )
+
+
+def return_score_positions(values: pd.Series, score_mode: str = "decile") -> pd.Series:
+    """Position of scores on the decile axis, see `score_axes`."""
+    if score_mode == "percentile":
+        values = values / 5
+    elif score_mode == "zscore":
+        values = 10 + 3 * values
+    else:
+        return values
+    # Extreme scores stay visible at the border
+    return values.clip(0.5, 19.5)
+
+
+def return_trace(df: pd.DataFrame, color, linestyle, symbol, connectgaps=True, meta=None, visible=True):
+    return go.Scatter(
+        x=pd.Series(df.value),
+        y=pd.Series(df.section_position),
+        marker=dict(size=16, color=color, symbol=symbol),
+        mode="lines+markers",
+        line=go.scatter.Line(color=color, dash=linestyle, width=2),
+        connectgaps=connectgaps,
+        meta=meta,
+        visible=visible,
+    )
+
+
+def is_hand_shown(hands_shown: list, file_id: int, hand: str) -> bool:
+    """Hands are shown unless they are deselected for the file."""
+    if hands_shown is None or file_id >= len(hands_shown) or hands_shown[file_id] is None:
+        return True
+    return hand in hands_shown[file_id]
+
+
+def return_file_trace(
+    df: pd.DataFrame,
+    file_id: int,
+    hand: str,
+    hands_shown: list = None,
+    connectgaps=True,
+    score_mode: str = "decile",
+):
+    """Trace of a file and hand, which can be hidden in the browser.
+
+    The trace keeps file_id and hand in meta, see assets/hand_filter.js.
+    The color follows the color_id of the file, which stays the same
+    when other files are deleted.
+    """
+    color_id = df["color_id"].iloc[0] if "color_id" in df and len(df) else file_id
+    color, linestyle, symbol = return_trace_style(int(color_id), hand)
+    df = df.assign(value=return_score_positions(df["value"], score_mode))
+    return return_trace(
+        df, color, linestyle, symbol,
+        connectgaps=connectgaps,
+        meta={"file_id": int(file_id), "hand": hand},
+        visible=is_hand_shown(hands_shown, int(file_id), hand),
+    )
+
+
+def return_trace_style(color_id: int, hand: str) -> tuple:
+    color = overlay_color if color_id < 0 else global_colors[color_id % len(global_colors)]
+    linestyle = "solid" if hand == "right" else "dash"
+    symbol = "circle" if hand == "right" else "diamond-open"
+    return color, linestyle, symbol
+
+
+def return_decile_figure(ticktext: pd.Series, n_rows: int, score_mode: str = "decile"):
+    """Empty figure with the decile axis and `n_rows` attribute rows.
+
+    `ticktext` holds the attribute labels indexed by their row.
+    """
+    labelmargin = 200
+
+    fig = px.scatter()
+
+    fig.update_layout(
+        width=1000,
+        height=30 * n_rows + 50,
+        xaxis=dict(
+            constrain="domain",
+            gridcolor="black",
+            linecolor="black",
+            linewidth=2,
+            minor=dict(dtick="L1", tick0="-0.5", gridcolor="black"),
+            mirror=False,
+            range=[0.5, 19.5],
+            showgrid=False,
+            showline=False,
+            showticklabels=True,
+            tickfont=dict(family="Arial", color="black", size=14),
+            ticks="outside",
+            **score_axes[score_mode],
+            zeroline=False,
+        ),
+        yaxis=dict(
+            anchor="free",
+            constrain="domain",
+            gridcolor="black",
+            minor=dict(dtick="L1", tick0="-0.5", gridcolor="black"),
+            mirror=True,
+            range=[n_rows - 0.5, -0.5],
+            scaleanchor="x",
+            scaleratio=1,
+            shift=-200,
+            showgrid=False,
+            showline=True,
+            showticklabels=True,
+            side="right",
+            title=None,
+            zeroline=False,
+            tickfont=dict(family="Arial", color="black", size=14),
+            tickmode="array",
+            ticktext=ticktext,
+            tickvals=ticktext.index,
+        ),
+        autosize=False,
+        margin=dict(autoexpand=False, l=labelmargin, r=0, t=0, b=50),
+        showlegend=False,
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        hovermode=False,
+    )
+
+    return fig
+
+
+def return_section_figure(df: pd.DataFrame, section_id: int, hands_shown: list = None, score_mode: str = "decile"):
+
+    df_per_section = df[df["section_id"] == section_id]
+
+    ticktext = return_ticktext(
+        df_per_section[["id", "description", "unit", "section_position"]].drop_duplicates().sort_values(by="section_position").reset_index(drop=True))
+
+    fig = return_decile_figure(ticktext, len(ticktext), score_mode)
+
+    fig.add_shape(
+        # Rectangle with reference to the plot
+        type="rect",
+        xref="x domain",
+        yref="y domain",
+        x0=0,
+        y0=0,
+        x1=1.0,
+        y1=1.0,
+        line=dict(
+            color="black",
+            width=1,
+        ),
+    )
+
+    for file_id in df_per_section["file_id"].unique():
+        for hand in df_per_section["hand"].unique():
+            # Need double bracket in .loc[[]] to prevent getting series
+            in_df = df_per_section.query(
+                "hand ==  @hand & file_id == @file_id")
+
+            in_df = in_df\
+                .set_index("section_position", drop=False)\
+                .sort_index()
+
+            fig.add_trace(return_file_trace(
+                in_df, file_id, hand, hands_shown, score_mode=score_mode))
+
+    return fig
+
+
+def return_batched_rows(df: pd.DataFrame) -> tuple:
+    """Assign the row on the common y-axis of the batched figure.
+
+    Returns (df, sizes, offsets) with sizes and first rows per section.
+    """
+    sizes = df.groupby("section_id")["section_position"].max() + 1
+    # Each section starts below its title row
+    offsets = (sizes + section_title_rows).cumsum() - sizes
+    df = df.assign(row=df["section_position"] + df["section_id"].map(offsets))
+    return df, sizes, offsets
+
+
+def return_batched_layout(df: pd.DataFrame, section_titles: list, score_mode: str = "decile"):
+    """Batched figure without traces, see `return_batched_figure`.
+
+    Only depends on the attributes in `df`, not on the values.
+    """
+    df, sizes, offsets = return_batched_rows(df)
+
+    ticktext = return_ticktext(
+        df[["id", "description", "unit", "row"]]
+        .drop_duplicates()
+        .set_index("row")
+        .sort_index())
+
+    fig = return_decile_figure(
+        ticktext, int((sizes + section_title_rows).sum()), score_mode)
+
+    for section_id, size in sizes.items():
+        offset = offsets[section_id]
+        # Hide the grid behind the title
+        fig.add_shape(
+            type="rect",
+            xref="paper",
+            yref="y",
+            x0=0,
+            y0=offset - section_title_rows - 0.5,
+            x1=1.0,
+            y1=offset - 0.5,
+            fillcolor="white",
+            layer="above",
+            line=dict(width=0),
+        )
+        fig.add_shape(
+            type="rect",
+            xref="x domain",
+            yref="y",
+            x0=0,
+            y0=offset - 0.5,
+            x1=1.0,
+            y1=offset + size - 0.5,
+            line=dict(
+                color="black",
+                width=1,
+            ),
+        )
+        fig.add_annotation(
+            text=section_titles[int(section_id)],
+            xref="x domain",
+            yref="y",
+            x=0,
+            y=offset - 1,
+            xanchor="left",
+            showarrow=False,
+            font=dict(family="Arial", color="black", size=20),
+        )
+
+    return fig
+
+
+def add_batched_traces(fig, df: pd.DataFrame, hands_shown: list = None, score_mode: str = "decile"):
+    """Add one trace per file and hand to a `return_batched_layout` figure."""
+    df, _, _ = return_batched_rows(df)
+
+    for (file_id, hand), trace_df in df.groupby(["file_id", "hand"]):
+        # End every section with a gap, so sections are not connected
+        x = []
+        y = []
+        for _, section in trace_df.sort_values(by="row").groupby("section_id"):
+            x.extend(section["value"].tolist() + [None])
+            y.extend(section["row"].tolist() + [None])
+
+        fig.add_trace(return_file_trace(
+            pd.DataFrame({
+                "value": x,
+                "section_position": y,
+                "color_id": trace_df["color_id"].iloc[0] if "color_id" in trace_df else file_id,
+            }),
+            file_id, hand, hands_shown, connectgaps=False, score_mode=score_mode))
+
+    return fig
+
+
+def return_batched_figure(
+    df: pd.DataFrame,
+    section_titles: list,
+    hands_shown: list = None,
+    score_mode: str = "decile",
+):
+    """All sections in one figure with one trace per file and hand.
+
+    Sections are stacked on a common y-axis, each below an empty row
+    with its title. Traces of a file and hand are merged across
+    sections, separated by gaps, as they share the same styling.
+    """
+    fig = return_batched_layout(df, section_titles, score_mode)
+    return add_batched_traces(fig, df, hands_shown, score_mode)
+
+
+def return_cohort_section_figure(counts: pd.DataFrame, measure_labels: pd.DataFrame, index_order: list):
+    """Heatmap with the share of a cohort per decile bin and attribute.
+
+    `counts` is the result of `cohort_decile_counts`. The size of the
+    figure only depends on the number of attributes, not on the cohort.
+    """
+    present = set(counts.index.get_level_values("id"))
+    ids = [index for index in index_order if index in present]
+
+    labelmargin = 200
+    ticktext = return_ticktext(
+        measure_labels.set_index("id").loc[ids].reset_index())
+
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        shared_yaxes=True,
+        horizontal_spacing=0.03,
+        subplot_titles=["Links", "Rechts"],
+    )
+
+    for col, hand in enumerate(["left", "right"], start=1):
+        hand_counts = counts\
+            .reindex(pd.MultiIndex.from_product([ids, [hand]]))\
+            .to_numpy()
+        with np.errstate(invalid="ignore"):
+            share = 100 * hand_counts / hand_counts.sum(axis=1, keepdims=True)
+
+        fig.add_trace(
+            go.Heatmap(
+                z=np.round(share, 1),
+                x=list(range(1, 20)),
+                y=list(range(len(ids))),
+                coloraxis="coloraxis",
+                xgap=1,
+                ygap=1,
+            ),
+            row=1,
+            col=col
+        )
+
+    fig.update_xaxes(
+        range=[0.5, 19.5],
+        tickfont=dict(family="Arial", color="black", size=14),
+        ticks="outside",
+        tickvals=[2, 4, 6, 8, 10, 12, 14, 16, 18],
+        ticktext=["1", "2", "3", "4", "5", "6", "7", "8", "9"],
+        title="Dezil",
+        zeroline=False,
+    )
+
+    fig.update_yaxes(
+        range=[len(ids) - 0.5, -0.5],
+        tickfont=dict(family="Arial", color="black", size=14),
+        tickmode="array",
+        ticktext=ticktext,
+        tickvals=ticktext.index,
+        zeroline=False,
+    )
+
+    fig.update_layout(
+        width=1000,
+        height=30 * len(ids) + 100,
+        autosize=False,
+        coloraxis=dict(
+            colorscale="Blues",
+            cmin=0,
+            colorbar=dict(title="%", thickness=15),
+        ),
+        margin=dict(autoexpand=False, l=labelmargin +
+                    100, r=60, t=30, b=50),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        hovermode=False,
+    )
+
+    return fig
+
+
+def return_instrument_matrix_figure(
+    scores: pd.DataFrame,
+    measure_labels: pd.DataFrame,
+    index_order: list,
+    instrument_labels: dict,
+    score_mode: str = "decile",
+):
+    """Heatmap of one measurement scored against every instrument.
+
+    `scores` is the result of `NormsCube.score_instruments`. Each column
+    is labelled with the mean distance of its scores from the median,
+    the instrument with the smallest distance fits best.
+    """
+    present = set(scores["id"])
+    ids = [index for index in index_order if index in present]
+    instruments = [
+        instrument for instrument in instrument_labels
+        if instrument in set(scores["instrument"])
+    ]
+
+    labelmargin = 200
+    ticktext = return_ticktext(
+        measure_labels.set_index("id").loc[ids].reset_index())
+    low, high = score_ranges[score_mode]
+
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        shared_yaxes=True,
+        horizontal_spacing=0.03,
+        subplot_titles=["Links", "Rechts"],
+    )
+
+    for col, hand in enumerate(["left", "right"], start=1):
+        matrix = scores[scores["hand"] == hand]\
+            .pivot(index="id", columns="instrument", values="value")\
+            .reindex(index=ids, columns=instruments)
+        distances = (matrix - (low + high) / 2).abs().mean()
+
+        fig.add_trace(
+            go.Heatmap(
+                z=matrix.to_numpy(),
+                x=list(range(len(instruments))),
+                y=list(range(len(ids))),
+                texttemplate="%{z:.1f}" if score_mode == "zscore" else "%{z:.0f}",
+                coloraxis="coloraxis",
+                xgap=1,
+                ygap=1,
+            ),
+            row=1,
+            col=col
+        )
+        fig.update_xaxes(
+            tickvals=list(range(len(instruments))),
+            ticktext=[
+                instrument_labels[instrument]
+                + ("" if pd.isna(distance) else f"<br>Ø {distance:.1f}")
+                for instrument, distance in distances.items()
+            ],
+            row=1,
+            col=col,
+        )
+
+    fig.update_xaxes(
+        tickfont=dict(family="Arial", color="black", size=12),
+        tickangle=0,
+        zeroline=False,
+    )
+
+    fig.update_yaxes(
+        range=[len(ids) - 0.5, -0.5],
+        tickfont=dict(family="Arial", color="black", size=14),
+        tickmode="array",
+        ticktext=ticktext,
+        tickvals=ticktext.index,
+        zeroline=False,
+    )
+
+    fig.update_layout(
+        width=1400,
+        height=30 * len(ids) + 120,
+        autosize=False,
+        coloraxis=dict(
+            colorscale="RdBu",
+            cmin=low,
+            cmax=high,
+            colorbar=dict(title=score_axes[score_mode]["title"], thickness=15),
+        ),
+        margin=dict(autoexpand=False, l=labelmargin +
+                    130, r=100, t=30, b=70),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        hovermode=False,
+    )
+
+    return fig
@@ -0,0 +1,239 @@
+"""Measurement workbooks pre-filled with the info of study participants.
+
+The participant list is a CSV file with one row per participant and
+the descriptions of meta_attributes.csv as columns, e.g.
+    ID;Name;Vorname;Geburtsdatum;Geschlecht;Händigkeit;Instrument
+    TM24;Muster;Max;10.01.1996;M;R;Violine
+Missing columns stay empty. The info sheet of the template is split
+once at its value cells, every workbook joins the parts with the cells
+of a participant and copies all other files of the template, so no
+workbook is loaded or saved by openpyxl:
+    python -m handprofil.prefill participants.csv --output workbooks.zip
+"""
+
+###################
+### Imports ######
+###################
+
+import argparse
+import io
+import os
+import posixpath
+import re
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import pandas as pd
+from handprofil.schemas import date_info_ids, required_info_ids
+from handprofil.static_data import read_static_config
+from handprofil.utils import get_absolute_path
+
+
+###################
+# Constants #
+###################
+
+TEMPLATE_PATH = get_absolute_path("src/handprofil/download/measurement_template.xlsx")
+
+# Info ids are in column A of the info sheet, their values in column D
+ID_COLUMN = "A"
+VALUE_COLUMN = "D"
+
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+namespaces = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+###################
+# Template ########
+###################
+
+
+def _first_sheet_path(files: dict) -> str:
+    workbook = ET.fromstring(files["xl/workbook.xml"])
+    relation_id = workbook.find("main:sheets/main:sheet", namespaces).get(
+        f"{{{namespaces['r']}}}id")
+    relations = ET.fromstring(files["xl/_rels/workbook.xml.rels"])
+    for relation in relations.findall("rel:Relationship", namespaces):
+        if relation.get("Id") == relation_id:
+            return posixpath.normpath(posixpath.join("xl", relation.get("Target")))
+    raise ValueError("Vorlage: Blatt Informationen nicht gefunden")
+
+
+class WorkbookTemplate:
+    """Measurement template split at the value cells of its info sheet."""
+
+    def __init__(self, path: str = None):
+        with zipfile.ZipFile(path or TEMPLATE_PATH) as archive:
+            self.files = {name: archive.read(name) for name in archive.namelist()}
+        self.sheet_path = _first_sheet_path(self.files)
+        sheet = self.files[self.sheet_path].decode("utf-8")
+
+        # Numbers in column A, shared strings (t="s") are skipped
+        info_ids = set(read_static_config()["info_labels"]["id"])
+        ids_by_row = {
+            int(row): int(float(value)) for row, attributes, value in re.findall(
+                rf'<c r="{ID_COLUMN}(\d+)"([^>]*?)>\s*<v>([\d.]+)</v>', sheet)
+            if 't="s"' not in attributes and int(float(value)) in info_ids
+        }
+
+        # Text between the value cells and (info id, style) of each cell
+        self.parts = []
+        self.cells = []
+        position = 0
+        for match in re.finditer(
+                rf'<c r="{VALUE_COLUMN}(\d+)"([^>]*?)(?:/>|>.*?</c>)', sheet, flags=re.S):
+            info_id = ids_by_row.get(int(match.group(1)))
+            if info_id is None:
+                continue
+            style = re.search(r'\ss="(\d+)"', match.group(2))
+            self.parts.append(sheet[position:match.start()])
+            self.cells.append((info_id, match.group(1), style.group(1) if style else None))
+            position = match.end()
+        self.parts.append(sheet[position:])
+
+    @property
+    def info_ids(self) -> list:
+        return [info_id for info_id, _, _ in self.cells]
+
+    @staticmethod
+    def render_cell(row: str, style: str, value) -> str:
+        reference = f'r="{VALUE_COLUMN}{row}"' + (f' s="{style}"' if style else "")
+        if value is None or value == "":
+            return f"<c {reference}/>"
+        if isinstance(value, pd.Timestamp):
+            return f"<c {reference}><v>{(value - EXCEL_EPOCH).days}</v></c>"
+        text = escape(str(value))
+        return f'<c {reference} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def render(self, values: dict) -> bytes:
+        """Workbook with `values` by info id in the info sheet."""
+        sheet = [self.parts[0]]
+        for (info_id, row, style), part in zip(self.cells, self.parts[1:]):
+            sheet.append(self.render_cell(row, style, values.get(info_id)))
+            sheet.append(part)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+            for name, content in self.files.items():
+                if name == self.sheet_path:
+                    content = "".join(sheet).encode("utf-8")
+                workbook.writestr(name, content)
+        return buffer.getvalue()
+
+###################
+# Participants ####
+###################
+
+
+def read_participants(source) -> tuple:
+    """Info values by id of each participant in a CSV file.
+
+    The delimiter is detected. Dates are read day first. Returns
+    (participants, errors), rows with errors are left out.
+    """
+    table = pd.read_csv(
+        source, sep=None, engine="python", dtype=str, keep_default_na=False,
+        encoding="utf-8-sig")
+    info_labels = read_static_config()["info_labels"]
+    ids_by_column = {
+        column: int(info_labels.loc[info_labels["description"] == column.strip(), "id"].iloc[0])
+        for column in table.columns
+        if column.strip() in set(info_labels["description"])
+    }
+
+    errors = [
+        f"Unbekannte Spalte {column}" for column in table.columns if column not in ids_by_column
+    ]
+    participants = []
+    for line, row in enumerate(table.itertuples(index=False), start=2):
+        values = {}
+        row_errors = []
+        for column, value in zip(table.columns, row):
+            info_id = ids_by_column.get(column)
+            value = value.strip()
+            if info_id is None or not value:
+                continue
+            if info_id in date_info_ids:
+                date = pd.to_datetime(value, dayfirst=True, errors="coerce")
+                if pd.isna(date):
+                    row_errors.append(f"Zeile {line}: {column} {value} ist kein Datum")
+                    continue
+                value = date.normalize()
+            values[info_id] = value
+        for info_id in required_info_ids:
+            if info_id not in values:
+                row_errors.append(f"Zeile {line}: Pflichtfeld {info_id} fehlt")
+        if row_errors:
+            errors.extend(row_errors)
+        else:
+            participants.append(values)
+    return participants, errors
+
+
+def return_filename(values: dict, used: set) -> str:
+    """Filename of a participant by ID, unique among `used`."""
+    stem = re.sub(r"[^\w.-]+", "_", str(values[1])).strip("._") or "Messung"
+    filename = f"{stem}.xlsx"
+    n = 1
+    while filename in used:
+        n += 1
+        filename = f"{stem}_{n}.xlsx"
+    used.add(filename)
+    return filename
+
+
+def iter_workbooks(participants: list, template: WorkbookTemplate = None):
+    """Pre-filled workbooks as (filename, content)."""
+    template = template or WorkbookTemplate()
+    used = set()
+    for values in participants:
+        yield return_filename(values, used), template.render(values)
+
+
+def write_zip(workbooks, target):
+    """Zip of (filename, content), workbooks are compressed already."""
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_STORED) as archive:
+        for filename, content in workbooks:
+            archive.writestr(filename, content)
+
+###################
+# Main ############
+###################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Vorausgefüllte Messvorlagen (.xlsx) aus einer Teilnehmerliste (.csv)")
+    parser.add_argument("participants", help="Teilnehmerliste (.csv)")
+    parser.add_argument("--output", required=True,
+                        help="Zip-Datei (.zip) oder Ordner für die Vorlagen")
+    parser.add_argument("--template", default=None,
+                        help="Messvorlage, sonst download/measurement_template.xlsx")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    participants, errors = read_participants(args.participants)
+    for error in errors:
+        print(error, file=sys.stderr)
+
+    workbooks = iter_workbooks(participants, WorkbookTemplate(args.template))
+    if args.output.endswith(".zip"):
+        write_zip(workbooks, args.output)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        for filename, content in workbooks:
+            with open(os.path.join(args.output, filename), "wb") as file:
+                file.write(content)
+
+    print(f"{len(participants)} Vorlagen in {time.perf_counter() - start:.1f} s, {len(errors)} Fehler")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
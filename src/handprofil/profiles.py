@@ -0,0 +1,148 @@
+"""Search the archive for profiles similar to a measurement.
+
+The profiles of a background are loaded from the archive into one
+matrix, which is kept per process until profiles are added. Distances
+to all profiles are computed at once as matrix products, only over the
+attributes measured in both profiles.
+"""
+
+###################
+### Imports ######
+###################
+
+import sqlite3
+import numpy as np
+from handprofil import archive
+from handprofil.cache import LRUCache, cache_key
+
+
+###################
+# Constants #
+###################
+
+# Profiles sharing fewer values are not compared
+MIN_COMMON_VALUES = 5
+
+# One index per background, see load_index
+index_cache = LRUCache(maxsize=16)
+
+###################
+# Methods #########
+###################
+
+
+class ProfileIndex:
+    """Profile vectors of one background, searched by distance."""
+
+    def __init__(self, measurement_ids: np.ndarray, vectors: np.ndarray, version=None):
+        is_known = ~np.isnan(vectors)
+        values = np.where(is_known, vectors, 0).astype(np.float32)
+        self.measurement_ids = np.asarray(measurement_ids, dtype=np.int64)
+        self.n_values = vectors.shape[1]
+        self.version = version
+        # The squared distance is one product with (q², -2q, 1) per query,
+        # the first block also counts the common values
+        self._terms = np.hstack([is_known.astype(np.float32), values, values ** 2])
+        # Indexes are shared by all threads of a server process
+        for array in [self.measurement_ids, self._terms]:
+            array.setflags(write=False)
+
+    def __len__(self) -> int:
+        return len(self.measurement_ids)
+
+    def distances(self, vector: np.ndarray, min_common: int = MIN_COMMON_VALUES) -> tuple:
+        """Root mean square difference to all profiles and the number of
+        values measured in both, inf with fewer than `min_common`.
+        """
+        is_known = ~np.isnan(vector)
+        query = np.where(is_known, vector, 0).astype(np.float32)
+        weights = np.concatenate([query ** 2, -2 * query, is_known.astype(np.float32)])
+
+        n_common = self._terms[:, :self.n_values] @ is_known.astype(np.float32)
+        squares = np.maximum(self._terms @ weights, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = np.sqrt(squares / n_common)
+        distances[n_common < max(min_common, 1)] = np.inf
+        return distances, n_common.astype(np.int64)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int = 5,
+        exclude: list = (),
+        min_common: int = MIN_COMMON_VALUES,
+    ) -> list:
+        """The `k` nearest profiles as (measurement id, distance, common values)."""
+        distances, n_common = self.distances(vector, min_common)
+        distances[np.isin(self.measurement_ids, list(exclude))] = np.inf
+
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return [
+            (int(self.measurement_ids[i]), float(distances[i]), int(n_common[i]))
+            for i in nearest if np.isfinite(distances[i])
+        ]
+
+    def vector(self, measurement_id: int) -> np.ndarray:
+        """Profile vector of a measurement in the index."""
+        row = np.searchsorted(self.measurement_ids, measurement_id)
+        is_known, values = self._terms[row, :2 * self.n_values].reshape(2, self.n_values)
+        return np.where(is_known > 0, values, np.nan)
+
+
+def load_index(
+    connection: sqlite3.Connection,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+) -> ProfileIndex:
+    """Index of a background, rebuilt only after profiles were stored.
+
+    One index is kept per background, a rebuilt index replaces the
+    stale one instead of being cached next to it.
+    """
+    path = connection.execute("PRAGMA database_list").fetchone()["file"]
+    key = cache_key("profiles", path, sex, instrument, bool(background_hand))
+    version = archive.profiles_version(connection, sex, instrument, background_hand)
+
+    def build():
+        return ProfileIndex(
+            *archive.load_profiles(connection, sex, instrument, background_hand), version)
+
+    index = index_cache.get_or_build(key, build)
+    if index.version != version:
+        index = index_cache.put(key, build())
+    return index
+
+
+def find_similar(
+    connection: sqlite3.Connection,
+    deciles: list,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    k: int = 5,
+    exclude: list = (),
+) -> list:
+    """Archived profiles nearest to deciles given as records.
+
+    Each match has the archive id, subject, date, distance and the
+    deciles of the match as records.
+    """
+    index = load_index(connection, sex, instrument, background_hand)
+    matches = index.search(archive.profile_vector(deciles), k, exclude)
+    summaries = archive.load_summaries(connection, [id for id, _, _ in matches])
+    return [
+        {
+            "archive_id": id,
+            "subject": summaries[id]["subject"],
+            "measured_on": summaries[id]["measured_on"],
+            "distance": distance,
+            "n_common": n_common,
+            "deciles": archive.profile_records(index.vector(id)),
+        }
+        for id, distance, n_common in matches
+    ]
@@ -0,0 +1,320 @@
+"""Print-ready PDF reports, one per measurement.
+
+Reports are rendered in a worker pool, e.g. offline for a whole study:
+    python -m handprofil.reports measurements.zip reports/ --sex m --instrument violine
+"""
+
+###################
+### Imports ######
+###################
+
+import argparse
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from handprofil.bulk import iter_source_entries, map_workbook_entries
+from handprofil.plots import (
+    add_batched_traces,
+    prepare_plot_input,
+    return_batched_layout,
+    return_subject_lines,
+)
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.scoring import read_workbook, score_modes
+from handprofil.static_data import read_static_config
+
+
+###################
+# Constants #
+###################
+
+# Room above the plots for the subject header
+header_height = 120
+header_column_width = 450
+
+###################
+# Methods #########
+###################
+
+
+@lru_cache(maxsize=64)
+def _report_skeleton(attributes: tuple, section_titles: tuple, score_mode: str = "decile"):
+    # Skeletons only depend on the attributes shown, which are the same
+    # for most measurements of a study
+    df = pd.DataFrame(
+        list(attributes),
+        columns=["id", "description", "unit", "section_id", "section_position"])
+    fig = return_batched_layout(df, list(section_titles), score_mode)
+    fig.update_layout(
+        height=fig.layout.height + header_height,
+        margin=dict(t=header_height),
+    )
+    return fig
+
+
+def return_report_figure(
+    measurement: dict,
+    deciles: pd.DataFrame,
+    static_config: dict,
+    score_mode: str = "decile",
+):
+    """Figure with the header and all sections of one measurement.
+
+    `measurement` is a parsed workbook like in the upload store and
+    `deciles` its scores with columns id, hand and value, in the mode
+    `score_mode`.
+    """
+    # Add labels like get_plot_input_data
+    labeled = deciles.merge(
+        static_config["measure_labels"], how="left", on="id")
+    section_config = static_config["section_config"]
+    plot_input = prepare_plot_input([labeled.to_dict()], section_config)
+    if plot_input is None:
+        return None
+
+    attributes = plot_input[
+        ["id", "description", "unit", "section_id", "section_position"]
+    ].drop_duplicates()
+    skeleton = _report_skeleton(
+        tuple(attributes.itertuples(index=False, name=None)),
+        tuple(section["title"] for section in section_config),
+        score_mode,
+    )
+
+    fig = add_batched_traces(go.Figure(skeleton), plot_input, score_mode=score_mode)
+
+    info = pd.DataFrame.from_dict(measurement["info"]).set_index("id")["value"]
+    for column, lines in enumerate(return_subject_lines(measurement["filename"], info)):
+        fig.add_annotation(
+            text="<br>".join(lines),
+            xref="paper",
+            yref="paper",
+            # Align with the labels left of the plots
+            x=0,
+            xshift=header_column_width * column - fig.layout.margin.l,
+            y=1,
+            yshift=header_height - 10,
+            xanchor="left",
+            yanchor="top",
+            align="left",
+            showarrow=False,
+            font=dict(family="Arial", color="black", size=14),
+        )
+
+    return fig
+
+
+def render_report(
+    measurement: dict,
+    deciles: pd.DataFrame,
+    static_config: dict,
+    score_mode: str = "decile",
+):
+    """PDF report of one measurement, None if nothing can be shown."""
+    fig = return_report_figure(measurement, deciles, static_config, score_mode)
+    if fig is None:
+        return None
+    return pio.to_image(fig, format="pdf")
+
+
+def report_filename(measurement: dict, used: set) -> str:
+    """Filename by subject ID and date, unique among `used`.
+
+    A subject's history or uploads with the same workbook name would
+    otherwise overwrite each other. Without ID the workbook name is used.
+    """
+    info = pd.DataFrame.from_dict(measurement["info"])
+    info = info.set_index("id")["value"] if not info.empty else pd.Series(dtype=object)
+    subject = str(info.get(1, "")).strip() \
+        or os.path.splitext(os.path.basename(measurement["filename"]))[0]
+    date = pd.to_datetime(info.get(2), errors="coerce")
+    if not pd.isna(date):
+        subject = f"{subject}_{date:%Y-%m-%d}"
+    stem = re.sub(r"[^\w.-]+", "_", subject).strip("._") or "Bericht"
+
+    filename = f"{stem}.pdf"
+    n = 1
+    while filename in used:
+        n += 1
+        filename = f"{stem}_{n}.pdf"
+    used.add(filename)
+    return filename
+
+###################
+# Worker pool #####
+###################
+
+
+_worker_cube = None
+_worker_static_config = None
+_worker_background = None
+
+
+def _init_worker(
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    norms: str = DEFAULT_DATASET,
+    score_mode: str = "decile",
+):
+    global _worker_cube, _worker_static_config, _worker_background
+    _worker_static_config = read_static_config()
+    _worker_cube = NormsDatasets(maxsize=1).get(norms)
+    _worker_background = (instrument, sex, background_hand, score_mode)
+
+
+def _init_page_worker(static_config: dict, score_mode: str = "decile"):
+    global _worker_static_config, _worker_background
+    _worker_static_config = static_config
+    _worker_background = (score_mode,)
+
+
+def render_report_entry(filename: str, content: bytes) -> dict:
+    is_success, result = read_workbook(io.BytesIO(content), filename)
+    if not is_success:
+        return {"filename": filename, "ok": False, "error": str(result)}
+
+    deciles = _worker_cube.score_measurement(result, *_worker_background)
+    report = render_report(result, deciles, _worker_static_config, _worker_background[-1])
+    if report is None:
+        return {"filename": filename, "ok": False, "error": "Keine Hintergrunddaten"}
+    # Names are made unique by `render_reports`
+    return {"filename": filename, "ok": True, "measurement": result, "report": report}
+
+
+def render_page_report(measurement: dict, deciles: pd.DataFrame):
+    return render_report(measurement, deciles, _worker_static_config, _worker_background[-1])
+
+
+def render_reports(
+    entries,
+    sex: str,
+    instrument: str,
+    background_hand: bool,
+    max_workers: int = None,
+    norms: str = DEFAULT_DATASET,
+    score_mode: str = "decile",
+):
+    """Render reports of workbooks given as (filename, content).
+
+    Results are yielded in completion order, see `map_workbook_entries`,
+    reports are named by `report_filename`.
+    """
+    used = set()
+    for result in map_workbook_entries(
+        entries,
+        render_report_entry,
+        initializer=_init_worker,
+        initargs=(sex, instrument, background_hand, norms, score_mode),
+        max_workers=max_workers,
+    ):
+        if result["ok"]:
+            result["name"] = report_filename(result.pop("measurement"), used)
+        yield result
+
+
+def write_reports_zip(
+    measurements: list,
+    deciles: list,
+    static_config: dict,
+    score_mode: str = "decile",
+    max_workers: int = None,
+) -> tuple:
+    """Zip with the reports of parsed measurements and their deciles.
+
+    Several reports are rendered in a worker pool, a single one in
+    process. Returns (content, errors).
+    """
+    max_workers = min(len(measurements), max_workers or int(
+        os.getenv("HANDPROFIL_BULK_WORKERS", os.cpu_count() or 1)))
+    pool = None
+    if max_workers > 1:
+        # Spawn instead of fork, the web server process may run threads
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_page_worker,
+            initargs=(static_config, score_mode),
+        )
+        reports = pool.map(render_page_report, measurements, deciles)
+    else:
+        reports = (
+            render_report(measurement, measurement_deciles, static_config, score_mode)
+            for measurement, measurement_deciles in zip(measurements, deciles)
+        )
+
+    errors = []
+    used = set()
+    buffer = io.BytesIO()
+    try:
+        with zipfile.ZipFile(buffer, "w") as zip_file:
+            for measurement, report in zip(measurements, reports):
+                if report is None:
+                    errors.append(f"{measurement['filename']}: Keine Hintergrunddaten")
+                    continue
+                zip_file.writestr(report_filename(measurement, used), report)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return buffer.getvalue(), errors
+
+###################
+# Main ############
+###################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="PDF Berichte für alle Messungen einer Zip-Datei oder eines Ordners")
+    parser.add_argument("source", help="Zip-Datei oder Ordner mit .xlsx Messungen")
+    parser.add_argument("output", help="Ordner für die Berichte")
+    parser.add_argument("--sex", choices=["m", "w"], required=True)
+    parser.add_argument("--instrument", required=True)
+    parser.add_argument("--no-background-hand", action="store_true",
+                        help="Fehlenden Hintergrund nicht durch andere Hand ersetzen")
+    parser.add_argument("--norms", default=DEFAULT_DATASET,
+                        help="Name der Normdaten, siehe HANDPROFIL_NORMS_DIRECTORY")
+    parser.add_argument("--mode", choices=score_modes, default="decile",
+                        help="Dezile, interpolierte Perzentile oder z-Werte")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if NormsDatasets().path(args.norms) is None:
+        parser.error(f"Unbekannte Normdaten: {args.norms}")
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    n_reports = 0
+    n_errors = 0
+    for result in render_reports(
+        iter_source_entries(args.source),
+        args.sex,
+        args.instrument,
+        not args.no_background_hand,
+        max_workers=args.workers,
+        norms=args.norms,
+        score_mode=args.mode,
+    ):
+        if not result["ok"]:
+            n_errors += 1
+            print(f"{result['filename']}: {result['error']}", file=sys.stderr)
+            continue
+        with open(os.path.join(args.output, result["name"]), "wb") as file:
+            file.write(result["report"])
+        n_reports += 1
+
+    print(f"{n_reports} Berichte in {time.perf_counter() - start:.1f} s, {n_errors} Fehler")
+    return 1 if n_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
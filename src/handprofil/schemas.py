@@ -0,0 +1,314 @@
+###################
+### Imports ######
+###################
+
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pandera as pa
+from handprofil.static_data import read_static_config
+
+
+###################
+# Constants #
+###################
+
+# Plausible range of a measurement per unit, generously chosen to
+# only reject typos like a missing decimal point
+unit_ranges = {
+    "mm": (0.0, 500.0),
+    "keine": (0.0, 100.0),
+    "Grad": (-180.0, 360.0),
+}
+
+# Meta attributes which must be filled in
+required_info_ids = [1]
+
+# Meta attributes holding a date
+date_info_ids = [2, 5]
+
+column_labels = {
+    "id": "ID",
+    "value": "Wert",
+    "left": "Links",
+    "right": "Rechts",
+}
+
+###################
+# Schemas #########
+###################
+
+# The schemas validate the sheets of many workbooks at once. Sheets are
+# stacked with a "file" column, so the per-call overhead of pandera does
+# not grow with the number of workbooks. Sheets passing the plain masks
+# of `get_workbook_checks` skip pandera, it only describes the errors.
+
+
+def _numeric(series: pd.Series) -> pd.Series:
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _unit_bounds(measure_labels: pd.DataFrame) -> tuple:
+    units = measure_labels.set_index("id")["unit"]
+    lower = units.map(lambda unit: unit_ranges.get(unit, (-np.inf, np.inf))[0])
+    upper = units.map(lambda unit: unit_ranges.get(unit, (-np.inf, np.inf))[1])
+    return lower, upper
+
+
+def _in_range(df: pd.DataFrame, column: str, lower: pd.Series, upper: pd.Series) -> pd.Series:
+    ids = _numeric(df["id"])
+    values = _numeric(df[column])
+    return values.isna() \
+        | (values >= ids.map(lower).fillna(-np.inf)) \
+        & (values <= ids.map(upper).fillna(np.inf))
+
+
+def _valid_dates(df: pd.DataFrame) -> pd.Series:
+    is_date = _numeric(df["id"]).isin(date_info_ids)
+    parsed = pd.to_datetime(
+        df["value"].where(is_date), errors="coerce", format="mixed")
+    return ~is_date | parsed.notna()
+
+
+def _has_unique_ids(files: np.ndarray, ids: np.ndarray) -> bool:
+    return len(np.unique(np.column_stack([files, ids]), axis=0)) == len(ids)
+
+
+def build_data_schema(measure_labels: pd.DataFrame) -> pa.DataFrameSchema:
+    """Schema of the data sheet, checked against the attribute config."""
+    lower, upper = _unit_bounds(measure_labels)
+
+    def in_range(df: pd.DataFrame, column: str) -> pd.Series:
+        return _in_range(df, column, lower, upper)
+
+    return pa.DataFrameSchema(
+        {
+            "file": pa.Column(np.int64),
+            "id": pa.Column(
+                np.int64,
+                pa.Check.isin(measure_labels["id"].tolist(),
+                              error="Unbekannte ID"),
+                coerce=True,
+            ),
+            "left": pa.Column(np.float64, nullable=True, coerce=True),
+            "right": pa.Column(np.float64, nullable=True, coerce=True),
+        },
+        checks=[
+            pa.Check(
+                lambda df, column=column: in_range(df, column),
+                error=f"{column_labels[column]}: Wert ausserhalb des plausiblen Bereichs",
+            )
+            for column in ["left", "right"]
+        ],
+        unique=["file", "id"],
+    )
+
+
+def build_info_schema() -> pa.DataFrameSchema:
+    """Schema of the info sheet."""
+    return pa.DataFrameSchema(
+        {
+            "file": pa.Column(np.int64),
+            "id": pa.Column(np.int64, coerce=True),
+        },
+        checks=[
+            pa.Check(_valid_dates, error="Ungültiges Datum"),
+        ],
+        unique=["file", "id"],
+    )
+
+
+def build_data_check(measure_labels: pd.DataFrame):
+    """True if data sheets of `files` pass `build_data_schema`.
+
+    Stricter in corner cases like fractional ids, pandera then decides.
+    """
+    lower, upper = _unit_bounds(measure_labels)
+    known_ids = measure_labels["id"].to_numpy(dtype=np.int64)
+    # Lookup tables by id
+    is_known = np.zeros(known_ids.max() + 1, dtype=bool)
+    is_known[known_ids] = True
+    lower_by_id = np.full(len(is_known), -np.inf)
+    lower_by_id[known_ids] = lower.to_numpy()
+    upper_by_id = np.full(len(is_known), np.inf)
+    upper_by_id[known_ids] = upper.to_numpy()
+
+    def is_valid(df: pd.DataFrame, files: np.ndarray) -> bool:
+        ids = _numeric(df["id"]).to_numpy(dtype=np.float64)
+        if not np.all((ids >= 0) & (ids < len(is_known)) & (ids == np.floor(ids))):
+            return False
+        ids = ids.astype(np.int64)
+        if not is_known[ids].all():
+            return False
+        for column in ["left", "right"]:
+            values = _numeric(df[column]).to_numpy(dtype=np.float64)
+            is_missing = np.isnan(values)
+            if np.any(is_missing & df[column].notna().to_numpy()):
+                return False
+            if not np.all(is_missing
+                          | (values >= lower_by_id[ids]) & (values <= upper_by_id[ids])):
+                return False
+        return _has_unique_ids(files, ids)
+
+    return is_valid
+
+
+def is_valid_info(df: pd.DataFrame, files: np.ndarray) -> bool:
+    """True if info sheets of `files` pass `build_info_schema`."""
+    ids = _numeric(df["id"]).to_numpy(dtype=np.float64)
+    if not np.isfinite(ids).all():
+        return False
+    is_date = np.isin(ids, date_info_ids)
+    dates = pd.to_datetime(
+        df["value"].to_numpy()[is_date], errors="coerce", format="mixed")
+    return bool(dates.notna().all()) and _has_unique_ids(files, ids)
+
+
+@lru_cache(maxsize=None)
+def get_workbook_schemas() -> tuple:
+    static_config = read_static_config()
+    return (
+        build_info_schema(),
+        build_data_schema(static_config["measure_labels"]),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_workbook_checks() -> tuple:
+    """Plain pandas checks of the sheets, in the order of the schemas."""
+    static_config = read_static_config()
+    return (
+        is_valid_info,
+        build_data_check(static_config["measure_labels"]),
+    )
+
+###################
+# Validation ######
+###################
+
+
+def _describe_failure(failure: dict) -> str:
+    position = f"Zeile {failure['row'] + 2}: "
+    check = str(failure["check"])
+
+    if failure["schema_context"] != "Column":
+        if check.startswith("multiple_fields_uniqueness"):
+            return f"{position}Doppelte ID"
+        return f"{position}{check}"
+
+    label = column_labels.get(failure["column"], failure["column"])
+    message = "Ungültiger Wert" if check.startswith("coerce_dtype") else check
+    return f"{position}{label}: {message} ({failure['failure_case']})"
+
+
+def _failure_reports(sheet: str, frame: pd.DataFrame, error: pa.errors.SchemaErrors) -> dict:
+    failure_cases = error.failure_cases
+    # A failed coercion also fails the dtype check, only report the former
+    failure_cases = failure_cases[
+        ~failure_cases["check"].astype(str).str.startswith("dtype(")
+        & failure_cases["index"].notna()
+    ]
+    positions = frame.loc[failure_cases["index"].astype(int), ["file", "row"]]
+    failure_cases = failure_cases\
+        .assign(
+            file=positions["file"].to_numpy(),
+            row=positions["row"].to_numpy(),
+        )\
+        .sort_values(by=["file", "row"], kind="stable")
+
+    reports = {}
+    for failure in failure_cases.to_dict(orient="records"):
+        message = f"{sheet}: {_describe_failure(failure)}"
+        # Keep order, drop duplicates
+        reports.setdefault(failure["file"], {})[message] = None
+    return {file: list(messages) for file, messages in reports.items()}
+
+
+def _concat(frames: list) -> tuple:
+    # Sheets one below the other and the file of each row
+    files = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+    if len(frames) == 1:
+        return frames[0], files
+    return pd.concat(frames, ignore_index=True), files
+
+
+def _stack(frames: list) -> pd.DataFrame:
+    stacked, files = _concat(frames)
+    return stacked.assign(
+        file=files, row=np.concatenate([frame.index.to_numpy() for frame in frames]))
+
+
+def _coerce(frame: pd.DataFrame, schema: pa.DataFrameSchema) -> dict:
+    coerced = {}
+    for name, column in schema.columns.items():
+        if name == "file":
+            continue
+        values = pd.to_numeric(frame[name], errors="coerce")
+        if not column.nullable:
+            # Missing values can only stem from rejected workbooks,
+            # which are not split off again
+            values = values.fillna(0)
+        coerced[name] = values.to_numpy().astype(column.dtype.type)
+    return coerced
+
+
+def _unstack(frames: list, coerced: dict) -> list:
+    # The sheets with their columns coerced, stacked in order
+    bounds = np.cumsum([0] + [len(frame) for frame in frames])
+    return [
+        frame.assign(**{name: values[start:end] for name, values in coerced.items()})
+        for frame, start, end in zip(frames, bounds[:-1], bounds[1:])
+    ]
+
+
+def validate_workbooks(sheets: list) -> list:
+    """Validate the sheets of many workbooks in one vectorized pass.
+
+    `sheets` is a list of (info, data) frames as read from the workbooks.
+    Returns a list of (info, data, errors) with coerced frames and a
+    list of readable error messages, empty if the workbook is valid.
+    """
+    info_schema, data_schema = get_workbook_schemas()
+    is_valid_info, is_valid_data = get_workbook_checks()
+
+    info_frames = [item[0] for item in sheets]
+    data_frames = [item[1] for item in sheets]
+    info, info_files = _concat(info_frames)
+    data, data_files = _concat(data_frames)
+
+    errors = {}
+    for sheet, frames, frame, files, schema, is_valid in [
+        ("Informationen", info_frames, info, info_files, info_schema, is_valid_info),
+        ("Messungen", data_frames, data, data_files, data_schema, is_valid_data),
+    ]:
+        # Most of the time of pandera is overhead per call, which is
+        # only spent to describe invalid sheets
+        if is_valid(frame, files):
+            continue
+        frame = _stack(frames)
+        try:
+            schema.validate(frame, lazy=True)
+        except pa.errors.SchemaErrors as e:
+            for file, messages in _failure_reports(sheet, frame, e).items():
+                errors.setdefault(file, []).extend(messages)
+
+    for info_id in required_info_ids:
+        has_id = set(info_files[_numeric(info["id"]).to_numpy() == info_id])
+        for file in sorted(set(range(len(sheets))) - has_id):
+            errors.setdefault(file, []).append(
+                f"Informationen: Pflichtfeld {info_id} fehlt")
+
+    info = _unstack(info_frames, _coerce(info, info_schema))
+    data = _unstack(data_frames, _coerce(data, data_schema))
+
+    return [
+        (*sheets[file], errors[file]) if file in errors else (
+            info[file], data[file], []
+        )
+        for file in range(len(sheets))
+    ]
+
+
+def validate_workbook(info: pd.DataFrame, data: pd.DataFrame) -> tuple:
+    """Validate the sheets of a single workbook, see `validate_workbooks`."""
+    return validate_workbooks([(info, data)])[0]
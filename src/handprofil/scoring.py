@@ -0,0 +1,232 @@
+###################
+### Imports ######
+###################
+
+import numpy as np
+import pandas as pd
+from handprofil.schemas import validate_workbooks
+
+
+###################
+# Constants #
+###################
+
+# Percentiles of the bin edges 1 to 9
+edge_percentiles = np.arange(10, 100, 10, dtype=np.float64)
+
+# Standard normal quantile of the 90th percentile
+Z_90 = 1.2815515655446004
+
+score_modes = ["decile", "percentile", "zscore"]
+
+# Key of the scores in JSON results, by mode
+score_keys = {
+    "decile": "deciles",
+    "percentile": "percentiles",
+    "zscore": "z_scores",
+}
+
+###################
+# Parsing #########
+###################
+
+
+def read_workbook_sheets(source) -> tuple:
+    """Read info and data sheet of a measurement workbook.
+
+    `source` is anything accepted by `pd.ExcelFile`, e.g. a path
+    or a binary file object. Types are coerced by the schemas in
+    `validate_workbooks` to be able to report invalid cells.
+    """
+    with pd.ExcelFile(source, engine="openpyxl") as workbook:
+        info = workbook.parse(
+            sheet_name=0,
+            header=0,
+            nrows=9,
+            names=["id", "description", "value"],
+            usecols=[0, 1, 3],
+            dtype={
+                "description": str,
+            }
+        )\
+            .dropna()
+
+        data = workbook.parse(
+            sheet_name=1,
+            header=0,
+            usecols=[0, 1, 2, 4, 5],
+            names=["id", "device", "description", "left", "right"],
+            dtype={
+                "device": str,
+                "description": str,
+            }
+        )
+    return info, data
+
+
+def read_workbooks(sources: list) -> list:
+    """Read and validate many workbooks given as (source, filename).
+
+    All workbooks are validated together in one pass. Returns a list of
+    tuples (is_success, result) like `parse_contents`.
+    """
+    results = [None] * len(sources)
+
+    sheets = []
+    positions = []
+    for i, (source, _) in enumerate(sources):
+        try:
+            sheets.append(read_workbook_sheets(source))
+            positions.append(i)
+        except Exception as e:
+            results[i] = (False, e)
+
+    validated = validate_workbooks(sheets) if sheets else []
+    for i, (info, data, errors) in zip(positions, validated):
+        if errors:
+            results[i] = (False, "\n".join(errors))
+        elif len(data.dropna(subset=["left", "right"], how="all")) == 0:
+            results[i] = (False, "Keine Messungen gefunden")
+        else:
+            results[i] = (True, {
+                "info": info.to_dict(),
+                "data": data.to_dict(),
+                "filename": sources[i][1]
+            })
+
+    return results
+
+
+def read_workbook(source, filename) -> tuple:
+    return read_workbooks([(source, filename)])[0]
+
+###################
+# Binning #########
+###################
+
+
+def return_wagner_decile(bin_edges: list, value: float) -> int:
+    """Return custom decile bin.
+
+    Returns bin position of value with respect to
+    bin_edges. If value is equal to one of the bin
+    edges, this is also a bin. Below the mapping between
+    bins and edges (with monospace font):
+    Edges:   1   2   3   4   5     6     7     8     9
+    Bins:  1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19
+    """
+    #   1   2   3   4   5     6     7     8     9
+    # 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19
+
+    # assert len(bin_edges) == 9
+
+    bin = 1
+    for i, edge in enumerate(bin_edges):
+        if value < edge:
+            break
+        if value == edge:
+            bin = bin + 1
+            break
+        else:
+            bin = bin + 2
+    return bin
+
+
+def return_wagner_deciles(bin_edges: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Vectorized `return_wagner_decile`.
+
+    `bin_edges` has one row of edges per value. Missing edges (NaN)
+    are skipped, like edges absent from the list.
+    """
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)[:, np.newaxis]
+
+    # Move missing edges to the end, where they never stop the search
+    order = np.argsort(np.isnan(bin_edges), axis=1, kind="stable")
+    bin_edges = np.take_along_axis(bin_edges, order, axis=1)
+    bin_edges = np.where(np.isnan(bin_edges), np.inf, bin_edges)
+    bin_edges = np.pad(bin_edges, ((0, 0), (0, 1)), constant_values=np.inf)
+
+    # Position of the first edge which is not below the value
+    stop = np.argmax(bin_edges >= values, axis=1)
+    is_edge = np.take_along_axis(bin_edges, stop[:, np.newaxis], axis=1) == values
+
+    return 1 + 2 * stop + is_edge[:, 0]
+
+
+def return_percentiles(bin_edges: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Percentiles interpolated linearly between the bin edges.
+
+    `bin_edges` has one row of the 9 edges per value, the edges are the
+    percentiles 10 to 90. Beyond the outer edges the adjacent interval
+    is extrapolated, clipped to 0 and 100. Rows with a missing edge
+    are NaN.
+    """
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    rows = np.arange(len(values))
+
+    # Interval of the value, the first and last one extend outwards.
+    # Values on tied edges get the first of them, like the deciles.
+    upper = np.clip((bin_edges < values[:, np.newaxis]).sum(axis=1), 1, len(edge_percentiles) - 1)
+    lower_edge = bin_edges[rows, upper - 1]
+    upper_edge = bin_edges[rows, upper]
+    width = upper_edge - lower_edge
+
+    # Tied edges have no width, the value lies on one of their sides
+    fraction = np.divide(
+        values - lower_edge, width,
+        out=(values > upper_edge).astype(np.float64),
+        where=width > 0,
+    )
+    percentiles = edge_percentiles[upper - 1] + fraction * (
+        edge_percentiles[upper] - edge_percentiles[upper - 1])
+
+    percentiles = np.clip(percentiles, 0, 100)
+    percentiles[np.isnan(bin_edges).any(axis=1)] = np.nan
+    return percentiles
+
+
+def return_z_scores(bin_edges: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Approximate z-scores assuming normal norms.
+
+    The median (edge 5) is the mean, the standard deviation follows
+    from the distance of the edges 1 and 9. Rows with a missing edge or
+    without spread are NaN.
+    """
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    scale = (bin_edges[:, 8] - bin_edges[:, 0]) / (2 * Z_90)
+    z_scores = np.divide(
+        values - bin_edges[:, 4], scale,
+        out=np.full(len(values), np.nan),
+        where=scale > 0,
+    )
+    z_scores[np.isnan(bin_edges).any(axis=1)] = np.nan
+    return z_scores
+
+
+def return_scores(bin_edges: np.ndarray, values: np.ndarray, mode: str = "decile") -> np.ndarray:
+    """Scores of values with one row of bin edges each, see `score_modes`."""
+    if mode == "percentile":
+        return return_percentiles(bin_edges, values)
+    if mode == "zscore":
+        return return_z_scores(bin_edges, values)
+    return return_wagner_deciles(bin_edges, values)
+
+
+def bin_values(values: pd.DataFrame, bin_edges: pd.DataFrame) -> pd.DataFrame:
+    """Bin a long frame with columns id, hand and value in one pass.
+
+    Rows without background are dropped, other columns are kept.
+    """
+    index = pd.MultiIndex.from_frame(values[["id", "hand"]])
+    has_background = index.isin(bin_edges.index)
+
+    values = values[has_background & values["value"].notna()]
+    edges = bin_edges.reindex(
+        pd.MultiIndex.from_frame(values[["id", "hand"]])).to_numpy()
+
+    return values.assign(
+        value=return_wagner_deciles(edges, values["value"].to_numpy()))
@@ -0,0 +1,117 @@
+"""Mergeable quantile sketches with a relative accuracy guarantee.
+
+Values are counted in logarithmic buckets (like DDSketch): a value x
+with |x| in (gamma^(k-1), gamma^k] falls into bucket k, with
+gamma = (1 + alpha) / (1 - alpha). Sketches of parts of the data are
+merged by adding the counts of equal buckets, which gives exactly the
+sketch of all the data, in any order.
+
+Accuracy, for n values of a group and a quantile q:
+    Let x be the exact quantile without interpolation, the value of
+    rank floor(q * (n - 1)) of the sorted values (numpy method "lower").
+    The estimate differs from x by at most alpha * |x|, and by at most
+    MIN_VALUE if |x| <= MIN_VALUE.
+Exact quantiles with linear interpolation, as in `grouped_decile_edges`,
+lie between the values of rank floor(q * (n - 1)) and the next one, so
+they differ from the estimate by at most that gap in addition.
+
+The size of a sketch does not depend on the number of values, only on
+their range: about log(max / min) / log(gamma) buckets per group.
+"""
+
+###################
+### Imports ######
+###################
+
+import numpy as np
+import pandas as pd
+
+
+###################
+# Constants #
+###################
+
+# Relative accuracy alpha of the quantiles
+RELATIVE_ACCURACY = 0.005
+
+# Smaller absolute values are counted as 0
+MIN_VALUE = 1e-6
+
+###################
+# Methods #########
+###################
+
+
+def _gamma(relative_accuracy: float) -> float:
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def _key_offset(relative_accuracy: float) -> int:
+    # Shift keys of values above MIN_VALUE to positive numbers, so the
+    # signed bucket sign * (key + offset) has the order of the values
+    return int(-np.floor(np.log(MIN_VALUE) / np.log(_gamma(relative_accuracy)))) + 1
+
+
+def sketch_values(values: pd.DataFrame, columns: list, relative_accuracy: float = RELATIVE_ACCURACY) -> pd.DataFrame:
+    """Sketch of the column value per group of `columns`.
+
+    Returns the group columns, the signed bucket and its count.
+    """
+    value = values["value"].to_numpy(dtype=np.float64)
+    magnitude = np.abs(value)
+    is_zero = ~(magnitude > MIN_VALUE)
+
+    key = np.ceil(np.log(np.where(is_zero, 1, magnitude)) / np.log(_gamma(relative_accuracy)))
+    bucket = np.where(
+        is_zero, 0, np.sign(value) * (key + _key_offset(relative_accuracy))
+    ).astype(np.int64)
+
+    sketch = values[columns].assign(bucket=bucket)\
+        .loc[~np.isnan(value)]\
+        .groupby(columns + ["bucket"], observed=True, sort=True)\
+        .size().rename("count").reset_index()
+    return sketch.astype({"count": np.int64})
+
+
+def merge_sketches(sketches: list, columns: list) -> pd.DataFrame:
+    """Sum of sketches of the same relative accuracy."""
+    return pd.concat(sketches, ignore_index=True)\
+        .groupby(columns + ["bucket"], observed=True, sort=True)["count"]\
+        .sum().reset_index()
+
+
+def bucket_values(bucket: np.ndarray, relative_accuracy: float = RELATIVE_ACCURACY) -> np.ndarray:
+    """Representative value of buckets, within alpha of all their values."""
+    gamma = _gamma(relative_accuracy)
+    key = np.abs(bucket) - _key_offset(relative_accuracy)
+    return np.where(
+        bucket == 0, 0.0, np.sign(bucket) * 2 * gamma ** key / (gamma + 1))
+
+
+def sketch_quantiles(
+    sketch: pd.DataFrame,
+    columns: list,
+    quantiles: np.ndarray,
+    relative_accuracy: float = RELATIVE_ACCURACY,
+) -> tuple:
+    """Quantiles per group of a sketch.
+
+    Returns (quantiles, counts) with a row per group and quantile, and
+    the number of values of every group.
+    """
+    sketch = sketch.sort_values(columns + ["bucket"], ignore_index=True)
+    cumulative = sketch["count"].to_numpy().cumsum()
+
+    groups = sketch.groupby(columns, observed=True, sort=False)
+    counts = groups["count"].sum().rename("n").reset_index()
+    first_rows = groups.cumcount().to_numpy() == 0
+    before = (cumulative - sketch["count"].to_numpy())[first_rows]
+
+    n = counts["n"].to_numpy()
+    ranks = before[:, None] + np.floor(quantiles[None, :] * (n[:, None] - 1))
+    rows = np.searchsorted(cumulative, ranks.ravel(), side="right")
+
+    result = counts[columns].loc[counts.index.repeat(len(quantiles))].reset_index(drop=True)
+    result["quantile"] = np.tile(quantiles, len(counts))
+    result["value"] = bucket_values(sketch["bucket"].to_numpy()[rows], relative_accuracy)
+    return result, counts
@@ -0,0 +1,60 @@
+###################
+### Imports ######
+###################
+
+import gzip
+import json
+import os
+import re
+import uuid
+from handprofil.cache import cache_key
+from handprofil.utils import get_absolute_path, json_default
+
+
+###################
+# Constants #
+###################
+
+SNAPSHOT_DIRECTORY = os.getenv(
+    "HANDPROFIL_SNAPSHOT_DIRECTORY", get_absolute_path("snapshots"))
+
+SNAPSHOT_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+###################
+# Methods #########
+###################
+
+
+def _snapshot_path(snapshot_id: str) -> str:
+    return os.path.join(SNAPSHOT_DIRECTORY, f"{snapshot_id}.json.gz")
+
+
+def store_snapshot(state: dict) -> str:
+    """Persist the computed state of the page and return its id.
+
+    The id is the hash of the state, storing the same state again
+    returns the same id without writing it twice.
+    """
+    # Same representation as after a round trip through a dcc.Store
+    state = json.loads(json.dumps(state, default=json_default))
+    snapshot_id = cache_key(state)
+    if os.path.exists(_snapshot_path(snapshot_id)):
+        return snapshot_id
+
+    os.makedirs(SNAPSHOT_DIRECTORY, exist_ok=True)
+    temporary_path = f"{_snapshot_path(snapshot_id)}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(temporary_path, "wt") as file:
+        json.dump(state, file)
+    os.replace(temporary_path, _snapshot_path(snapshot_id))
+    return snapshot_id
+
+
+def load_snapshot(snapshot_id: str):
+    """Return the state of a snapshot, None if the id is unknown."""
+    if not isinstance(snapshot_id, str) or not SNAPSHOT_PATTERN.match(snapshot_id):
+        return None
+    try:
+        with gzip.open(_snapshot_path(snapshot_id), "rt") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
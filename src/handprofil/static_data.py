@@ -0,0 +1,86 @@
+###################
+### Imports ######
+###################
+
+import copy
+import json
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from handprofil.utils import get_absolute_path
+
+
+###################
+# Static data #####
+###################
+
+
+def read_background(path: str) -> pd.DataFrame:
+    """Read norms in the schema of background.csv."""
+    return pd.read_csv(
+        path,
+        header=0,
+        dtype={
+            "instrument": str,
+            "sex": str,
+            "hand": str,
+            "age_band": str,
+            "id": np.int64,
+            "bin_edge": np.int64,
+            "value": np.float64
+        }
+    )
+
+
+@lru_cache(maxsize=1)
+def _read_static_config() -> dict:
+    measure_labels = pd.read_csv(
+        get_absolute_path(
+            "src/handprofil/config/attributes.csv"),
+        header=0,
+        dtype={
+            "id": np.int64,
+            "device": str,
+            "description": str,
+            "unit": str
+        }
+    )
+
+    info_labels = pd.read_csv(
+        get_absolute_path(
+            "src/handprofil/config/meta_attributes.csv"),
+        header=0,
+        dtype={
+            "id": np.int64,
+            "description": str,
+        }
+    )
+
+    background = read_background(
+        get_absolute_path("src/handprofil/config/background.csv"))
+
+    with open(
+        get_absolute_path(
+            "src/handprofil/config/plot_sections.json"), "r"
+    ) as file:
+        section_config = json.load(file)
+
+    # Check if all measure labels are present in section config
+    assert set(measure_labels['id']) == set(
+        [index for item in section_config for index in item["index_order"]])
+
+    return {
+        "measure_labels": measure_labels,
+        "info_labels": info_labels,
+        "background_data": background,
+        "section_config": section_config
+    }
+
+
+def read_static_config() -> dict:
+    """Read attribute labels, background and section layout from config.
+
+    The files are read once per process, every call returns copies,
+    which the caller may modify.
+    """
+    return copy.deepcopy(_read_static_config())
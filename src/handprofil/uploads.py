@@ -0,0 +1,100 @@
+###################
+### Imports ######
+###################
+
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from handprofil.utils import json_default
+
+
+###################
+# Constants #
+###################
+
+SPOOL_MAX_MEMORY = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+# Parsed uploads which were never picked up by a callback are removed
+UPLOAD_MAX_AGE = 60 * 60
+
+UPLOAD_DIRECTORY = os.getenv(
+    "HANDPROFIL_UPLOAD_DIRECTORY",
+    os.path.join(tempfile.gettempdir(), "handprofil-uploads")
+)
+
+TOKEN_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+###################
+# Methods #########
+###################
+
+
+def spool_stream(stream, max_size: int = None):
+    """Copy a (request) stream chunk-wise into a spooled temporary file.
+
+    Small uploads stay in memory, larger ones are written to disk.
+    The returned file is positioned at the beginning.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            spool.close()
+            raise ValueError("Datei ist zu gross")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def _token_path(token: str) -> str:
+    return os.path.join(UPLOAD_DIRECTORY, f"{token}.json")
+
+
+def remove_expired_uploads(max_age: int = UPLOAD_MAX_AGE):
+    if not os.path.isdir(UPLOAD_DIRECTORY):
+        return
+    expired = time.time() - max_age
+    for entry in os.scandir(UPLOAD_DIRECTORY):
+        try:
+            if entry.stat().st_mtime < expired:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def store_upload(parsed: dict) -> str:
+    """Persist a parsed workbook and return the token to fetch it.
+
+    Results are kept on disk, so any worker process of the server can
+    resolve the token.
+    """
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    remove_expired_uploads()
+
+    token = uuid.uuid4().hex
+    temporary_path = _token_path(token) + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(parsed, file, default=json_default)
+    os.replace(temporary_path, _token_path(token))
+    return token
+
+
+def take_upload(token: str):
+    """Return and remove a parsed workbook, None if the token is unknown."""
+    if not isinstance(token, str) or not TOKEN_PATTERN.match(token):
+        return None
+    try:
+        with open(_token_path(token), "r") as file:
+            parsed = json.load(file)
+        os.remove(_token_path(token))
+    except FileNotFoundError:
+        return None
+    return parsed
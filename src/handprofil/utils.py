@@ -0,0 +1,29 @@
+###################
+### Imports ######
+###################
+
+import os
+from pathlib import Path
+import pandas as pd
+
+
+###################
+##### Utils #######
+###################
+
+
+def get_absolute_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    src_path = Path(directory_path).parents[1]
+    return os.path.join(src_path, relative_path)
+
+# To avoid typechecking error https://github.com/microsoft/pylance-release/issues/5631
+
+
+def my_concat(dfs_list, axis=0): return pd.concat(dfs_list, axis=axis)
+
+
+def json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
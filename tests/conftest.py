@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from handprofil import archive
+from handprofil.profiles import index_cache
+
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+@pytest.fixture
+def archive_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "archive.sqlite")
+    monkeypatch.setattr(archive, "ARCHIVE_PATH", path)
+    # Indexes of an archive at the same path in an earlier test
+    index_cache.clear()
+    return path
+
+
+production_script = """
+import json, sys
+from handprofil.app import server
+client = server.test_client()
+statuses = [
+    client.open(path, method=method, headers=headers).status_code
+    for method, path, headers in json.loads(sys.argv[1])
+]
+print(json.dumps(statuses))
+"""
+
+
+@pytest.fixture
+def production_status():
+    """Status codes of requests to an app started with ENVIRONMENT=PRODUCTION.
+
+    Authentication is set up at import, so the app runs in a new process.
+    """
+    def request_statuses(requests: list) -> list:
+        environment = {
+            **os.environ,
+            "ENVIRONMENT": "PRODUCTION",
+            "USERNAME": "user",
+            "PASSWORD": "secret",
+            "PYTHONPATH": os.pathsep.join([SOURCE_PATH, os.environ.get("PYTHONPATH", "")]),
+        }
+        requests = [(method, path, headers or {}) for method, path, headers in requests]
+        result = subprocess.run(
+            [sys.executable, "-c", production_script, json.dumps(requests)],
+            env=environment, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout.splitlines()[-1])
+
+    return request_statuses
@@ -0,0 +1,79 @@
+"""Binning of one measurement as done before the norms cube.
+
+Reference for the tests of `handprofil.cube`, not part of the package.
+"""
+import numpy as np
+import pandas as pd
+from handprofil.scoring import return_wagner_deciles
+
+
+def prepare_background(
+    background_data: pd.DataFrame,
+    sex: str,
+    instrument: str,
+    background_hand: bool
+) -> pd.DataFrame:
+    """Return bin edges of one stratum indexed by (id, hand, bin_edge)."""
+    if "age_band" in background_data:
+        # Norms of all ages, age bands are scored with handprofil.cube
+        background_data = background_data[
+            background_data["age_band"].fillna("alle") == "alle"].drop(columns="age_band")
+
+    background_data = background_data\
+        .astype({
+            "instrument": str,
+            "sex": str,
+            "hand": str,
+            "id": np.int64,
+            "bin_edge": np.int64,
+            "value": np.float64
+        })\
+        .pivot(index=["instrument", "sex", "id", "bin_edge"], columns="hand", values="value")
+
+    if background_hand:
+        # Fill left or right hand background value if not available
+        background_data[["left", "right"]] = background_data[["left", "right"]]\
+            .bfill(axis=1).ffill(axis=1)
+
+    background_data = background_data.reset_index().melt(
+        id_vars=['id', 'instrument', 'sex', 'bin_edge'])
+
+    # Filter background
+    background_data = background_data.query(
+        'sex == @sex & instrument == @instrument')
+
+    return background_data\
+        .set_index(["id", "hand", "bin_edge"])\
+        .sort_index()\
+        .dropna()
+
+
+def bin_measurements(data: pd.DataFrame, background_data: pd.DataFrame) -> pd.DataFrame:
+    """Bin left and right values of one measurement into deciles.
+
+    `background_data` is the result of `prepare_background`. Returns
+    a flat frame with columns id, hand and value.
+    """
+    # Drop NaN values
+    data = data\
+        .astype({
+            "id": np.int64,
+            "left": np.float64,
+            "right": np.float64
+        })\
+        .melt(id_vars=["id"], value_vars=["left", "right"], var_name="hand")\
+        .set_index(["id", "hand"])\
+        .dropna()
+
+    bin_edges = background_data["value"].unstack("bin_edge")
+
+    # Only process IDs with available background
+    data = data.loc[bin_edges.index.intersection(data.index)]\
+        .sort_index()
+
+    # Apply binning and assign to value
+    if not data.empty:
+        data["value"] = return_wagner_deciles(
+            bin_edges.loc[data.index].to_numpy(), data["value"].to_numpy())
+
+    return data.reset_index()
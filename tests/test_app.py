@@ -1,15 +1,32 @@
 import base64
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pytest
+import numpy as np
 import pandas as pd
+from dash import no_update
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+import handprofil.app as app
+from handprofil.datasets import NormsDatasets
+from handprofil.scoring import read_workbook, return_wagner_decile
+from handprofil.utils import json_default
 from handprofil.app import (
-    return_wagner_decile,
     load_static_data,
     compute_binned_values,
     get_plot_input_data,
     create_plots,
+    create_instrument_comparison,
+    render_opened_sections,
+    figure_cache,
+    svg_cache,
+    wrap_figure_in_graph,
     upload_files_to_store,
-    parse_contents
+    parse_contents,
+    append_to_store,
+    display_upload_store_content,
+    delete_file_from_store,
 )
 
 
@@ -65,7 +82,9 @@ def test_parse_contents():
 def test_compute_binned_values(
     checkbox_background_hand,
     instrument,
-    sex
+    sex,
+    tmp_path,
+    monkeypatch,
 ):
     # There is no background for id=8
     upload_store = [
@@ -89,16 +108,15 @@ def test_compute_binned_values(
         }
     ]
 
-    static_store = {
-        "background_data": {
-            "instrument": {0: "violine", 1: "violine", 2: "egitarre"},
-            "sex": {0: "m", 1: "m", 2: "m"},
-            "hand": {0: "left", 1: "left", 2: "right"},
-            "id": {0: 1, 1: 1, 2: 1},
-            "bin_edge": {0: 1, 1: 2, 2: 1},
-            "value": {0: 177.0, 1: 181.0, 2: 160}
-        }
-    }
+    pd.DataFrame({
+        "instrument": ["violine", "violine", "egitarre"],
+        "sex": ["m", "m", "m"],
+        "hand": ["left", "left", "right"],
+        "id": [1, 1, 1],
+        "bin_edge": [1, 2, 1],
+        "value": [177.0, 181.0, 160],
+    }).to_csv(tmp_path / "test.csv", index=False)
+    monkeypatch.setattr(app, "norms_datasets", NormsDatasets(str(tmp_path)))
 
     # Act
     result = compute_binned_values(
@@ -106,9 +124,7 @@ def test_compute_binned_values(
         sex,
         instrument,
         checkbox_background_hand,
-        # hands_shown_values,
-        # hands_shown_ids,
-        static_store,
+        "test",
     )
 
     # Assert
@@ -205,13 +221,9 @@ def test_compute_plot_input_data(no_data):
         }
     }
 
-    hands_shown_values = [["right", "left"], ["right"]]
-    hands_shown_ids = [1, 2]
-
     # Act
     results = get_plot_input_data(
-        decile_data_store, hands_shown_values, static_store
-    )
+        decile_data_store, static_store, None, [{"key": 3}, {"key": 5}])
 
     # Assert
     dataframes = [
@@ -226,14 +238,22 @@ def test_compute_plot_input_data(no_data):
             assert 'device' in df.columns
             assert 'description' in df.columns
             assert 'unit' in df.columns
-            assert len(df.columns) == 6
+            assert 'color_id' in df.columns
+            assert len(df.columns) == 7
+
+        # Files keep the color of their upload key
+        assert dataframes[1]["color_id"].tolist() == [5, 5]
 
         assert dataframes[0].set_index(
             ["id", "hand"]).loc[(1, "right"), "value"] == 14
         assert dataframes[0].set_index(
             ["id", "hand"]).loc[(1, "left"), "value"] == 12
+        # Deselected hands are hidden in the browser, not filtered
+        assert dataframes[1].set_index(
+            ["id", "hand"]).loc[(1, "left"), "value"] == 7
         assert dataframes[1].set_index(
             ["id", "hand"]).loc[(1, "right"), "value"] == 15
+        assert dataframes[0]["description"].tolist() == ["Handlänge", "Handlänge"]
 
 
 @pytest.mark.parametrize(
@@ -380,6 +400,123 @@ def test_create_plots(no_data):
     x = result
 
 
+def test_create_plots_batched():
+    # Arrange
+    static_store = {
+        "section_config": [
+            {"title": "Handform", "index_order": [2, 1]},
+            {"title": "Aktive Beweglichkeit", "index_order": [3]},
+        ]
+    }
+    plot_data_store = [{
+        "id": {"0": 1, "1": 2, "2": 3, "3": 1},
+        "hand": {"0": "right", "1": "right", "2": "right", "3": "left"},
+        "value": {"0": 14, "1": 2, "2": 2, "3": 12},
+        "device": {"0": "Handlabor", "1": "Handlabor", "2": "Handlabor", "3": "Handlabor"},
+        "description": {"0": "Handlänge", "1": "Handbreite", "2": "Fingerlänge", "3": "Handlänge"},
+        "unit": {"0": "mm", "1": "mm", "2": "mm", "3": "mm"},
+    }]
+
+    # Act
+    result = create_plots(plot_data_store, static_store, "batched")
+
+    # Assert
+    figure = result[0].children[-1].figure
+    traces = {trace.line.dash: trace for trace in figure.data if trace.line.dash}
+    assert len(result) == 1
+    # Sections are separated by a gap and stacked below their titles
+    assert list(np.nan_to_num(traces["solid"].y, nan=-1)) == [2, 3, -1, 6, -1]
+    assert list(np.nan_to_num(traces["solid"].x, nan=-1)) == [2, 14, -1, 2, -1]
+    assert list(np.nan_to_num(traces["dash"].y, nan=-1)) == [3, -1]
+    assert [a.text for a in figure.layout.annotations] == [
+        "Handform", "Aktive Beweglichkeit"]
+
+
+def test_create_plots_hides_deselected_hands():
+    # Arrange
+    static_store = {
+        "section_config": [
+            {"title": "Handform", "index_order": [1]},
+        ]
+    }
+    plot_data_store = [{
+        "id": {"0": 1, "1": 1},
+        "hand": {"0": "right", "1": "left"},
+        "value": {"0": 14, "1": 12},
+        "device": {"0": "Handlabor", "1": "Handlabor"},
+        "description": {"0": "Handlänge", "1": "Handlänge"},
+        "unit": {"0": "mm", "1": "mm"},
+    }]
+
+    # Act
+    sections = create_plots(plot_data_store, static_store, "sections", [], None, [["right"]])
+    batched = create_plots(plot_data_store, static_store, "batched", [], None, [["right"]])
+
+    # Assert
+    graph = sections[0].children.children[1].children[0].children.children[-1]
+    for figure in [graph.figure, batched[0].children[-1].figure]:
+        figure = go.Figure(figure)
+        # Traces of all hands are shipped, hands are toggled in the browser
+        assert {
+            trace.meta["hand"]: trace.visible for trace in figure.data if trace.meta
+        } == {"right": True, "left": False}
+    assert graph.id == {"type": "section-graph", "index": 0}
+
+
+def test_create_plots_lazy():
+    # Arrange
+    static_store = {
+        "section_config": [
+            {"title": "Handform", "index_order": [2, 1]},
+            {"title": "Aktive Beweglichkeit", "index_order": [3]},
+        ]
+    }
+    plot_data_store = [{
+        "id": {"0": 1, "1": 3},
+        "hand": {"0": "right", "1": "right"},
+        "value": {"0": 14, "1": 2},
+        "device": {"0": "Handlabor", "1": "Handlabor"},
+        "description": {"0": "Handlänge", "1": "Fingerlänge"},
+        "unit": {"0": "mm", "1": "mm"},
+    }]
+    figure_cache.clear()
+
+    # Act
+    panels = create_plots(plot_data_store, static_store)
+    rendered = [panel.children.children[1].children[1].data for panel in panels]
+    ids = [{"type": "section-rendered", "index": i} for i in range(2)]
+    graphs, rendered_after = render_opened_sections(
+        [None, "1"], rendered, ids, plot_data_store, static_store)
+    reopened = create_plots(plot_data_store, static_store, "sections", [None, "1"])
+
+    # Assert
+    assert rendered == [True, False]
+    assert graphs[0] is no_update
+    assert graphs[1] is not None
+    assert rendered_after == [True, True]
+    # Only the open section is shipped, its figure comes from the cache
+    assert [panel.value for panel in reopened] == [None, "1"]
+    assert figure_cache.misses == 2
+    assert figure_cache.hits == 1
+
+
+def test_wrap_figure_in_graph_svg(monkeypatch):
+    # Arrange
+    figure = go.Figure(go.Scatter(x=[1, 2], y=[1, 2]))
+    monkeypatch.setattr(app, "plot_format", "svg")
+    svg_cache.clear()
+
+    # Act
+    first = wrap_figure_in_graph("Titel", figure)
+    second = wrap_figure_in_graph("Titel", go.Figure(figure))
+
+    # Assert
+    assert first.children[1].src.startswith("data:image/svg+xml;base64,")
+    assert first.children[1].src == second.children[1].src
+    assert svg_cache.misses == 1
+    assert svg_cache.hits == 1
+
+
 def get_testfile_path(relative_path):
     directory_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(directory_path, relative_path)
@@ -411,3 +548,131 @@ def test_validate_meta_attributes(filename, expected):
     first_content = data[0]
     info = pd.DataFrame.from_dict(first_content['info'])
     data = pd.DataFrame.from_dict(first_content['data'])
+
+
+def test_callbacks_are_thread_safe():
+    # Arrange
+    static_store = load_static_data(None)
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "measurement.xlsx")
+    measurement = json.loads(json.dumps(measurement, default=json_default))
+    backgrounds = [
+        (sex, instrument, background_hand)
+        for sex in ["m", "w"]
+        for instrument in ["gemischt", "violine", "klavier"]
+        for background_hand in [True, False]
+    ]
+
+    def render(background):
+        deciles = compute_binned_values([measurement], *background, "standard")
+        plots = get_plot_input_data(deciles, static_store)
+        figures = create_plots(plots, static_store, "sections", ["0", "1", "2"])
+        return json.dumps([deciles, figures], cls=PlotlyJSONEncoder, sort_keys=True)
+
+    expected = [render(background) for background in backgrounds]
+    figure_cache.clear()
+
+    # Act
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(render, backgrounds * 5))
+
+    # Assert
+    assert results == expected * 5
+    assert len(figure_cache) <= figure_cache.maxsize
+
+
+def test_create_instrument_comparison():
+    # Arrange
+    static_store = load_static_data(None)
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "measurement.xlsx")
+    measurement = json.loads(json.dumps(measurement, default=json_default))
+    upload_store = [measurement, {**measurement, "filename": "second.xlsx"}]
+
+    # Act
+    closed, files = create_instrument_comparison(
+        None, upload_store, None, "m", True, "standard", "decile", static_store)
+    children, _ = create_instrument_comparison(
+        "comparison", upload_store, "1", "m", True, "standard", "decile", static_store)
+
+    # Assert
+    assert closed == []
+    assert files == [
+        {"value": "0", "label": "measurement.xlsx"},
+        {"value": "1", "label": "second.xlsx"},
+    ]
+    graph = children[0].children
+    assert graph[0].children == "second.xlsx"
+    figure = go.Figure(graph[-1].figure)
+    # One heatmap per hand, one column per instrument
+    assert [trace.type for trace in figure.data] == ["heatmap", "heatmap"]
+    assert len(figure.data[0].z[0]) == len(app.instrument_data)
+    assert figure.layout.xaxis.ticktext[0].startswith("Violine<br>Ø ")
+
+
+def test_upload_cards_are_patched():
+    # Arrange
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "measurement.xlsx")
+    measurement = json.loads(json.dumps(measurement, default=json_default))
+    upload_store = append_to_store(None, [measurement, measurement])
+    card_ids = [{"type": "file-card", "index": key} for key in [0, 1]]
+    button_ids = [{"type": "delete-file-button", "index": key} for key in [0, 1]]
+
+    # Act
+    cards = display_upload_store_content(upload_store, None, [])
+    deleted = delete_file_from_store([1, 0], button_ids, upload_store)
+    upload_store = append_to_store(upload_store[1:], [measurement])
+    patched = display_upload_store_content(upload_store, None, card_ids)
+
+    # Assert
+    assert [card.id for card in cards] == card_ids
+    assert [item["key"] for item in upload_store] == [1, 2]
+    assert deleted.to_plotly_json()["operations"] == [
+        {"operation": "Delete", "location": [0], "params": {}}]
+    # Only the deleted card is removed and the new card is appended
+    operations = patched.to_plotly_json()["operations"]
+    assert [operation["operation"] for operation in operations] == ["Delete", "Append"]
+    assert operations[0]["location"] == [0]
+    assert operations[1]["params"]["value"].id == {"type": "file-card", "index": 2}
+
+
+def test_warm_up_and_ready():
+    # Arrange
+    app.warm_up_done.clear()
+    figure_cache.clear()
+    client = app.server.test_client()
+
+    # Act
+    before = client.get("/ready")
+    seconds = app.warm_up()
+    after = client.get("/ready")
+
+    # Assert
+    assert before.status_code == 503
+    assert after.status_code == 200
+    assert after.get_json() == {"ready": True, "warm_up_seconds": seconds}
+    # Section figures of the synthetic measurement were built
+    assert len(figure_cache) > 0
+
+
+def test_api_requires_auth_in_production(production_status):
+    # Arrange
+    credentials = {"Authorization": "Basic " + base64.b64encode(b"user:secret").decode()}
+    routes = [
+        ("POST", "/api/bulk-score"),
+        ("GET", "/api/norms"),
+        ("POST", "/api/upload"),
+        ("POST", "/api/cohort"),
+    ]
+
+    # Act
+    statuses = production_status(
+        [(method, path, None) for method, path in routes]
+        + [("GET", "/api/norms", credentials), ("GET", "/ready", None)])
+
+    # Assert
+    assert statuses[:len(routes)] == [401] * len(routes)
+    assert statuses[len(routes)] == 200
+    # Readiness is checked without credentials
+    assert statuses[-1] == 503
@@ -0,0 +1,149 @@
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+import pandas as pd
+import handprofil.app as app
+from handprofil import archive
+from handprofil.app import compute_binned_values
+from handprofil.cube import NormsCube
+from handprofil.datasets import NormsDatasets
+from handprofil.scoring import read_workbook
+from handprofil.static_data import read_static_config
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def test_ingest_and_load_history(tmp_path, archive_path):
+    # Arrange
+    source = tmp_path / "measurements"
+    (source / "visit").mkdir(parents=True)
+    for path in [source / "a.xlsx", source / "visit" / "b.xlsx"]:
+        shutil.copy(get_testfile_path("data/measurement_template_filled.xlsx"), path)
+    (source / "broken.xlsx").write_bytes(b"broken")
+    (source / "notes.txt").write_text("ignored")
+
+    # Act
+    n_added, errors = archive.ingest(str(source), max_workers=1)
+    with closing(archive.connect()) as connection:
+        subjects = archive.list_subjects(connection)
+        history = archive.load_history(connection, "TM24")
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM measurements WHERE subject = ?", ("TM24",)
+        ).fetchall()
+
+    # Assert
+    # Identical workbooks are stored once
+    assert n_added == 1
+    assert len(errors) == 1 and errors[0].startswith("broken.xlsx")
+    assert subjects == ["TM24"]
+    assert len(history) == 1
+    assert history[0]["data"]["left"]["0"] == 194.0
+    assert "measurements_subject" in plan[0]["detail"]
+
+
+def test_compute_binned_values_stores_scores(archive_path):
+    # Arrange
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, [{
+            "info": {"id": {"0": 1, "1": 2}, "value": {"0": "S1", "1": "2024-02-12T00:00:00"}},
+            "data": {"id": {"0": 1}, "left": {"0": 178.0}, "right": {"0": 181.0}},
+            "filename": "s1.xlsx",
+        }])
+        history = archive.load_history(connection, "S1")
+
+    # Act
+    first = compute_binned_values(history, "m", "violine", True, "standard")
+    with closing(archive.connect()) as connection:
+        stored = archive.load_scores(
+            connection, [history[0]["archive_id"]], "m", "violine", True)
+    second = compute_binned_values(history, "m", "violine", True, "standard")
+
+    # Assert
+    assert stored[history[0]["archive_id"]] == [
+        {"id": 1, "hand": "left", "value": first[0]["value"][0]},
+        {"id": 1, "hand": "right", "value": first[0]["value"][1]},
+    ]
+    assert second == first
+
+
+
+def test_other_norms_do_not_store_scores(archive_path, tmp_path, monkeypatch):
+    # Arrange
+    pd.DataFrame({
+        "instrument": "violine", "sex": "m", "hand": ["left", "right"], "id": 1,
+        "bin_edge": 5, "value": 100.0,
+    }).to_csv(tmp_path / "basel.csv", index=False)
+    monkeypatch.setattr(app, "norms_datasets", NormsDatasets(str(tmp_path)))
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, [{
+            "info": {"id": {"0": 1, "1": 2}, "value": {"0": "S1", "1": "2024-02-12T00:00:00"}},
+            "data": {"id": {"0": 1}, "left": {"0": 178.0}, "right": {"0": 181.0}},
+            "filename": "s1.xlsx",
+        }])
+        history = archive.load_history(connection, "S1")
+
+    # Act
+    compute_binned_values(history, "m", "violine", True, "basel")
+    with closing(archive.connect()) as connection:
+        stored = archive.load_scores(
+            connection, [history[0]["archive_id"]], "m", "violine", True)
+
+    # Assert
+    # Only deciles of the default norms are kept in the archive
+    assert stored == {}
+
+def test_rescore_only_changed_norms(archive_path):
+    # Arrange
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "measurement.xlsx")
+    background_data = read_static_config()["background_data"]
+    old_cube = NormsCube.from_frame(background_data)
+    changed_id = int(measurement["data"]["id"][0])
+    is_changed = (background_data["instrument"] == "violine") & (background_data["sex"] == "m") \
+        & (background_data["hand"] == "left") & (background_data["id"] == changed_id)
+    new_cube = NormsCube.from_frame(
+        background_data.assign(value=background_data["value"].mask(is_changed, 10000.0)))
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, [measurement])
+        for instrument in ["violine", "klavier"]:
+            archive.store_missing_profiles(connection, "m", instrument, False, old_cube)
+        klavier = archive.load_scores(connection, [1], "m", "klavier", False)
+
+        # Act
+        moved = archive.rescore(connection, new_cube)
+        stored = {
+            instrument: archive.load_scores(
+                connection, [1], "m", instrument, False, new_cube.version)
+            for instrument in ["violine", "klavier"]
+        }
+        again = archive.rescore(connection, new_cube)
+
+    # Assert
+    assert old_cube.version != new_cube.version
+    # Only the changed attribute of the changed stratum moved
+    assert moved[["instrument", "id", "hand", "new"]].values.tolist() == [
+        ["violine", changed_id, "left", 1]]
+    assert moved["subject"].tolist() == ["TM24"]
+    assert stored["klavier"] == klavier
+    assert {"id": changed_id, "hand": "left", "value": 1} in stored["violine"][1]
+    assert again.empty
+
+
+def test_untagged_scores_are_migrated(archive_path):
+    # Arrange
+    with closing(sqlite3.connect(archive_path)) as connection:
+        connection.execute(
+            "CREATE TABLE scores (measurement_id INTEGER NOT NULL, sex TEXT NOT NULL, "
+            "instrument TEXT NOT NULL, background_hand INTEGER NOT NULL, deciles TEXT NOT NULL, "
+            "PRIMARY KEY (measurement_id, sex, instrument, background_hand))")
+
+    # Act
+    with closing(archive.connect()) as connection:
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(scores)")]
+
+    # Assert
+    assert columns[-1] == "norms_version"
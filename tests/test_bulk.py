@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import zipfile
+import pytest
+from handprofil.app import server
+from handprofil.bulk import iter_zip_entries, is_workbook_entry
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+class NonSeekableStream(io.RawIOBase):
+    """Write-only stream, forces zipfile to use data descriptors"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def create_archive(entries: dict, streamed: bool) -> bytes:
+    target = NonSeekableStream() if streamed else io.BytesIO()
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+    return (target.buffer if streamed else target).getvalue()
+
+
+@pytest.mark.parametrize("streamed", [(False), (True)])
+def test_iter_zip_entries(streamed):
+    # Arrange
+    entries = {
+        "a.xlsx": b"first" * 1000,
+        "folder/b.xlsx": os.urandom(100_000),
+        "empty.txt": b"",
+    }
+    archive = create_archive(entries, streamed)
+
+    # Act
+    result = dict(iter_zip_entries(io.BytesIO(archive)))
+
+    # Assert
+    assert result == entries
+
+
+def test_iter_zip_entries_corrupt():
+    archive = bytearray(create_archive({"a.xlsx": b"first" * 1000}, False))
+    archive[40] ^= 0xFF
+
+    with pytest.raises(Exception):
+        list(iter_zip_entries(io.BytesIO(bytes(archive))))
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("a.xlsx", True),
+        ("folder/A.XLSX", True),
+        ("__MACOSX/folder/._a.xlsx", False),
+        ("~$a.xlsx", False),
+        ("a.csv", False),
+    ],
+)
+def test_is_workbook_entry(filename, expected):
+    assert is_workbook_entry(filename) == expected
+
+
+def test_bulk_score_route():
+    # Arrange
+    with open(get_testfile_path("data/measurement_template_filled.xlsx"), "rb") as file:
+        workbook = file.read()
+
+    archive = create_archive(
+        {"first.xlsx": workbook, "second.xlsx": workbook, "broken.xlsx": b"broken"},
+        streamed=True
+    )
+
+    # Act
+    response = server.test_client().post(
+        "/api/bulk-score?sex=m&instrument=violine",
+        data=archive,
+        content_type="application/zip"
+    )
+
+    # Assert
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    results = {line["filename"]: line for line in lines}
+    assert len(results) == 3
+    assert not results["broken.xlsx"]["ok"]
+    assert results["first.xlsx"]["subject"] == "TM24"
+    assert results["first.xlsx"]["deciles"] == results["second.xlsx"]["deciles"]
+    assert {"id": 1, "hand": "left", "value": 13} in results["first.xlsx"]["deciles"]
+
+
+def test_bulk_score_route_invalid_instrument():
+    response = server.test_client().post(
+        "/api/bulk-score?instrument=triangel", data=b"")
+
+    assert response.status_code == 400
+
+
+def test_bulk_score_route_score_mode():
+    # Arrange
+    with open(get_testfile_path("data/measurement_template_filled.xlsx"), "rb") as file:
+        workbook = file.read()
+    archive = create_archive({"first.xlsx": workbook}, streamed=True)
+
+    # Act
+    response = server.test_client().post(
+        "/api/bulk-score?sex=m&instrument=violine&mode=zscore",
+        data=archive,
+        content_type="application/zip"
+    )
+    invalid = server.test_client().post("/api/bulk-score?mode=stanine", data=b"")
+
+    # Assert
+    result, = [json.loads(line) for line in response.data.splitlines()]
+    assert "deciles" not in result
+    assert all(isinstance(score["value"], float) for score in result["z_scores"])
+    assert invalid.status_code == 400
@@ -0,0 +1,103 @@
+import io
+import os
+import zipfile
+import numpy as np
+import openpyxl
+import pandas as pd
+from handprofil.app import server, create_cohort_plots, load_static_data
+from handprofil.cohort import cohort_decile_counts, collect_cohort, load_cohort
+from handprofil.cube import ALL_AGES, NormsCube
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+from handprofil.scoring import read_workbook
+from handprofil.static_data import read_static_config
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def test_cohort_decile_counts():
+    # Arrange
+    cube = NormsCube.from_frame(read_static_config()["background_data"])
+    data = pd.DataFrame({
+        "id": [1, 2, 3],
+        "left": [180.0, 80.0, np.nan],
+        "right": [190.0, np.nan, 0.4],
+    })
+    values = pd.concat([
+        data.melt(id_vars=["id"], var_name="hand").assign(subject=subject)
+        for subject in range(3)
+    ])
+
+    # Act
+    counts = cohort_decile_counts(values, cube.bin_edges("violine", "m", ALL_AGES, True))
+
+    # Assert
+    expected = cube.score(data, "violine", "m", ALL_AGES, True)
+    assert counts.sum(axis=1).eq(3).all()
+    for row in expected.itertuples():
+        assert counts.loc[(row.id, row.hand), row.value] == 3
+
+
+def test_cohort_values_on_edges():
+    # Arrange
+    cube = NormsDatasets(maxsize=1).get(DEFAULT_DATASET)
+    edges = cube.bin_edges("akkordeon", "m", ALL_AGES, True)
+    workbook = openpyxl.load_workbook(get_testfile_path("data/measurement_template_filled.xlsx"))
+    # Without birth date the measurement is scored in all ages like cohorts
+    workbook["Informationen"]["D6"] = None
+    on_edges = []
+    for row in workbook["Messungen"].iter_rows(min_row=2):
+        for cell, hand in [(row[4], "left"), (row[5], "right")]:
+            if (row[0].value, hand) in edges.index:
+                cell.value = edges.loc[(row[0].value, hand), row[0].value % 9 + 1]
+                on_edges.append(cell.value)
+    content = io.BytesIO()
+    workbook.save(content)
+
+    # Act
+    values, errors = collect_cohort([("a.xlsx", content.getvalue())], max_workers=1)
+    counts = cohort_decile_counts(values, edges)
+
+    # Assert
+    _, measurement = read_workbook(io.BytesIO(content.getvalue()), "a.xlsx")
+    expected = cube.score_measurement(measurement, "akkordeon", "m", True)
+    assert errors == []
+    # Some edges differ in single precision
+    assert any(np.float32(value) != value for value in on_edges)
+    for row in expected.itertuples():
+        assert counts.loc[(row.id, row.hand), row.value] == 1
+
+
+def test_cohort_route_and_plots():
+    # Arrange
+    with open(get_testfile_path("data/measurement_template_filled.xlsx"), "rb") as file:
+        workbook = file.read()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        for i in range(3):
+            zip_file.writestr(f"{i}.xlsx", workbook)
+
+    # Act
+    response = server.test_client().post(
+        "/api/cohort",
+        data={
+            "file": [
+                (io.BytesIO(archive.getvalue()), "cohort.zip"),
+                (io.BytesIO(workbook), "single.xlsx"),
+                (io.BytesIO(b"broken"), "broken.xlsx"),
+            ]
+        },
+        content_type="multipart/form-data"
+    )
+    plots, alerts = create_cohort_plots(
+        response.json, "m", "violine", True, "standard", load_static_data(None))
+
+    # Assert
+    assert len(response.json["tokens"]) == 1
+    assert len(response.json["errors"]) == 1
+    assert load_cohort(response.json["tokens"][0])["subject"].nunique() == 4
+    assert plots[0].children == "Anzahl Messungen: 4"
+    assert len(plots) > 1
+    assert len(alerts) == 1
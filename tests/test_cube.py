@@ -0,0 +1,147 @@
+import datetime
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from handprofil.cube import NormsCube, age_band, age_in_years
+from handprofil.scoring import read_workbook
+from handprofil.static_data import read_static_config
+from reference_scoring import bin_measurements, prepare_background
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def get_background(age_bands):
+    return pd.DataFrame([
+        {"instrument": "violine", "sex": "m", "hand": "left", "age_band": band,
+         "id": 1, "bin_edge": bin_edge, "value": offset + 10 * bin_edge}
+        for band, offset in age_bands.items()
+        for bin_edge in range(1, 10)
+    ])
+
+
+def test_age_band():
+    assert age_in_years(datetime.datetime(1996, 1, 10), datetime.datetime(2024, 1, 9)) == 27
+    assert age_in_years("1996-01-10", "2024-01-10") == 28
+    assert age_in_years(None, "2024-01-10") is None
+    assert age_band(11) == "unter 12"
+    assert age_band(12) == "12-17"
+    assert age_band(64) == "ab 50"
+    assert age_band(None) == "alle"
+
+
+def test_lookup_falls_back_to_all_ages():
+    # Arrange
+    cube = NormsCube.from_frame(get_background({"alle": 0, "12-17": 5}))
+
+    # Act
+    child = cube.lookup("violine", "m", "12-17", [1], ["left"], False)
+    adult = cube.lookup("violine", "m", "30-49", [1], ["left"], False)
+    right = cube.lookup("violine", "m", "12-17", [1, 99], ["right", "left"], True)
+    missing = cube.lookup("klavier", "m", "12-17", [1], ["left"], True)
+
+    # Assert
+    assert np.array_equal(child[0], 5 + 10 * np.arange(1, 10))
+    assert np.array_equal(adult[0], 10 * np.arange(1, 10))
+    assert np.array_equal(right[0], child[0])
+    assert np.isnan(right[1]).all()
+    assert np.isnan(missing).all()
+
+
+@pytest.mark.parametrize("instrument, sex, background_hand", [
+    ("violine", "m", True), ("gemischt", "w", False), ("schlagzeug", "m", False),
+])
+def test_score_like_bin_measurements(instrument, sex, background_hand):
+    # Arrange
+    background_data = read_static_config()["background_data"]
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "test.xlsx")
+    data = pd.DataFrame.from_dict(measurement["data"])
+
+    # Act
+    scores = NormsCube.from_frame(background_data)\
+        .score_measurement(measurement, instrument, sex, background_hand)
+
+    # Assert
+    expected = bin_measurements(
+        data, prepare_background(background_data, sex, instrument, background_hand))
+    pd.testing.assert_frame_equal(scores, expected, check_dtype=False)
+
+
+def test_score_modes():
+    # Arrange
+    cube = NormsCube.from_frame(get_background({"alle": 0}))
+    data = pd.DataFrame({"id": [1, 1, 1, 1], "left": [5, 10, 55, 120]})\
+        .assign(right=np.nan)
+
+    # Act
+    deciles = cube.score(data, "violine", "m", "alle", False)
+    percentiles = cube.score(data, "violine", "m", "alle", False, "percentile")
+    z_scores = cube.score(data, "violine", "m", "alle", False, "zscore")
+
+    # Assert
+    assert deciles["value"].tolist() == [1, 2, 11, 19]
+    # Extrapolated beyond the outer edges, clipped to 0 and 100
+    assert percentiles["value"].tolist() == [5, 10, 55, 100]
+    np.testing.assert_allclose(
+        z_scores["value"], np.array([-45, -40, 5, 70]) / (80 / (2 * 1.2815515655446004)))
+
+
+def test_percentiles_lie_in_their_decile_bins():
+    # Arrange
+    background_data = read_static_config()["background_data"]
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "test.xlsx")
+    cube = NormsCube.from_frame(background_data)
+
+    # Act
+    deciles = cube.score_measurement(measurement, "violine", "m", True)
+    percentiles = cube.score_measurement(measurement, "violine", "m", True, "percentile")
+
+    # Assert
+    scores = deciles.merge(percentiles, on=["id", "hand"], suffixes=("_decile", "_percentile"))
+    # Bin b lies between the percentiles 5 * (b - 1) and 5 * (b + 1) on the decile axis
+    assert len(scores) == len(deciles)
+    assert (scores["value_percentile"] / 5 - scores["value_decile"]).abs().max() <= 1
+
+
+@pytest.mark.parametrize("mode", ["decile", "percentile"])
+def test_score_instruments_like_score_measurement(mode):
+    # Arrange
+    cube = NormsCube.from_frame(read_static_config()["background_data"])
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "test.xlsx")
+    instruments = ["violine", "klavier", "triangel", "gemischt"]
+
+    # Act
+    scores = cube.score_instruments(measurement, instruments, "w", True, mode)
+
+    # Assert
+    assert "triangel" not in set(scores["instrument"])
+    for instrument in ["violine", "klavier", "gemischt"]:
+        expected = cube.score_measurement(measurement, instrument, "w", True, mode)
+        pd.testing.assert_frame_equal(
+            scores[scores["instrument"] == instrument]
+            .drop(columns="instrument").reset_index(drop=True),
+            expected,
+            check_dtype=False,
+        )
+
+
+def test_diff_and_version():
+    # Arrange
+    cube = NormsCube.from_frame(get_background({"alle": 0, "12-17": 5}))
+    changed = NormsCube.from_frame(get_background({"alle": 1, "12-17": 5}))
+
+    # Act
+    changes = cube.diff(changed)
+
+    # Assert
+    assert NormsCube.from_frame(cube.to_frame()).version == cube.version
+    assert changed.version != cube.version
+    # Age bands filled from all ages change with them
+    assert sorted(changes["age_band"]) == ["18-29", "30-49", "ab 50", "alle", "unter 12"]
+    assert set(changes["instrument"]) == {"violine"}
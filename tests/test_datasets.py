@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from handprofil.app import server
+from handprofil.datasets import DEFAULT_DATASET, NormsDatasets
+
+
+def write_dataset(path, offset):
+    pd.DataFrame({
+        "instrument": "violine",
+        "sex": "m",
+        "hand": "left",
+        "id": 1,
+        "bin_edge": range(1, 10),
+        "value": [offset + 10.0 * i for i in range(1, 10)],
+    }).to_csv(path, index=False)
+
+
+def test_norms_datasets(tmp_path):
+    # Arrange
+    for i, name in enumerate(["basel", "bern", "zuerich"]):
+        write_dataset(tmp_path / f"{name}.csv", i)
+    (tmp_path / "invalid name.csv").write_text("")
+    datasets = NormsDatasets(str(tmp_path), maxsize=2)
+
+    # Act
+    names = datasets.names()
+    basel = datasets.get("basel")
+    datasets.get("bern")
+    datasets.get("basel")
+    datasets.get("zuerich")
+    metrics = datasets.metrics()
+
+    # Assert
+    assert names == [DEFAULT_DATASET, "basel", "bern", "zuerich"]
+    assert basel.lookup("violine", "m", "alle", [1], ["left"], False)[0, 0] == 10
+    assert metrics["resident"] == 2
+    assert (metrics["loads"], metrics["hits"]) == (3, 1)
+    with pytest.raises(KeyError):
+        datasets.get("../background")
+
+
+def test_list_norms():
+    # Act
+    response = server.test_client().get("/api/norms")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json["datasets"][0] == DEFAULT_DATASET
+    assert set(response.json["metrics"]) >= {"resident", "loads", "load_seconds"}
@@ -0,0 +1,75 @@
+import io
+import numpy as np
+import pandas as pd
+from handprofil.app import server, upload_tokens_to_store
+from handprofil.devices import read_device_export, read_export_header, reduce_export
+
+
+def return_export(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = pd.DataFrame({
+        "id": np.repeat([1, 201], n),
+        "hand": rng.choice(["L", "R", "links"], size=2 * n),
+        "value": np.concatenate([rng.normal(180, 2, n), rng.uniform(0, 40, n)]),
+        "time": np.tile(np.arange(n) / 100, 2),
+    })
+    header = "# ID: TM24\n# Datum: 2024-02-12\n# Geburtsdatum: 1996-01-10\n"
+    return samples, (header + samples.to_csv(index=False)).encode()
+
+
+def test_reduce_export_in_blocks():
+    # Arrange
+    samples, content = return_export()
+
+    # Act
+    stream = io.BytesIO(content)
+    metadata, column_names = read_export_header(stream)
+    reduced = reduce_export(stream, column_names, block_size=4096)
+
+    # Assert
+    assert metadata["ID"] == "TM24"
+    assert column_names == ["id", "hand", "value", "time"]
+    expected = samples.groupby(["id", "hand"])["value"].agg(["sum", "count", "min", "max"])
+    actual = reduced.set_index(["id", "hand"]).loc[expected.index]
+    assert np.allclose(actual, expected)
+
+
+def test_read_device_export():
+    # Arrange
+    samples, content = return_export()
+    samples["hand"] = samples["hand"].replace({"L": "left", "links": "left", "R": "right"})
+
+    # Act
+    is_success, result = read_device_export(io.BytesIO(content), "export.csv")
+
+    # Assert
+    assert is_success
+    assert result["info"]["value"] == {0: "TM24", 1: "2024-02-12", 2: "1996-01-10"}
+    data = pd.DataFrame.from_dict(result["data"]).set_index("id")
+    # Handlabor readings are averaged, time series of the wrist machine peak
+    left = samples.query("hand == 'left'").groupby("id")["value"]
+    assert np.isclose(data.loc[1, "left"], left.mean()[1])
+    assert np.isclose(data.loc[201, "left"], left.max()[201])
+
+
+def test_read_device_export_errors():
+    assert read_device_export(io.BytesIO(b"id,hand,value\n1,L,3\n"), "a.csv") == \
+        (False, "Informationen: Pflichtfeld 1 fehlt")
+    is_success, result = read_device_export(io.BytesIO(b"# ID: A\nid,hand,value\nx,L,3\n"), "b.csv")
+    assert not is_success and result.startswith("Ungültiger Geräteexport")
+
+
+def test_upload_route_device_export():
+    # Act
+    response = server.test_client().post(
+        "/api/upload",
+        data=return_export()[1],
+        headers={"X-Filename": "export.csv"},
+        content_type="application/octet-stream"
+    )
+
+    # Assert
+    assert response.json["errors"] == []
+    data, errors = upload_tokens_to_store(response.json, None)
+    assert data[0]["info"]["value"]["0"] == "TM24"
+    assert set(data[0]["data"]["id"].values()) == {1, 201}
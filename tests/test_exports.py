@@ -0,0 +1,104 @@
+import base64
+import io
+from contextlib import closing
+import openpyxl
+import pandas as pd
+from handprofil import archive
+from handprofil.app import server, download_export, load_static_data
+from handprofil.exports import export_columns, iter_csv, iter_rows, iter_xlsx
+from handprofil.static_data import read_static_config
+
+
+measurement = {
+    "info": {"id": {"0": 1, "1": 2}, "value": {"0": "S1", "1": "2024-02-12T00:00:00"}},
+    "data": {"id": {"0": 1, "1": 2}, "left": {"0": 178.0, "1": None}, "right": {"0": 181.0, "1": 7.5}},
+    "filename": "s1.xlsx",
+}
+
+
+def test_rows_of_measurement():
+    # Arrange
+    deciles = pd.DataFrame({"id": [1, 1], "hand": ["left", "right"], "value": [3, 4]})
+    measure_labels = read_static_config()["measure_labels"]
+
+    # Act
+    rows = list(iter_rows([(measurement, deciles)], measure_labels))
+
+    # Assert
+    assert [row[7] for row in rows] == ["links", "rechts", "rechts"]
+    assert [row[8] for row in rows] == [178.0, 181.0, 7.5]
+    # Attributes without background have no decile
+    assert [row[9] for row in rows] == [3, 4, None]
+    assert rows[0][:3] == ["S1", "12.02.2024", "s1.xlsx"]
+
+
+def test_csv_and_xlsx_writers():
+    # Arrange
+    rows = [["S1", "12.02.2024", "s1.xlsx", 1, "Handlabor", "Länge", "mm", "links", 178.0, 3]]
+
+    # Act
+    content = b"".join(iter_csv(iter(rows)))
+    workbook = openpyxl.load_workbook(io.BytesIO(b"".join(iter_xlsx(iter(rows)))))
+
+    # Assert
+    lines = content.decode("utf-8-sig").splitlines()
+    assert content.startswith(b"\xef\xbb\xbf")
+    assert lines[0] == ";".join(export_columns.values())
+    assert lines[1] == "S1;12.02.2024;s1.xlsx;1;Handlabor;Länge;mm;links;178.0;3"
+    values = list(workbook["Ergebnisse"].values)
+    assert values[0] == tuple(export_columns.values())
+    assert values[1] == tuple(rows[0])
+
+
+def test_export_route_streams_archive(archive_path):
+    # Arrange
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, [measurement])
+    client = server.test_client()
+
+    # Act
+    response = client.get("/api/export?format=csv&sex=m&instrument=violine&subject=S1")
+    lines = response.get_data().decode("utf-8-sig").splitlines()
+    empty = client.get("/api/export?format=csv&subject=unbekannt").get_data()
+    invalid = client.get("/api/export?format=pdf")
+
+    # Assert
+    assert response.status_code == 200
+    assert "attachment; filename=Ergebnisse.csv" == response.headers["Content-Disposition"]
+    assert len(lines) == 4
+    assert lines[1].startswith("S1;12.02.2024;s1.xlsx;1;")
+    assert len(empty.decode("utf-8-sig").splitlines()) == 1
+    assert invalid.status_code == 400
+
+
+def test_export_route_requires_auth_in_production(production_status):
+    # Act
+    statuses = production_status([
+        ("GET", "/api/export?format=csv", None),
+        ("GET", "/api/export?format=xlsx&subject=S1", None),
+    ])
+
+    # Assert
+    assert statuses == [401, 401]
+
+
+def test_download_export_of_page():
+    # Arrange
+    deciles = {"id": {"0": 1, "1": 1}, "hand": {"0": "left", "1": "right"}, "value": {"0": 3, "1": 4}}
+    static_store = load_static_data(None)
+
+    # Act
+    downloads = {
+        export_format: download_export(
+            None, None, [measurement], [deciles], static_store, "decile", export_format)
+        for export_format in ["csv", "xlsx"]
+    }
+
+    # Assert
+    assert downloads["csv"]["filename"] == "Ergebnisse.csv"
+    lines = base64.b64decode(downloads["csv"]["content"]).decode("utf-8-sig").splitlines()
+    assert len(lines) == 4
+    assert lines[1].startswith("S1;12.02.2024;s1.xlsx;1;")
+    workbook = openpyxl.load_workbook(
+        io.BytesIO(base64.b64decode(downloads["xlsx"]["content"])))
+    assert len(list(workbook["Ergebnisse"].values)) == 4
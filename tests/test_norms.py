@@ -0,0 +1,150 @@
+import os
+import openpyxl
+import numpy as np
+import pandas as pd
+from handprofil.norms import (
+    build_norms,
+    coverage_report,
+    grouped_decile_edges,
+    main,
+    normalize_instrument,
+    sketch_norms,
+    update_sketches,
+    write_workbook_dataset,
+)
+from handprofil.bulk import iter_directory_entries
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def write_dataset(path, n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    for instrument in ["violine", "klavier"]:
+        partition = path / f"instrument={instrument}"
+        partition.mkdir(parents=True)
+        pd.DataFrame({
+            "sex": rng.choice(["m", "w"], size=4 * n),
+            "hand": np.repeat(["left", "right"], 2 * n),
+            "id": np.tile([1, 2], 2 * n),
+            "value": rng.normal(100, 10, size=4 * n),
+        }).to_parquet(partition / "part.parquet", index=False)
+
+
+def test_normalize_instrument():
+    assert normalize_instrument("E-Gitarre") == "egitarre"
+    assert normalize_instrument(" Violine ") == "violine"
+    assert normalize_instrument(None) is None
+
+
+def test_grouped_decile_edges():
+    # Arrange
+    values = pd.DataFrame({
+        "instrument": "violine",
+        "sex": "m",
+        "age_band": "alle",
+        "hand": ["left"] * 30 + ["right"] * 5,
+        "id": 1,
+        "value": np.arange(35, dtype=float),
+    })
+
+    # Act
+    edges, counts = grouped_decile_edges(values, min_count=20)
+
+    # Assert
+    assert edges["bin_edge"].tolist() == list(range(1, 10))
+    assert np.allclose(edges["value"], np.quantile(np.arange(30), np.arange(1, 10) / 10))
+    assert counts["n"].tolist() == [30, 5]
+
+
+def test_build_norms(tmp_path):
+    # Arrange
+    write_dataset(tmp_path)
+    values = pd.read_parquet(tmp_path)
+
+    # Act
+    norms, coverage = build_norms(str(tmp_path), max_workers=1, min_count=10)
+    report = coverage_report(coverage, [1, 2, 3], min_count=10)
+
+    # Assert
+    assert list(norms.columns) == ["instrument", "sex", "hand", "age_band", "id", "bin_edge", "value"]
+    assert set(norms["age_band"]) == {"alle"}
+    assert set(norms["instrument"]) == {"violine", "klavier", "gemischt"}
+    # The pooled stratum covers all instruments
+    pooled = values.query("sex == 'm' & hand == 'left' & id == 1")["value"]
+    expected = np.quantile(pooled, np.arange(1, 10) / 10)
+    actual = norms.query(
+        "instrument == 'gemischt' & sex == 'm' & hand == 'left' & id == 1")["value"]
+    assert np.allclose(actual, expected)
+    assert set(report.loc[report["id"] == 3, "status"]) == {"keine Messungen"}
+
+
+def test_norms_from_workbooks(tmp_path):
+    # Arrange
+    source = tmp_path / "workbooks"
+    source.mkdir()
+    workbook = openpyxl.load_workbook(get_testfile_path("data/measurement_template_filled.xlsx"))
+    for i, sex in enumerate(["W", "M", "M/F/D"]):
+        # Geschlecht
+        workbook.worksheets[0]["D7"] = sex
+        workbook.save(source / f"{i}.xlsx")
+    dataset = tmp_path / "dataset"
+
+    # Act
+    errors = write_workbook_dataset(
+        iter_directory_entries(str(source)), str(dataset), max_workers=1)
+    values = pd.read_parquet(dataset)
+
+    # Assert
+    assert len(errors) == 1 and errors[0].startswith("2.xlsx")
+    assert set(values["instrument"]) == {"violine"}
+    assert set(values["sex"]) == {"m", "w"}
+    assert set(values["age_band"]) == {"18-29"}
+    left = values.query("sex == 'w' & hand == 'left' & id == 1")["value"]
+    assert left.tolist() == [194.0]
+
+
+def test_main(tmp_path):
+    # Arrange
+    write_dataset(tmp_path / "dataset")
+
+    # Act
+    main([
+        str(tmp_path / "dataset"),
+        str(tmp_path / "background.csv"),
+        "--coverage", str(tmp_path / "coverage.csv"),
+        "--min-count", "10",
+        "--workers", "1",
+    ])
+
+    # Assert
+    norms = pd.read_csv(tmp_path / "background.csv")
+    coverage = pd.read_csv(tmp_path / "coverage.csv")
+    assert len(norms) == 3 * 2 * 2 * 2 * 9
+    assert set(coverage.columns) == {"instrument", "sex", "hand", "age_band", "id", "n", "status"}
+
+
+def test_update_sketches(tmp_path):
+    # Arrange
+    write_dataset(tmp_path / "first", seed=0)
+    write_dataset(tmp_path / "second", seed=1)
+    sketches = tmp_path / "sketches"
+
+    # Act
+    update_sketches(str(tmp_path / "first"), str(sketches), max_workers=1)
+    updated = update_sketches(str(tmp_path / "second"), str(sketches), max_workers=1)
+    norms, coverage = sketch_norms(str(sketches), min_count=10)
+
+    # Assert
+    assert updated == ["gemischt", "klavier", "violine"]
+    values = pd.concat([
+        pd.read_parquet(tmp_path / "first"), pd.read_parquet(tmp_path / "second")])
+    selected = values.query("instrument == 'violine' & sex == 'w' & hand == 'right' & id == 2")
+    assert coverage.query(
+        "instrument == 'violine' & sex == 'w' & hand == 'right' & id == 2")["n"].item() == len(selected)
+    exact = np.quantile(selected["value"], np.arange(1, 10) / 10, method="lower")
+    actual = norms.query(
+        "instrument == 'violine' & sex == 'w' & hand == 'right' & id == 2")["value"]
+    assert np.all(np.abs(actual.to_numpy() - exact) <= 0.005 * exact)
@@ -0,0 +1,76 @@
+import base64
+import io
+import zipfile
+import openpyxl
+from handprofil.app import download_prefilled_workbooks
+from handprofil.prefill import WorkbookTemplate, iter_workbooks, read_participants, write_zip
+from handprofil.scoring import read_workbook_sheets
+
+
+participants_csv = (
+    "ID;Name;Vorname;Geburtsdatum;Geschlecht;Händigkeit;Instrument\n"
+    "TM24;Muster & Co;Max;10.01.1996;M;R;Violine\n"
+    "TM24;Muster;Eva;;F;L;Viola\n"
+    ";Ohne;ID;;;;\n"
+    "TM25;Falsch;Datum;32.13.1996;;;\n"
+)
+
+
+def test_read_participants():
+    # Act
+    participants, errors = read_participants(io.StringIO(participants_csv))
+
+    # Assert
+    assert len(participants) == 2
+    assert participants[0][3] == "Muster & Co"
+    assert participants[0][5].strftime("%d.%m.%Y") == "10.01.1996"
+    # Empty cells are not filled
+    assert 5 not in participants[1]
+    assert errors == [
+        "Zeile 4: Pflichtfeld 1 fehlt",
+        "Zeile 5: Geburtsdatum 32.13.1996 ist kein Datum",
+    ]
+
+
+def test_prefilled_workbooks():
+    # Arrange
+    participants, _ = read_participants(io.StringIO(participants_csv))
+    template = WorkbookTemplate()
+    buffer = io.BytesIO()
+
+    # Act
+    write_zip(iter_workbooks(participants, template), buffer)
+
+    # Assert
+    archive = zipfile.ZipFile(buffer)
+    assert archive.namelist() == ["TM24.xlsx", "TM24_2.xlsx"]
+    content = archive.read("TM24.xlsx")
+    info, _ = read_workbook_sheets(io.BytesIO(content))
+    assert info.set_index("id")["value"].to_dict() == {
+        1: "TM24",
+        3: "Muster & Co",
+        4: "Max",
+        5: participants[0][5].to_pydatetime(),
+        6: "M",
+        7: "R",
+        8: "Violine",
+    }
+    # Styles and the measurement sheet of the template are kept
+    workbook = openpyxl.load_workbook(io.BytesIO(content))
+    assert workbook.sheetnames == ["Informationen", "Messungen"]
+    assert workbook["Informationen"]["D6"].is_date
+    assert workbook["Informationen"]["D2"].protection.locked is False
+
+
+def test_download_prefilled_workbooks():
+    # Arrange
+    contents = "data:text/csv;base64," + base64.b64encode(participants_csv.encode()).decode()
+
+    # Act
+    download, reset, alerts = download_prefilled_workbooks(contents)
+
+    # Assert
+    assert download["filename"] == "Vorlagen.zip"
+    assert len(zipfile.ZipFile(io.BytesIO(base64.b64decode(download["content"]))).namelist()) == 2
+    assert reset is None
+    assert alerts[0].children.startswith("Zeile 4")
@@ -0,0 +1,117 @@
+from contextlib import closing
+import numpy as np
+from handprofil import archive
+from handprofil.app import find_similar_profiles, get_plot_input_data, load_static_data
+from handprofil.profiles import ProfileIndex, find_similar, index_cache
+
+
+def return_measurement(subject: str, length: float) -> dict:
+    return {
+        "info": {"id": {"0": 1, "1": 2}, "value": {"0": subject, "1": "2024-02-12T00:00:00"}},
+        "data": {
+            "id": {"0": 1, "1": 2, "2": 3, "3": 4},
+            "left": {"0": length, "1": 80.0, "2": 20.0, "3": 60.0},
+            "right": {"0": length + 2, "1": 82.0, "2": 21.0, "3": 62.0},
+        },
+        "filename": f"{subject}.xlsx",
+    }
+
+
+def test_profile_vector():
+    # Arrange
+    deciles = [
+        {"id": 2, "hand": "right", "value": 7},
+        {"id": 1, "hand": "left", "value": 3},
+        {"id": 9999, "hand": "left", "value": 5},
+    ]
+
+    # Act
+    vector = archive.profile_vector(deciles)
+
+    # Assert
+    assert vector.shape == (2 * len(archive.profile_ids()),)
+    assert np.count_nonzero(~np.isnan(vector)) == 2
+    # Unknown attributes are dropped
+    assert archive.profile_records(vector) == deciles[:2][::-1]
+
+
+def test_search_like_brute_force():
+    # Arrange
+    rng = np.random.default_rng(0)
+    vectors = rng.integers(1, 20, (500, 40)).astype(np.float32)
+    vectors[rng.random(vectors.shape) < 0.3] = np.nan
+    query = vectors[17].copy()
+    index = ProfileIndex(np.arange(100, 600), vectors)
+
+    # Act
+    matches = index.search(query, k=5, exclude=[100 + 17])
+
+    # Assert
+    is_common = ~np.isnan(vectors) & ~np.isnan(query)
+    expected = np.sqrt(
+        np.where(is_common, (vectors - query) ** 2, 0).sum(axis=1) / is_common.sum(axis=1))
+    expected[17] = np.inf
+    order = np.argsort(expected, kind="stable")[:5]
+    assert [id for id, _, _ in matches] == (order + 100).tolist()
+    assert np.allclose([distance for _, distance, _ in matches], expected[order], atol=1e-4)
+    assert np.array_equal(index.vector(105), vectors[5], equal_nan=True)
+
+
+def test_find_similar_in_archive(archive_path):
+    # Arrange
+    measurements = [return_measurement(f"S{i}", 150.0 + 10 * i) for i in range(4)]
+
+    # Act
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, measurements[:3])
+        n_first = archive.store_missing_profiles(connection, "m", "violine", True)
+        query = archive.load_scores(connection, [1], "m", "violine", True)[1]
+        first = find_similar(connection, query, "m", "violine", True, k=2, exclude=[1])
+        scores = archive.load_scores(connection, [2], "m", "violine", True)[2]
+
+        # Stored profiles invalidate the index
+        archive.add_measurements(connection, measurements[3:])
+        n_second = archive.store_missing_profiles(connection, "m", "violine", True)
+        second = find_similar(connection, query, "m", "violine", True, k=10)
+
+    # Assert
+    assert (n_first, n_second) == (3, 1)
+    assert [match["subject"] for match in first] == ["S1", "S2"]
+    assert first[0]["deciles"] == sorted(scores, key=lambda record: record["id"])
+    assert len(second) == 4
+    # The rebuilt index replaced the stale one
+    assert len(index_cache) == 1
+    assert second[0]["subject"] == "S0" and second[0]["distance"] == 0
+
+
+def test_similar_profiles_are_overlays(archive_path):
+    # Arrange
+    static_store = load_static_data(None)
+    with closing(archive.connect()) as connection:
+        archive.add_measurements(connection, [return_measurement("S1", 160.0)])
+        archive.store_missing_profiles(connection, "m", "violine", True)
+        deciles = archive.load_scores(connection, [1], "m", "violine", True)[1]
+    decile_data_store = [{
+        "id": {str(i): record["id"] for i, record in enumerate(deciles)},
+        "hand": {str(i): record["hand"] for i, record in enumerate(deciles)},
+        "value": {str(i): record["value"] for i, record in enumerate(deciles)},
+    }]
+    upload_store = [{**return_measurement("S2", 160.0), "key": 0}]
+    arguments = [upload_store, "m", "violine", True]
+
+    # Act
+    off, _, files = find_similar_profiles(decile_data_store, "0", 0, *arguments, "standard", "decile")
+    matches, messages, _ = find_similar_profiles(
+        decile_data_store, "0", 3, *arguments, "standard", "decile")
+    _, warning, _ = find_similar_profiles(
+        decile_data_store, "0", 3, *arguments, "standard", "percentile")
+    plot_files = get_plot_input_data(decile_data_store, static_store, None, upload_store, matches)
+
+    # Assert
+    assert off is None
+    assert files == [{"value": "0", "label": "S2.xlsx"}]
+    assert [match["subject"] for match in matches] == ["S1"]
+    assert messages[0].children.startswith("S1, 12.02.2024: Ø Abstand 0.0")
+    assert warning[0].color == "yellow"
+    assert len(plot_files) == 2
+    assert set(plot_files[1]["color_id"].values()) == {-1}
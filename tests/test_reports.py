@@ -0,0 +1,87 @@
+import io
+import os
+import zipfile
+from handprofil.reports import (
+    _report_skeleton,
+    render_reports,
+    return_report_figure,
+    write_reports_zip,
+)
+from handprofil.cube import NormsCube
+from handprofil.scoring import read_workbook
+from handprofil.static_data import read_static_config
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def read_testfile():
+    with open(get_testfile_path("data/measurement_template_filled.xlsx"), "rb") as file:
+        return file.read()
+
+
+def test_return_report_figure():
+    # Arrange
+    static_config = read_static_config()
+    _, measurement = read_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"), "test.xlsx")
+    deciles = NormsCube.from_frame(static_config["background_data"])\
+        .score_measurement(measurement, "violine", "m", True)
+    _report_skeleton.cache_clear()
+
+    # Act
+    first = return_report_figure(measurement, deciles, static_config)
+    second = return_report_figure(measurement, deciles, static_config)
+
+    # Assert
+    texts = [annotation.text for annotation in first.layout.annotations]
+    assert any("ID: TM24" in text for text in texts)
+    assert "Handform" in texts
+    # The skeleton is shared, the traces are added to a copy
+    assert _report_skeleton.cache_info().hits == 1
+    assert len(first.data) == len(second.data) > 0
+
+
+def test_render_reports():
+    # Arrange
+    entries = [
+        ("a.xlsx", read_testfile()),
+        ("b.xlsx", read_testfile()),
+        ("broken.xlsx", b"broken"),
+        ("ignored.txt", b""),
+    ]
+
+    # Act
+    results = list(render_reports(entries, "m", "violine", True, max_workers=1))
+
+    # Assert
+    reports = {result["name"]: result["report"] for result in results if result["ok"]}
+    # Both workbooks are of the same subject and date
+    assert sorted(reports) == ["TM24_2024-02-12.pdf", "TM24_2024-02-12_2.pdf"]
+    assert all(report.startswith(b"%PDF") for report in reports.values())
+    assert [result["filename"] for result in results if not result["ok"]] == ["broken.xlsx"]
+
+
+def test_write_reports_zip():
+    # Arrange
+    static_config = read_static_config()
+    _, measurement = read_workbook(io.BytesIO(read_testfile()), "test.xlsx")
+    deciles = NormsCube.from_frame(static_config["background_data"])\
+        .score_measurement(measurement, "violine", "m", True)
+
+    info = measurement["info"]
+    without_id = {**measurement, "info": {
+        column: {key: value for key, value in values.items() if info["id"][key] != 1}
+        for column, values in info.items()
+    }}
+
+    # Act
+    content, errors = write_reports_zip(
+        [measurement, measurement, without_id], [deciles] * 3, static_config, max_workers=2)
+
+    # Assert
+    assert errors == []
+    assert zipfile.ZipFile(io.BytesIO(content)).namelist() == [
+        "TM24_2024-02-12.pdf", "TM24_2024-02-12_2.pdf", "test_2024-02-12.pdf"]
@@ -0,0 +1,96 @@
+import io
+import os
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from handprofil.scoring import read_workbook_sheets, read_workbooks
+from handprofil.schemas import get_workbook_checks, validate_workbooks
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+broken_cells = [
+    (0, "D3", "kein Datum"),
+    (1, "E3", "abc"),  # Text as value
+    (1, "A4", 1),  # Duplicated id
+    (1, "A5", 999),  # Unknown id
+    (1, "F6", 5000),  # Out of range
+]
+
+
+def create_broken_workbook(cells: list = broken_cells) -> io.BytesIO:
+    workbook = openpyxl.load_workbook(
+        get_testfile_path("data/measurement_template_filled.xlsx"))
+    for sheet, cell, value in cells:
+        workbook.worksheets[sheet][cell] = value
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_validate_workbooks():
+    # Arrange
+    valid = read_workbook_sheets(
+        get_testfile_path("data/measurement_template_filled.xlsx"))
+    broken = read_workbook_sheets(create_broken_workbook())
+
+    # Act
+    results = validate_workbooks([valid, broken, valid])
+
+    # Assert
+    assert results[0][2] == []
+    assert results[2][2] == []
+    assert results[0][1]["id"].dtype == "int64"
+    assert results[0][1]["left"].dtype == "float64"
+    pd.testing.assert_frame_equal(results[0][1], results[2][1])
+
+    assert results[1][2] == [
+        "Informationen: Zeile 3: Ungültiges Datum",
+        "Messungen: Zeile 2: Doppelte ID",
+        "Messungen: Zeile 3: Links: Ungültiger Wert (abc)",
+        "Messungen: Zeile 4: Doppelte ID",
+        "Messungen: Zeile 5: ID: Unbekannte ID (999)",
+        "Messungen: Zeile 6: Rechts: Wert ausserhalb des plausiblen Bereichs",
+    ]
+
+
+def test_read_workbooks_rejects_early():
+    # Act
+    results = read_workbooks([
+        (create_broken_workbook(), "broken.xlsx"),
+        (get_testfile_path("data/measurement_template_filled.xlsx"), "valid.xlsx"),
+        (io.BytesIO(b"no workbook"), "invalid.xlsx"),
+    ])
+
+    # Assert
+    assert [is_success for is_success, _ in results] == [False, True, False]
+    assert "Doppelte ID" in results[0][1]
+    assert results[1][1]["filename"] == "valid.xlsx"
+
+
+@pytest.mark.parametrize("cell", broken_cells)
+def test_checks_reject_like_schemas(cell):
+    # Arrange
+    broken = read_workbook_sheets(create_broken_workbook([cell]))
+    valid = read_workbook_sheets(get_testfile_path("data/measurement_template_filled.xlsx"))
+
+    def passes_checks(sheets: tuple) -> bool:
+        return all(
+            is_valid(sheet, np.zeros(len(sheet), dtype=np.int64))
+            for is_valid, sheet in zip(get_workbook_checks(), sheets)
+        )
+
+    # Act
+    (_, _, errors), = validate_workbooks([broken])
+
+    # Assert
+    # Sheets passing the checks skip pandera, so they must be valid
+    assert passes_checks(valid)
+    assert not passes_checks(broken)
+    assert len(errors) > 0
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from handprofil.sketches import (
+    MIN_VALUE,
+    merge_sketches,
+    sketch_quantiles,
+    sketch_values,
+)
+
+
+QUANTILES = np.arange(1, 10) / 10
+
+
+def get_values(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "group": np.repeat(["normal", "lognormal", "signed"], n),
+        "value": np.concatenate([
+            rng.normal(80, 15, n),
+            rng.lognormal(3, 1, n),
+            rng.normal(0, 3, n),
+        ]),
+    })
+
+
+def test_sketch_quantiles_accuracy():
+    # Arrange
+    values = get_values(5000)
+    relative_accuracy = 0.01
+
+    # Act
+    sketch = sketch_values(values, ["group"], relative_accuracy)
+    quantiles, counts = sketch_quantiles(sketch, ["group"], QUANTILES, relative_accuracy)
+
+    # Assert
+    assert counts["n"].tolist() == [5000, 5000, 5000]
+    for group, estimates in quantiles.groupby("group"):
+        exact = np.quantile(
+            values.loc[values["group"] == group, "value"], QUANTILES, method="lower")
+        error = np.abs(estimates["value"].to_numpy() - exact)
+        assert np.all(error <= relative_accuracy * np.abs(exact) + MIN_VALUE)
+
+
+def test_merge_sketches():
+    # Arrange
+    values = get_values(1000)
+    shuffled = values.sample(frac=1, random_state=0)
+    parts = [shuffled.iloc[rows] for rows in np.array_split(np.arange(len(shuffled)), 3)]
+
+    # Act
+    merged = merge_sketches([sketch_values(part, ["group"]) for part in parts], ["group"])
+
+    # Assert
+    pd.testing.assert_frame_equal(merged, sketch_values(values, ["group"]))
+
+
+def test_sketch_values_zero_and_missing():
+    # Arrange
+    values = pd.DataFrame({"group": "a", "value": [0.0, -1.0, np.nan, 1.0]})
+
+    # Act
+    sketch = sketch_values(values, ["group"])
+    quantiles, counts = sketch_quantiles(sketch, ["group"], np.array([0.0, 0.5, 1.0]))
+
+    # Assert
+    assert counts["n"].tolist() == [3]
+    assert np.allclose(quantiles["value"], [-1, 0, 1], rtol=0.01)
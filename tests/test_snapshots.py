@@ -0,0 +1,64 @@
+import pytest
+from handprofil import snapshots
+from handprofil.app import (
+    compute_binned_values,
+    get_plot_input_data,
+    create_plots,
+    restore_snapshot,
+)
+
+
+@pytest.fixture
+def snapshot_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIRECTORY", str(tmp_path))
+    return tmp_path
+
+
+def return_state():
+    return {
+        "upload": [{"filename": "a.xlsx", "info": {}, "data": {"id": {"0": 1}}}],
+        "sex": "w",
+        "instrument": "violine",
+        "background_hand": False,
+        "norms": "standard",
+        "score_mode": "decile",
+        "render_mode": "batched",
+        "hands": [["right"]],
+        "deciles": [{"id": {"0": 1}, "hand": {"0": "right"}, "value": {"0": 7}}],
+        "plots": [{"id": {"0": 1}, "hand": {"0": "right"}, "value": {"0": 7}}],
+        "figures": [{"type": "Div", "namespace": "dash_html_components", "props": {}}],
+    }
+
+
+def test_store_and_load_snapshot(snapshot_directory):
+    # Act
+    snapshot_id = snapshots.store_snapshot(return_state())
+    same_id = snapshots.store_snapshot(return_state())
+
+    # Assert
+    assert snapshot_id == same_id
+    assert len(list(snapshot_directory.iterdir())) == 1
+    assert snapshots.load_snapshot(snapshot_id) == return_state()
+    assert snapshots.load_snapshot("0" * 64) is None
+    assert snapshots.load_snapshot("../secret") is None
+
+
+def test_restore_snapshot_without_recompute(snapshot_directory):
+    # Arrange
+    state = return_state()
+    snapshot_id = snapshots.store_snapshot(state)
+
+    # Act
+    snapshot, sex, instrument, background_hand, render_mode, norms, score_mode = restore_snapshot(
+        f"?snapshot={snapshot_id}")
+    # Without static data, recomputing would fail
+    deciles = compute_binned_values(
+        state["upload"], sex, instrument, background_hand, norms, snapshot, score_mode)
+    plots = get_plot_input_data(deciles, None, snapshot)
+    figures = create_plots(plots, None, render_mode, [], snapshot)
+
+    # Assert
+    assert (sex, instrument, background_hand, render_mode) == ("w", "violine", False, "batched")
+    assert deciles == state["deciles"]
+    assert plots == state["plots"]
+    assert figures == state["figures"]
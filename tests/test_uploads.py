@@ -0,0 +1,78 @@
+import io
+import os
+import pytest
+import pandas as pd
+from handprofil.app import server, upload_tokens_to_store
+from handprofil.uploads import spool_stream, store_upload, take_upload
+
+
+def get_testfile_path(relative_path):
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory_path, relative_path)
+
+
+def read_testfile():
+    with open(get_testfile_path("data/measurement_template_filled.xlsx"), "rb") as file:
+        return file.read()
+
+
+def test_spool_stream():
+    data = os.urandom(3 * 1024 * 1024)
+
+    spool = spool_stream(io.BytesIO(data))
+
+    assert spool.read() == data
+    with pytest.raises(ValueError):
+        spool_stream(io.BytesIO(data), max_size=1024)
+
+
+def test_store_and_take_upload():
+    token = store_upload({"filename": "a.xlsx", "date": pd.Timestamp("2024-02-12")})
+
+    assert take_upload(token) == {
+        "filename": "a.xlsx", "date": "2024-02-12T00:00:00"}
+    # Tokens can only be used once
+    assert take_upload(token) is None
+    assert take_upload("../../etc/passwd") is None
+
+
+def test_upload_route_raw_body():
+    # Act
+    response = server.test_client().post(
+        "/api/upload",
+        data=read_testfile(),
+        headers={"X-Filename": "measurement%20template.xlsx"},
+        content_type="application/octet-stream"
+    )
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json["errors"] == []
+    data, errors = upload_tokens_to_store(response.json, None)
+    assert errors == []
+    assert data[0]["filename"] == "measurement template.xlsx"
+    assert data[0]["info"]["value"]["0"] == "TM24"
+    assert data[0]["data"]["left"]["0"] == 194.0
+
+
+def test_upload_route_multipart():
+    # Act
+    response = server.test_client().post(
+        "/api/upload",
+        data={
+            "file": [
+                (io.BytesIO(read_testfile()), "first.xlsx"),
+                (io.BytesIO(b"no workbook"), "second.xlsx"),
+                (io.BytesIO(b"a,b"), "third.csv"),
+            ]
+        },
+        content_type="multipart/form-data"
+    )
+
+    # Assert
+    assert len(response.json["tokens"]) == 1
+    assert len(response.json["errors"]) == 2
+
+    data, errors = upload_tokens_to_store(response.json, [{"filename": "old"}])
+    assert [item["filename"] for item in data] == ["old", "first.xlsx"]
+    assert len(errors) == 2